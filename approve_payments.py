@@ -0,0 +1,10 @@
+import sys
+from utils.bootstrap import script_session
+from utils.payment_approval import APPROVAL_BATCH_SIZE, drain_pending_payments
+
+# Uso: python approve_payments.py [tamaño_de_lote]
+# Se pueden correr varios a la vez: cada uno reclama pagos distintos (SKIP LOCKED)
+with script_session() as db:
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else APPROVAL_BATCH_SIZE
+    totals = drain_pending_payments(db, batch_size=batch_size)
+    print(f"✅ Pagos aprobados: {totals['approved']}")
@@ -0,0 +1,9 @@
+import sys
+from utils.bootstrap import script_session
+from utils.archive import ARCHIVE_AFTER_MONTHS, archive_closed_loans
+
+# Uso: python archive_loans.py [meses]
+with script_session() as db:
+    months = int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_AFTER_MONTHS
+    archived = archive_closed_loans(db, months=months)
+    print(f"✅ Préstamos archivados: {archived}")
@@ -0,0 +1,85 @@
+"""
+Benchmark del cálculo de cronogramas y de la aplicación de pagos en
+centavos enteros, antes y después. La equivalencia de montos con el
+cálculo histórico se verifica en tests/test_money.py.
+
+Uso: python -m benchmarks.bench_money
+"""
+import os
+import time
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from tests.reference_schedule import reference_payment_schedule
+from utils.amortization import calculate_payment_schedule
+from utils.money import from_cents, to_cents
+
+
+def decimal_allocation(amount, schedules):
+    # Copia de la lógica previa de routes/payments.py
+    remaining_amount = Decimal(str(amount))
+    results = []
+    for schedule in schedules:
+        if remaining_amount <= 0:
+            break
+        outstanding = Decimal(str(schedule['total_amount'])) - Decimal(str(schedule['paid_amount'] or 0))
+        payment_to_apply = min(remaining_amount, outstanding)
+        paid = Decimal(str(schedule['paid_amount'] or 0)) + payment_to_apply
+        status = 'paid' if paid >= Decimal(str(schedule['total_amount'])) - Decimal('0.01') else 'partial'
+        results.append((paid, status))
+        remaining_amount -= payment_to_apply
+    return results
+
+
+def cents_allocation(amount, schedules):
+    # Misma lógica con centavos enteros (como en routes/payments.py)
+    remaining_cents = to_cents(amount)
+    results = []
+    for schedule in schedules:
+        if remaining_cents <= 0:
+            break
+        total_cents = to_cents(schedule['total_amount'])
+        paid_cents = to_cents(schedule['paid_amount'])
+        to_apply = min(remaining_cents, total_cents - paid_cents)
+        paid_cents += to_apply
+        status = 'paid' if paid_cents >= total_cents - 1 else 'partial'
+        results.append((from_cents(paid_cents), status))
+        remaining_cents -= to_apply
+    return results
+
+
+def timed(label: str, fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed / repeat * 1e6:9.1f} µs/op")
+    return elapsed
+
+
+def main():
+    loan = SimpleNamespace(
+        principal_amount=Decimal("25000.00"), interest_rate=Decimal("18.75"),
+        term_months=60, first_payment_date=date(2026, 1, 31),
+    )
+    assert calculate_payment_schedule(loan) == reference_payment_schedule(loan)
+    before = timed("Cronograma 60 cuotas (histórico)", lambda: reference_payment_schedule(loan), 2000)
+    after = timed("Cronograma 60 cuotas (actual)", lambda: calculate_payment_schedule(loan), 2000)
+    print(f"  aceleración x{before / after:.2f}")
+
+    schedules = [
+        {"total_amount": item["total_amount"], "paid_amount": Decimal("0.00")}
+        for item in calculate_payment_schedule(loan)
+    ]
+    amount = Decimal("12345.67")
+    assert decimal_allocation(amount, schedules) == cents_allocation(amount, schedules)
+    before = timed("Aplicación de pago (Decimal)", lambda: decimal_allocation(amount, schedules), 5000)
+    after = timed("Aplicación de pago (centavos)", lambda: cents_allocation(amount, schedules), 5000)
+    print(f"  aceleración x{before / after:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark de serialización para listas grandes de préstamos.
+
+Compara la ruta original (ORM -> modelo Pydantic -> jsonable_encoder -> json)
+con la ruta rápida (tuplas de columnas -> TypeAdapter.dump_json -> bytes).
+
+Uso: python -m benchmarks.bench_serialization [n_loans] [term_months]
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from typing import List
+
+from config.database import Base, SessionLocal, engine
+from models.models import Customer, Loan, PaymentSchedule
+from schemas.schemas import LoanResponse, LoanWithSchedule
+from utils.fast_json import (
+    LOAN_ROW_COLUMNS, LOAN_WITH_SCHEDULE_COLUMNS, load_schedule_rows, loan_rows_adapter,
+    loan_with_schedule_rows_adapter, rows_to_dicts
+)
+
+
+def seed(db, n_loans: int, term_months: int):
+    Base.metadata.create_all(bind=engine)
+    customer = Customer(id=uuid.uuid4(), dni="00000001", full_name="Bench", email="bench@example.com")
+    db.add(customer)
+    now = datetime.utcnow()
+    loans, schedules = [], []
+    for i in range(n_loans):
+        loan_id = uuid.uuid4()
+        loans.append(dict(
+            id=loan_id, customer_id=customer.id, loan_number=f"PR-BENCH-{i:06d}",
+            principal_amount=Decimal("10000.00"), interest_rate=Decimal("18.50"), interest_type="fixed",
+            term_months=term_months, amortization_method="fixed_capital", late_interest_rate=Decimal("0.00"),
+            late_fee_amount=Decimal("0.00"), disbursement_date=date(2026, 1, 1), first_payment_date=date(2026, 2, 1),
+            maturity_date=date(2027, 1, 1), status="active", total_amount=Decimal("11000.00"),
+            total_interest=Decimal("1000.00"), paid_amount=Decimal("0.00"), outstanding_balance=Decimal("11000.00"),
+            dti_ratio=Decimal("12.34"), version=1, created_at=now, updated_at=now,
+        ))
+        for n in range(1, term_months + 1):
+            schedules.append(dict(
+                id=uuid.uuid4(), loan_id=loan_id, installment_number=n, due_date=date(2026, 2, 1),
+                principal_amount=Decimal("833.33"), interest_amount=Decimal("154.17"), total_amount=Decimal("987.50"),
+                remaining_balance=Decimal("9166.67"), status="pending",
+            ))
+    db.bulk_insert_mappings(Loan, loans)
+    db.bulk_insert_mappings(PaymentSchedule, schedules)
+    db.commit()
+
+
+def measure(label: str, fn, repeat: int = 5):
+    fn()  # calentamiento
+    tracemalloc.start()
+    body = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<38} {elapsed * 1000:9.1f} ms  {1 / elapsed:8.1f} resp/s  pico {peak / 1024 / 1024:7.1f} MiB  {len(body) / 1024:8.1f} KiB")
+    return body
+
+
+def main():
+    n_loans = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    term_months = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+
+    db = SessionLocal()
+    seed(db, n_loans, term_months)
+
+    def loans_before():
+        db.expunge_all()
+        loans = db.query(Loan).all()
+        models = TypeAdapter(List[LoanResponse]).validate_python(loans, from_attributes=True)
+        return json.dumps(jsonable_encoder(models)).encode()
+
+    def loans_after():
+        rows = db.query(*LOAN_ROW_COLUMNS).all()
+        return loan_rows_adapter.dump_json(rows_to_dicts(rows))
+
+    def schedule_before():
+        db.expunge_all()
+        loans = db.query(Loan).all()
+        models = TypeAdapter(List[LoanWithSchedule]).validate_python(loans, from_attributes=True)
+        return json.dumps(jsonable_encoder(models)).encode()
+
+    def schedule_after():
+        loans = rows_to_dicts(db.query(*LOAN_WITH_SCHEDULE_COLUMNS).all())
+        schedules = load_schedule_rows(db, [loan["id"] for loan in loans])
+        for loan in loans:
+            loan["payment_schedule"] = schedules[loan["id"]]
+        return loan_with_schedule_rows_adapter.dump_json(loans)
+
+    print(f"{n_loans} préstamos, {term_months} cuotas c/u")
+    before = measure("List[LoanResponse] original", loans_before)
+    after = measure("List[LoanResponse] rápido", loans_after)
+    assert json.loads(before) == json.loads(after), "Las salidas no coinciden"
+    measure("List[LoanWithSchedule] original", schedule_before)
+    measure("List[LoanWithSchedule] rápido", schedule_after)
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 import os
 from dotenv import load_dotenv
 from typing import Generator
+from utils.db_policy import apply_policy, install_db_policies
 
 load_dotenv()
 
@@ -14,27 +17,81 @@ if not DATABASE_URL:
 
 print("✅ DATABASE_URL configurada:", DATABASE_URL)
 
+def pool_sizes(max_connections: int, workers: int, listen_connections: int = 0, background_connections: int = 0):
+    """
+    Reparte el presupuesto global de conexiones (DB_MAX_CONNECTIONS) entre los
+    workers: cada uno recibe pool_size fijas y el resto como overflow.
+    Las conexiones que cada worker abre fuera del pool (listen_connections)
+    se descuentan de su parte; las de sus tareas de fondo salen del propio
+    pool, que debe alcanzar para ellas y al menos una petición.
+    """
+    per_worker = max_connections // max(1, workers) - listen_connections
+    minimum = background_connections + 1
+    if per_worker < minimum:
+        raise ValueError(
+            f"❌ ERROR: DB_MAX_CONNECTIONS={max_connections} no alcanza para {workers} workers: "
+            f"cada uno necesita al menos {minimum + listen_connections} conexiones "
+            f"(subir DB_MAX_CONNECTIONS o bajar WEB_CONCURRENCY)"
+        )
+    pool_size = max(1, per_worker * 2 // 3)
+    return pool_size, per_worker - pool_size
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", 30))
+# Tareas del planificador que un worker corre a la vez (cada una usa una conexión)
+SCHEDULER_CONNECTIONS = int(os.getenv("DB_SCHEDULER_CONNECTIONS", 1))
+# Por worker, además de las peticiones: fuera del pool la conexión asyncpg de
+# LISTEN (EVENTS_BROKER=postgres); dentro del pool el escritor de auditoría,
+# la reserva de bloques de números de préstamo y el planificador si está activo
+LISTEN_CONNECTIONS = 1 if os.getenv("EVENTS_BROKER", "memory") == "postgres" else 0
+BACKGROUND_CONNECTIONS = 2 + (SCHEDULER_CONNECTIONS if os.getenv("SCHEDULER_ENABLED", "false").lower() == "true" else 0)
+POOL_SIZE, MAX_OVERFLOW = pool_sizes(DB_MAX_CONNECTIONS, WEB_CONCURRENCY, LISTEN_CONNECTIONS, BACKGROUND_CONNECTIONS)
+
 # Crear engine según el tipo de base de datos
 if DATABASE_URL.startswith("sqlite"):
+    # En memoria (sqlite:// o :memory:): una sola conexión compartida por todos
+    # los hilos; si no, cada hilo del threadpool vería una base vacía distinta
+    in_memory = DATABASE_URL in ("sqlite://", "sqlite:///:memory:")
     engine = create_engine(
         DATABASE_URL, 
         pool_pre_ping=True, 
-        connect_args={"check_same_thread": False}
+        # Escrituras con BEGIN IMMEDIATE: con varios hilos escribiendo (auditoría,
+        # planificador) esperan el bloqueo en lugar de fallar con "database is locked"
+        connect_args={"check_same_thread": False, "timeout": 30, "isolation_level": "IMMEDIATE"},
+        **({"poolclass": StaticPool} if in_memory else {})
     )
+
+    @event.listens_for(engine, "savepoint")
+    def _sqlite_savepoint(conn, name):
+        # Un SAVEPOINT fuera de transacción abriría una diferida que luego no puede escribir
+        dbapi_connection = conn.connection.dbapi_connection
+        if not dbapi_connection.in_transaction:
+            dbapi_connection.execute("BEGIN IMMEDIATE")
 else:
     # Para PostgreSQL (Supabase)
     engine = create_engine(
         DATABASE_URL, 
         pool_pre_ping=True,
-        pool_size=10,
-        max_overflow=20
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", 30)),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 1800))
     )
 
+# Tras un fork (workers de gunicorn con preload) el hijo no debe reutilizar
+# las conexiones del padre: se descarta el pool sin cerrarlas y se crea uno nuevo
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def get_db() -> Generator:
+# statement_timeout, modo de la transacción y presupuesto de consultas por ruta
+install_db_policies(engine, SessionLocal)
+
+def get_db(request: Request = None) -> Generator:
     db = SessionLocal()
+    apply_policy(db, request)
     try:
         yield db
     finally:
@@ -0,0 +1,50 @@
+# Configuración de producción:
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# Recarga sin cortar tráfico: kill -HUP <pid master> (reinicia los workers
+# de forma gradual). Para cambiar de versión de código con preload_app usar
+# kill -USR2 <pid master> y luego -TERM al master anterior.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Workers según CPUs, acotado para no agotar conexiones de Postgres.
+# Usar WEB_CONCURRENCY (no -w) para que el tamaño de los pools coincida
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+
+# config/database.py reparte DB_MAX_CONNECTIONS entre este número de workers
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+preload_app = True
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Reciclar workers periódicamente para acotar fugas de memoria
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info")
+
+
+def when_ready(server):
+    from config.database import BACKGROUND_CONNECTIONS, LISTEN_CONNECTIONS, POOL_SIZE, MAX_OVERFLOW
+
+    server.log.info(
+        f"Workers: {server.cfg.workers} - pool por worker: {POOL_SIZE} + {MAX_OVERFLOW} overflow "
+        f"({BACKGROUND_CONNECTIONS} para tareas de fondo) + {LISTEN_CONNECTIONS} LISTEN "
+        f"(presupuesto {os.environ.get('DB_MAX_CONNECTIONS', 30)} conexiones)"
+    )
+
+
+def post_fork(server, worker):
+    # Refuerza el os.register_at_fork de config/database.py: el worker nunca
+    # debe usar conexiones abiertas por el master durante el preload
+    from config.database import engine
+
+    engine.dispose(close=False)
+    server.log.info(f"Worker {worker.pid}: pool de conexiones reiniciado")
@@ -1,7 +1,16 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import OperationalError
 from fastapi.middleware.cors import CORSMiddleware
 import os
 import uvicorn
+from utils.audit import audit_writer, install_audit_hooks, set_request_context
+from utils.events import event_broker, event_hub
+from utils.scheduler import SCHEDULER_ENABLED, scheduler
+from utils.profiling import install_profiling
+from config.database import engine, init_db
+from utils.db_policy import QueryBudgetExceeded, is_statement_timeout
 
 # --- Lista Explícita de Orígenes Permitidos (CORS) ---
 ORIGINS = [
@@ -13,10 +22,28 @@ ORIGINS = [
     "https://prestamos-api-6a81.onrender.com",
 ]
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if engine.dialect.name == "sqlite":
+        # Desarrollo local y pruebas: en Postgres el esquema se administra con
+        # las migraciones (alembic upgrade head)
+        init_db()
+    install_audit_hooks()
+    audit_writer.start()
+    await event_broker.start(event_hub)
+    if SCHEDULER_ENABLED:
+        await scheduler.start()
+    yield
+    await scheduler.stop()
+    await event_broker.stop()
+    # Vaciar la cola de auditoría antes de apagar
+    audit_writer.stop()
+
 app = FastAPI(
     title="Sistema de Préstamos API",
     description="API REST para gestión de préstamos",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -27,6 +54,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def audit_context_middleware(request: Request, call_next):
+    set_request_context(
+        ip_address=request.client.host if request.client else None,
+        user_agent=request.headers.get("user-agent")
+    )
+    return await call_next(request)
+
+@app.exception_handler(QueryBudgetExceeded)
+async def query_budget_handler(request: Request, exc: QueryBudgetExceeded):
+    return JSONResponse(status_code=503, content={"detail": f"Presupuesto de consultas excedido: {exc}"})
+
+@app.exception_handler(OperationalError)
+async def statement_timeout_handler(request: Request, exc: OperationalError):
+    if is_statement_timeout(exc):
+        return JSONResponse(status_code=503, content={"detail": "La consulta excedió el tiempo límite"})
+    raise exc
+
 @app.get("/")
 def root():
     return {"message": "API Sistema de Préstamos", "version": "1.0.0"}
@@ -35,7 +80,7 @@ def root():
 def health_check():
     return {"status": "ok"}
 
-from routes import auth, customers, loans, payments, customer_portal
+from routes import auth, customers, loans, payments, customer_portal, events, jobs, analytics, profiles, quotes
 
 # CORRECCIÓN: Eliminar el prefix="/api" de payments
 # porque el router ya tiene prefix="/payments" en payments.py
@@ -44,6 +89,14 @@ app.include_router(customers.router)
 app.include_router(loans.router)
 app.include_router(payments.router)  # ← AQUÍ ESTÁ EL CAMBIO
 app.include_router(customer_portal.router)
+app.include_router(events.router)
+app.include_router(jobs.router)
+app.include_router(analytics.router)
+app.include_router(profiles.router)
+app.include_router(quotes.router)
+
+# Perfilado bajo demanda (PROFILING_ENABLED); se instala después de registrar las rutas
+install_profiling(app, engine)
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
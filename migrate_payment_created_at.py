@@ -0,0 +1,12 @@
+from config.database import SessionLocal
+from utils.pagination import fill_missing_created_at
+
+# Uso: python migrate_payment_created_at.py
+# Completa payments.created_at vacío (clave de la paginación por cursor) y lo deja NOT NULL
+db = SessionLocal()
+
+try:
+    updated = fill_missing_created_at(db)
+    print(f"✅ Pagos sin created_at completados: {updated}")
+finally:
+    db.close()
@@ -0,0 +1,24 @@
+"""Esquema inicial
+
+Las bases existentes se crearon con init_db (create_all) antes de usar
+migraciones: esta revisión no cambia nada, marca ese punto de partida.
+Una base vacía se crea con init_db() y luego `alembic stamp head`.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-19
+
+"""
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    pass
+
+
+def downgrade():
+    pass
@@ -0,0 +1,239 @@
+"""Libro mayor, trabajos programados, archivo y resumen de préstamos
+
+Columnas nuevas de loans (modo de cronograma y resumen), tablas nuevas
+(contadores de número de préstamo, historial de cronogramas, libro mayor,
+fotos de saldo, archivo, bloqueos y ejecuciones del planificador) e índices
+de las consultas por lotes.
+
+Cada paso se salta si ya está aplicado: en SQLite las tablas nuevas las
+crea init_db y algunas columnas pudieron agregarse con
+`rebuild_loan_summaries.py --migrate`. Después de aplicarla:
+
+    python rebuild_loan_summaries.py         (resumen de cada préstamo)
+    python snapshot_ledger.py --backfill     (apertura del libro mayor)
+
+Revision ID: 0002_ledger_jobs_and_summaries
+Revises: 0001_baseline
+Create Date: 2026-10-19
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+from models.types import GUID
+
+revision = "0002_ledger_jobs_and_summaries"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+LOAN_COLUMNS = (
+    ("schedule_mode", sa.String(20), "stored"),
+    ("next_due_date", sa.Date(), None),
+    ("next_due_amount", sa.Numeric(12, 2), None),
+    ("overdue_count", sa.Integer(), "0"),
+    ("overdue_amount", sa.Numeric(12, 2), "0"),
+    ("last_payment_date", sa.Date(), None),
+)
+
+SNAPSHOT_DUE_COLUMNS = ("principal_due", "total_due")
+
+# Índices sobre tablas existentes (pueden ser grandes)
+INDEXES = (
+    ("ix_schedule_status_due", "payment_schedule", ["status", "due_date"]),
+    ("ix_payments_status_created", "payments", ["status", "created_at", "id"]),
+    ("ix_payments_loan_created", "payments", ["loan_id", "created_at", "id"]),
+    ("ix_notifications_schedule_type", "notifications", ["schedule_id", "type"]),
+    ("ix_notifications_status_created", "notifications", ["status", "created_at"]),
+)
+
+
+# Sin conexión (alembic upgrade head --sql) no se puede mirar la base: se
+# genera el SQL completo, como para una base sin ninguno de estos cambios
+def _has_table(name: str) -> bool:
+    return not context.is_offline_mode() and sa.inspect(op.get_bind()).has_table(name)
+
+
+def _columns(table: str) -> set:
+    if context.is_offline_mode():
+        return set()
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _indexes(table: str) -> set:
+    if context.is_offline_mode():
+        return set()
+    return {index["name"] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def _money(name: str, **kwargs):
+    return sa.Column(name, sa.Numeric(12, 2), server_default="0", **kwargs)
+
+
+def _create_tables():
+    if not _has_table("loan_number_counters"):
+        op.create_table(
+            "loan_number_counters",
+            sa.Column("year", sa.Integer(), primary_key=True, autoincrement=False),
+            sa.Column("next_value", sa.Integer(), nullable=False, server_default="1"),
+            sa.Column("updated_at", sa.DateTime()),
+        )
+
+    if not _has_table("payment_schedule_history"):
+        op.create_table(
+            "payment_schedule_history",
+            sa.Column("id", GUID(), primary_key=True),
+            sa.Column("schedule_id", GUID(), nullable=False),
+            sa.Column("loan_id", GUID(), sa.ForeignKey("loans.id"), nullable=False),
+            sa.Column("installment_number", sa.Integer(), nullable=False),
+            sa.Column("due_date", sa.Date(), nullable=False),
+            sa.Column("principal_amount", sa.Numeric(12, 2), nullable=False),
+            sa.Column("interest_amount", sa.Numeric(12, 2), nullable=False),
+            sa.Column("total_amount", sa.Numeric(12, 2), nullable=False),
+            sa.Column("remaining_balance", sa.Numeric(12, 2), nullable=False),
+            _money("paid_amount"),
+            _money("paid_principal"),
+            _money("paid_interest"),
+            sa.Column("late_fee", sa.Numeric(10, 2), server_default="0"),
+            sa.Column("late_interest", sa.Numeric(10, 2), server_default="0"),
+            sa.Column("status", sa.String(50)),
+            sa.Column("schedule_version", sa.Integer(), nullable=False),
+            sa.Column("superseded_by_version", sa.Integer(), nullable=False),
+            sa.Column("superseded_at", sa.DateTime()),
+        )
+        op.create_index("ix_schedule_history_loan_version", "payment_schedule_history", ["loan_id", "schedule_version"])
+
+    if not _has_table("loan_ledger_entries"):
+        op.create_table(
+            "loan_ledger_entries",
+            sa.Column("id", GUID(), primary_key=True),
+            sa.Column("loan_id", GUID(), sa.ForeignKey("loans.id"), nullable=False),
+            sa.Column("payment_id", GUID(), sa.ForeignKey("payments.id")),
+            sa.Column("schedule_id", GUID()),
+            sa.Column("installment_number", sa.Integer()),
+            sa.Column("entry_type", sa.String(50), nullable=False),
+            sa.Column("effective_date", sa.Date(), nullable=False),
+            _money("principal"),
+            _money("interest"),
+            _money("late_fee"),
+            _money("late_interest"),
+            _money("unapplied"),
+            sa.Column("amount", sa.Numeric(12, 2), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        )
+        op.create_index("ix_ledger_loan_effective", "loan_ledger_entries", ["loan_id", "effective_date"])
+
+    if not _has_table("loan_balance_snapshots"):
+        op.create_table(
+            "loan_balance_snapshots",
+            sa.Column("id", GUID(), primary_key=True),
+            sa.Column("loan_id", GUID(), sa.ForeignKey("loans.id"), nullable=False),
+            sa.Column("as_of_date", sa.Date(), nullable=False),
+            _money("principal_paid"),
+            _money("interest_paid"),
+            _money("late_fee_paid"),
+            _money("late_interest_paid"),
+            _money("unapplied"),
+            _money("total_paid"),
+            _money("principal_due"),
+            _money("total_due"),
+            sa.Column("entry_count", sa.Integer(), server_default="0"),
+            sa.Column("settled_before", sa.DateTime(), nullable=False),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ux_snapshots_loan_as_of", "loan_balance_snapshots", ["loan_id", "as_of_date"], unique=True)
+    else:
+        # Fotos tomadas antes de guardar lo adeudado: se completan al volver a tomarlas
+        missing = [name for name in SNAPSHOT_DUE_COLUMNS if name not in _columns("loan_balance_snapshots")]
+        with op.batch_alter_table("loan_balance_snapshots") as batch:
+            for name in missing:
+                batch.add_column(_money(name))
+
+    if not _has_table("loan_archives"):
+        op.create_table(
+            "loan_archives",
+            sa.Column("loan_id", GUID(), primary_key=True),
+            sa.Column("customer_id", GUID(), sa.ForeignKey("customers.id"), nullable=False),
+            sa.Column("loan_number", sa.String(50)),
+            sa.Column("closed_on", sa.Date()),
+            sa.Column("format", sa.String(50), server_default="ndjson+gzip"),
+            sa.Column("payload", sa.LargeBinary(), nullable=False),
+            sa.Column("checksum", sa.String(64), nullable=False),
+            sa.Column("row_count", sa.Integer(), nullable=False),
+            sa.Column("archived_at", sa.DateTime()),
+        )
+
+    if not _has_table("scheduler_locks"):
+        op.create_table(
+            "scheduler_locks",
+            sa.Column("job_name", sa.String(100), primary_key=True),
+            sa.Column("owner", sa.String(255)),
+            sa.Column("locked_until", sa.DateTime()),
+            sa.Column("next_run_at", sa.DateTime(), nullable=False),
+            sa.Column("updated_at", sa.DateTime()),
+        )
+
+    if not _has_table("job_runs"):
+        op.create_table(
+            "job_runs",
+            sa.Column("id", GUID(), primary_key=True),
+            sa.Column("job_name", sa.String(100), nullable=False),
+            sa.Column("owner", sa.String(255)),
+            sa.Column("status", sa.String(50), server_default="running"),
+            sa.Column("started_at", sa.DateTime(), nullable=False),
+            sa.Column("finished_at", sa.DateTime()),
+            sa.Column("duration_ms", sa.Integer()),
+            sa.Column("result", sa.Text()),
+            sa.Column("error", sa.Text()),
+        )
+        op.create_index("ix_job_runs_job_started", "job_runs", ["job_name", "started_at"])
+
+
+def upgrade():
+    existing = _columns("loans")
+    with op.batch_alter_table("loans") as batch:
+        for name, type_, default in LOAN_COLUMNS:
+            if name not in existing:
+                batch.add_column(sa.Column(name, type_, server_default=default))
+
+    # Clave de la paginación por cursor: sin vacíos y, en Postgres, NOT NULL
+    postgres = op.get_context().dialect.name == "postgresql"
+    midnight = "payment_date" if postgres else "payment_date || ' 00:00:00.000000'"
+    op.execute(f"UPDATE payments SET created_at = {midnight} WHERE created_at IS NULL")
+    if postgres:
+        op.alter_column("payments", "created_at", existing_type=sa.DateTime(), nullable=False)
+
+    _create_tables()
+
+    # En Postgres los índices de tablas grandes se crean sin bloquear
+    # escrituras (CONCURRENTLY no puede ir dentro de una transacción)
+    missing = [(name, table, columns) for name, table, columns in INDEXES if name not in _indexes(table)]
+    if postgres:
+        with op.get_context().autocommit_block():
+            for name, table, columns in missing:
+                op.create_index(name, table, columns, postgresql_concurrently=True)
+    else:
+        for name, table, columns in missing:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        if name in _indexes(table):
+            op.drop_index(name, table_name=table)
+
+    for table in (
+        "job_runs", "scheduler_locks", "loan_archives", "loan_balance_snapshots",
+        "loan_ledger_entries", "payment_schedule_history", "loan_number_counters",
+    ):
+        if _has_table(table):
+            op.drop_table(table)
+
+    if op.get_context().dialect.name == "postgresql":
+        op.alter_column("payments", "created_at", existing_type=sa.DateTime(), nullable=True)
+
+    existing = _columns("loans")
+    with op.batch_alter_table("loans") as batch:
+        for name, _, _ in reversed(LOAN_COLUMNS):
+            if name in existing:
+                batch.drop_column(name)
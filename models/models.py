@@ -1,6 +1,7 @@
-from sqlalchemy import Column, String, Integer, Numeric, Boolean, Date, DateTime, Text, ForeignKey, CheckConstraint
-from sqlalchemy.dialects.postgresql import UUID, INET, JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Integer, Numeric, Boolean, Date, DateTime, Text, LargeBinary, ForeignKey, CheckConstraint, Index
+from sqlalchemy import case, func, select, type_coerce
+from models.types import GUID, IPAddress, JSONDocument
+from sqlalchemy.orm import column_property, relationship
 from config.database import Base
 import uuid
 from datetime import datetime
@@ -8,7 +9,7 @@ from datetime import datetime
 class User(Base):
     __tablename__ = "users"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     email = Column(String(255), unique=True, nullable=False)
     password_hash = Column(String(255), nullable=False)
     full_name = Column(String(255), nullable=False)
@@ -20,7 +21,7 @@ class User(Base):
 class Customer(Base):
     __tablename__ = "customers"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     dni = Column(String(20), unique=True, nullable=False)
     full_name = Column(String(255), nullable=False)
     phone = Column(String(20))
@@ -32,7 +33,7 @@ class Customer(Base):
     employer_name = Column(String(255))
     credit_score = Column(Integer)
     is_active = Column(Boolean, default=True)
-    created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    created_by = Column(GUID(), ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -41,8 +42,8 @@ class Customer(Base):
 class Loan(Base):
     __tablename__ = "loans"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    customer_id = Column(UUID(as_uuid=True), ForeignKey("customers.id"), nullable=False)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    customer_id = Column(GUID(), ForeignKey("customers.id"), nullable=False)
     loan_number = Column(String(50), unique=True)
     principal_amount = Column(Numeric(12, 2), nullable=False)
     interest_rate = Column(Numeric(5, 2), nullable=False)
@@ -57,12 +58,23 @@ class Loan(Base):
     status = Column(String(50), default='pending')
     total_amount = Column(Numeric(12, 2))
     total_interest = Column(Numeric(12, 2))
-    paid_amount = Column(Numeric(12, 2), default=0.00)
-    outstanding_balance = Column(Numeric(12, 2))
+    # Proyección anterior al libro mayor: los pagos ya no la actualizan. Solo
+    # la leen los préstamos sin movimientos (ver paid_amount/outstanding_balance
+    # al final del módulo) y backfill_opening_entries
+    legacy_paid_amount = Column("paid_amount", Numeric(12, 2), default=0.00)
+    legacy_outstanding_balance = Column("outstanding_balance", Numeric(12, 2))
     dti_ratio = Column(Numeric(5, 2))
+    # 'stored': cronograma completo en payment_schedule; 'virtual': solo cuotas modificadas
+    schedule_mode = Column(String(20), default='stored')
+    # Resumen desnormalizado del cronograma (ver utils/loan_summary.py)
+    next_due_date = Column(Date)
+    next_due_amount = Column(Numeric(12, 2))
+    overdue_count = Column(Integer, default=0)
+    overdue_amount = Column(Numeric(12, 2), default=0.00)
+    last_payment_date = Column(Date)
     version = Column(Integer, default=1)
     notes = Column(Text)
-    created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    created_by = Column(GUID(), ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -70,11 +82,18 @@ class Loan(Base):
     payment_schedule = relationship("PaymentSchedule", back_populates="loan", lazy="joined")
     payments = relationship("Payment", back_populates="loan")
 
+class LoanNumberCounter(Base):
+    __tablename__ = "loan_number_counters"
+    
+    year = Column(Integer, primary_key=True)
+    next_value = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class PaymentSchedule(Base):
     __tablename__ = "payment_schedule"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    loan_id = Column(UUID(as_uuid=True), ForeignKey("loans.id", ondelete="CASCADE"), nullable=False)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    loan_id = Column(GUID(), ForeignKey("loans.id", ondelete="CASCADE"), nullable=False)
     installment_number = Column(Integer, nullable=False)
     due_date = Column(Date, nullable=False)
     principal_amount = Column(Numeric(12, 2), nullable=False)
@@ -96,12 +115,43 @@ class PaymentSchedule(Base):
     
     loan = relationship("Loan", back_populates="payment_schedule")
 
+    __table_args__ = (
+        Index("ix_schedule_status_due", "status", "due_date"),
+    )
+
+class PaymentScheduleHistory(Base):
+    __tablename__ = "payment_schedule_history"
+
+    # Cuotas reemplazadas por una reprogramación, tal como estaban antes del cambio
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    schedule_id = Column(GUID(), nullable=False)
+    loan_id = Column(GUID(), ForeignKey("loans.id"), nullable=False)
+    installment_number = Column(Integer, nullable=False)
+    due_date = Column(Date, nullable=False)
+    principal_amount = Column(Numeric(12, 2), nullable=False)
+    interest_amount = Column(Numeric(12, 2), nullable=False)
+    total_amount = Column(Numeric(12, 2), nullable=False)
+    remaining_balance = Column(Numeric(12, 2), nullable=False)
+    paid_amount = Column(Numeric(12, 2), default=0.00)
+    paid_principal = Column(Numeric(12, 2), default=0.00)
+    paid_interest = Column(Numeric(12, 2), default=0.00)
+    late_fee = Column(Numeric(10, 2), default=0.00)
+    late_interest = Column(Numeric(10, 2), default=0.00)
+    status = Column(String(50))
+    schedule_version = Column(Integer, nullable=False)
+    superseded_by_version = Column(Integer, nullable=False)
+    superseded_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_schedule_history_loan_version", "loan_id", "schedule_version"),
+    )
+
 class Payment(Base):
     __tablename__ = "payments"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    loan_id = Column(UUID(as_uuid=True), ForeignKey("loans.id"), nullable=False)
-    schedule_id = Column(UUID(as_uuid=True), ForeignKey("payment_schedule.id"))
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    loan_id = Column(GUID(), ForeignKey("loans.id"), nullable=False)
+    schedule_id = Column(GUID(), ForeignKey("payment_schedule.id"))
     payment_date = Column(Date, nullable=False)
     amount = Column(Numeric(12, 2), nullable=False)
     principal_paid = Column(Numeric(12, 2), default=0.00)
@@ -112,18 +162,146 @@ class Payment(Base):
     reference_number = Column(String(100))
     notes = Column(Text)
     status = Column(String(50), default='pending')
-    created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"))
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_by = Column(GUID(), ForeignKey("users.id"))
+    # Parte de la clave de paginación (created_at, id): no puede ser NULL
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
     loan = relationship("Loan", back_populates="payments")
+    
+    __table_args__ = (
+        Index("ix_payments_status_created", "status", "created_at", "id"),
+        Index("ix_payments_loan_created", "loan_id", "created_at", "id"),
+    )
+
+class LedgerEntry(Base):
+    __tablename__ = "loan_ledger_entries"
+
+    # Libro mayor del préstamo: solo se insertan filas, nunca se actualizan
+    # Cargos (lo que el cliente debe); el resto de los movimientos son pagos
+    CHARGE_TYPES = ("disbursement", "capitalization")
+
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    loan_id = Column(GUID(), ForeignKey("loans.id"), nullable=False)
+    payment_id = Column(GUID(), ForeignKey("payments.id"))
+    schedule_id = Column(GUID())
+    installment_number = Column(Integer)
+    entry_type = Column(String(50), nullable=False)
+    effective_date = Column(Date, nullable=False)
+    principal = Column(Numeric(12, 2), default=0.00)
+    interest = Column(Numeric(12, 2), default=0.00)
+    late_fee = Column(Numeric(12, 2), default=0.00)
+    late_interest = Column(Numeric(12, 2), default=0.00)
+    unapplied = Column(Numeric(12, 2), default=0.00)
+    amount = Column(Numeric(12, 2), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_ledger_loan_effective", "loan_id", "effective_date"),
+    )
+
+class LoanBalanceSnapshot(Base):
+    __tablename__ = "loan_balance_snapshots"
+
+    # Totales acumulados del libro mayor hasta as_of_date (inclusive)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    loan_id = Column(GUID(), ForeignKey("loans.id"), nullable=False)
+    as_of_date = Column(Date, nullable=False)
+    principal_paid = Column(Numeric(12, 2), default=0.00)
+    interest_paid = Column(Numeric(12, 2), default=0.00)
+    late_fee_paid = Column(Numeric(12, 2), default=0.00)
+    late_interest_paid = Column(Numeric(12, 2), default=0.00)
+    unapplied = Column(Numeric(12, 2), default=0.00)
+    total_paid = Column(Numeric(12, 2), default=0.00)
+    principal_due = Column(Numeric(12, 2), default=0.00)
+    total_due = Column(Numeric(12, 2), default=0.00)
+    entry_count = Column(Integer, default=0)
+    # Solo incluye movimientos registrados antes de este instante
+    settled_before = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ux_snapshots_loan_as_of", "loan_id", "as_of_date", unique=True),
+    )
+
+def _cents(expression):
+    # Las sumas en SQLite son REAL: redondear para comparar saldos (p. ej. <= 0) sin residuos
+    return type_coerce(func.round(expression, 2), Numeric(12, 2))
+
+
+def _ledger_sum(column, charges: bool):
+    entry_filter = LedgerEntry.entry_type.in_(LedgerEntry.CHARGE_TYPES)
+    return (
+        select(func.sum(column))
+        .where(LedgerEntry.loan_id == Loan.id, entry_filter if charges else ~entry_filter)
+        .correlate_except(LedgerEntry)
+        .scalar_subquery()
+    )
+
+
+# Saldos vigentes del préstamo calculados desde el libro mayor (solo lectura;
+# registrar un pago solo inserta movimientos). Sin movimientos de pago se usa
+# la proyección anterior y, sin desembolso en el libro mayor, el total del
+# préstamo si ya estaba desembolsado (NULL si aún no).
+Loan.paid_amount = column_property(
+    _cents(func.coalesce(_ledger_sum(LedgerEntry.amount, False), Loan.legacy_paid_amount, 0)),
+    deferred=True, group="ledger_balance",
+)
+Loan.outstanding_balance = column_property(
+    _cents(func.coalesce(
+        _ledger_sum(LedgerEntry.amount, True),
+        case((Loan.legacy_outstanding_balance.isnot(None), Loan.total_amount)),
+    ) - func.coalesce(_ledger_sum(LedgerEntry.amount, False), Loan.legacy_paid_amount, 0)),
+    deferred=True, group="ledger_balance",
+)
+
+class LoanArchive(Base):
+    __tablename__ = "loan_archives"
+
+    # Préstamo cerrado con sus cuotas, pagos y movimientos en NDJSON comprimido (gzip)
+    loan_id = Column(GUID(), primary_key=True)
+    customer_id = Column(GUID(), ForeignKey("customers.id"), nullable=False)
+    loan_number = Column(String(50))
+    closed_on = Column(Date)
+    format = Column(String(50), default='ndjson+gzip')
+    payload = Column(LargeBinary, nullable=False)
+    checksum = Column(String(64), nullable=False)  # sha256 del NDJSON sin comprimir
+    row_count = Column(Integer, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+class SchedulerLock(Base):
+    __tablename__ = "scheduler_locks"
+
+    # Una fila por tarea periódica: quién la ejecuta y cuándo toca la siguiente
+    job_name = Column(String(100), primary_key=True)
+    owner = Column(String(255))
+    locked_until = Column(DateTime)
+    next_run_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class JobRun(Base):
+    __tablename__ = "job_runs"
+
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    job_name = Column(String(100), nullable=False)
+    owner = Column(String(255))
+    status = Column(String(50), default='running')
+    started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime)
+    duration_ms = Column(Integer)
+    result = Column(Text)
+    error = Column(Text)
+
+    __table_args__ = (
+        Index("ix_job_runs_job_started", "job_name", "started_at"),
+    )
 
 class Notification(Base):
     __tablename__ = "notifications"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    customer_id = Column(UUID(as_uuid=True), ForeignKey("customers.id"))
-    loan_id = Column(UUID(as_uuid=True), ForeignKey("loans.id"))
-    schedule_id = Column(UUID(as_uuid=True), ForeignKey("payment_schedule.id"))
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    customer_id = Column(GUID(), ForeignKey("customers.id"))
+    loan_id = Column(GUID(), ForeignKey("loans.id"))
+    schedule_id = Column(GUID(), ForeignKey("payment_schedule.id"))
     type = Column(String(50), nullable=False)
     title = Column(String(255), nullable=False)
     message = Column(Text, nullable=False)
@@ -132,17 +310,22 @@ class Notification(Base):
     sent_at = Column(DateTime)
     read_at = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_notifications_schedule_type", "schedule_id", "type"),
+        Index("ix_notifications_status_created", "status", "created_at"),
+    )
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    user_id = Column(GUID(), ForeignKey("users.id"))
     action = Column(String(100), nullable=False)
     entity_type = Column(String(100), nullable=False)
-    entity_id = Column(UUID(as_uuid=True), nullable=False)
-    old_data = Column(JSONB)
-    new_data = Column(JSONB)
-    ip_address = Column(INET)
+    entity_id = Column(GUID(), nullable=False)
+    old_data = Column(JSONDocument)
+    new_data = Column(JSONDocument)
+    ip_address = Column(IPAddress)
     user_agent = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
\ No newline at end of file
@@ -0,0 +1,54 @@
+import uuid
+
+from sqlalchemy import JSON, LargeBinary, String
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.types import TypeDecorator
+
+
+class GUID(TypeDecorator):
+    """
+    UUID portable: tipo nativo en Postgres; en los demás motores (SQLite)
+    16 bytes binarios en lugar de 32 caracteres hex. En Python siempre es
+    uuid.UUID; al comparar también acepta el texto del UUID.
+    """
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=True))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(str(value))
+        return value if dialect.name == "postgresql" else value.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        return uuid.UUID(bytes=bytes(value))
+
+    @property
+    def python_type(self):
+        return uuid.UUID
+
+
+class IPAddress(TypeDecorator):
+    """INET en Postgres; texto (hasta IPv6) en los demás motores."""
+    impl = String(45)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.INET())
+        return dialect.type_descriptor(String(45))
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else str(value)
+
+
+# JSONB en Postgres; JSON (texto) en los demás motores
+JSONDocument = JSON().with_variant(postgresql.JSONB(), "postgresql")
@@ -0,0 +1,21 @@
+import sys
+from utils.bootstrap import script_session
+from utils.loan_summary import add_summary_columns, check_loan_summaries, rebuild_loan_summaries
+
+# Uso: python rebuild_loan_summaries.py [--check | --migrate]
+# --migrate: agrega a loans las columnas del resumen que falten y luego reconstruye
+with script_session() as db:
+    if "--migrate" in sys.argv:
+        for statement in add_summary_columns(db):
+            print(f"✅ {statement}")
+    if "--check" in sys.argv:
+        mismatched = check_loan_summaries(db)
+        if mismatched:
+            print(f"❌ Préstamos con resumen inconsistente: {len(mismatched)}")
+            for loan_id in mismatched:
+                print(f"   {loan_id}")
+            sys.exit(1)
+        print("✅ Todos los resúmenes son consistentes")
+    else:
+        total = rebuild_loan_summaries(db)
+        print(f"✅ Resúmenes reconstruidos: {total} préstamos")
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from config.database import get_db
+from models.models import User
+from schemas.schemas import CashflowForecast
+from utils.security import get_current_user
+from utils.db_policy import db_policy
+from utils.cashflow import MONTH, WEEK, cashflow_forecast
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+@router.get("/cashflow", response_model=CashflowForecast)
+@db_policy(timeout_ms=30000)
+def get_cashflow(
+    granularity: str = Query(MONTH, description="Agrupar por 'week' o 'month'"),
+    months: int = Query(12, ge=1, le=36, description="Meses a proyectar"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Cobranza esperada por periodo, ajustada por la probabilidad de cobro de cada tramo de mora."""
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso denegado: Se requiere rol de administrador.")
+    if granularity not in (WEEK, MONTH):
+        raise HTTPException(status_code=400, detail="granularity debe ser 'week' o 'month'")
+    return cashflow_forecast(db, granularity, months)
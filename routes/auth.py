@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from uuid import UUID
 from config.database import get_db
 from models.models import User, Customer
-from schemas.schemas import Token, CustomerRegister
-from utils.security import verify_password, create_access_token, get_password_hash
+from schemas.schemas import Token, CustomerRegister, PasswordSetup
+from utils.security import verify_password, create_access_token, get_password_hash, verify_password_setup_token
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
@@ -153,4 +154,20 @@ def register_customer(customer_data: CustomerRegister, db: Session = Depends(get
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al crear cliente: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post("/customer/setup-password", response_model=Token)
+def setup_customer_password(data: PasswordSetup, db: Session = Depends(get_db)):
+    """Primera contraseña de un cliente importado; el token sirve una sola vez (mientras no tenga contraseña)."""
+    customer_id = verify_password_setup_token(data.token)
+    customer = db.query(Customer).filter(Customer.id == UUID(customer_id)).first() if customer_id else None
+    if not customer or customer.password_hash:
+        raise HTTPException(status_code=400, detail="Token inválido o ya utilizado")
+    if not customer.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Cliente inactivo")
+    
+    customer.password_hash = get_password_hash(data.password)
+    db.commit()
+    
+    access_token = create_access_token(data={"sub": customer.email, "role": "customer", "customer_id": str(customer.id)})
+    return {"access_token": access_token, "token_type": "bearer"}
@@ -1,30 +1,43 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 from dateutil.relativedelta import relativedelta
 from config.database import get_db
 from models.models import Loan, Customer
-from schemas.schemas import LoanResponse, LoanWithSchedule, LoanRequestCreate
+from schemas.schemas import LoanResponse, LoanWithSchedule, LoanRequestCreate, LoanWithScheduleRow
 from utils.security import get_current_customer
-from sqlalchemy.orm import joinedload
+from utils.events import publish_event, loan_event_data
+from utils.loan_numbers import loan_number_allocator
+from utils.quotes import quote
+from utils.virtual_schedule import loan_with_schedule, merge_schedule_rows
+from utils.fast_json import loan_with_schedule_rows_adapter, load_schedule_rows, rows_to_dicts, json_response
+from utils.fields import INCLUDE_PENDING_SCHEDULE, INCLUDE_SCHEDULE, parse_fields, parse_include, projected_columns
 
 router = APIRouter(prefix="/customer-portal", tags=["Customer Portal"])
 
 @router.get("/loans", response_model=List[LoanWithSchedule])
 def get_my_loans(
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
     db: Session = Depends(get_db),
     current_customer: Customer = Depends(get_current_customer)
 ):
-    loans = db.query(Loan).options(
-        joinedload(Loan.payment_schedule)
-    ).filter(Loan.customer_id == current_customer.id).all()
+    # Por compatibilidad el cronograma completo se incluye salvo ?include=none
+    field_names = parse_fields(fields, LoanWithScheduleRow)
+    include = parse_include(include, default=INCLUDE_SCHEDULE)
     
-    print(f"Loans found: {len(loans)}")  # DEBUG
-    if loans:
-        print(f"First loan schedules: {len(loans[0].payment_schedule)}")  # DEBUG
+    loans = rows_to_dicts(
+        db.query(*projected_columns(Loan, field_names)).filter(Loan.customer_id == current_customer.id).all()
+    )
+    if include:
+        pending_only = include == INCLUDE_PENDING_SCHEDULE
+        loan_ids = [loan["id"] for loan in loans]
+        schedules = merge_schedule_rows(db, loans, load_schedule_rows(db, loan_ids, pending_only), pending_only)
+        for loan in loans:
+            loan["payment_schedule"] = schedules[loan["id"]]
     
-    return loans
+    return json_response(loan_with_schedule_rows_adapter, loans)
 
 @router.get("/loans/{loan_id}", response_model=LoanWithSchedule)
 def get_my_loan_detail(
@@ -43,7 +56,7 @@ def get_my_loan_detail(
             detail="Préstamo no encontrado"
         )
     
-    return loan
+    return loan_with_schedule(db, loan)
 
 @router.post("/loan-request", response_model=LoanResponse)
 def request_loan(
@@ -51,21 +64,29 @@ def request_loan(
     db: Session = Depends(get_db),
     current_customer: Customer = Depends(get_current_customer)
 ):
-    maturity_date = loan_data.first_payment_date + relativedelta(months=loan_data.term_months - 1)
+    first_payment_date = loan_data.first_payment_date or loan_data.disbursement_date + relativedelta(months=1)
+    maturity_date = first_payment_date + relativedelta(months=loan_data.term_months - 1)
     
     new_loan = Loan(
         customer_id=current_customer.id,
+        loan_number=loan_number_allocator.next_number(),
         principal_amount=loan_data.principal_amount,
         interest_rate=loan_data.interest_rate,
         interest_type='fixed',
         term_months=loan_data.term_months,
         disbursement_date=loan_data.disbursement_date,
-        first_payment_date=loan_data.first_payment_date,
+        first_payment_date=first_payment_date,
         maturity_date=maturity_date,
         status='pending'
     )
+    if loan_data.term_months > 0:
+        # Costo total de la solicitud desde el motor de cotizaciones (sin generar cronograma)
+        loan_quote = quote(loan_data.principal_amount, loan_data.interest_rate, loan_data.term_months)
+        new_loan.total_interest = loan_quote["total_interest"]
+        new_loan.total_amount = loan_quote["total_amount"]
     
     db.add(new_loan)
     db.commit()
     db.refresh(new_loan)
+    publish_event("loans", "loan.created", loan_event_data(new_loan))
     return new_loan
\ No newline at end of file
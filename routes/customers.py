@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from uuid import UUID
-from config.database import get_db
+from config.database import SessionLocal, get_db
 from models.models import Customer, User
-from schemas.schemas import CustomerCreate, CustomerUpdate, CustomerResponse
+from schemas.schemas import CustomerCreate, CustomerUpdate, CustomerResponse, CustomerRow, CustomerExposure, ExposureBatchRequest
 from utils.security import get_current_user
+from utils.fast_json import customer_rows_adapter, rows_to_dicts, json_response
+from utils.fields import parse_fields, projected_columns
+from utils.exposure import customer_exposures, exposure_cache
+from utils.entity_cache import cached
+from utils.customer_import import IMPORT_MAX_BYTES, detect_format, import_customers, parse_rows
 
 router = APIRouter(prefix="/customers", tags=["Customers"])
 
@@ -32,11 +39,74 @@ def create_customer(
 def get_customers(
     skip: int = 0,
     limit: int = 100,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    customers = db.query(Customer).filter(Customer.is_active == True).offset(skip).limit(limit).all()
-    return customers
+    field_names = parse_fields(fields, CustomerRow)
+    rows = db.query(*projected_columns(Customer, field_names)).filter(
+        Customer.is_active == True
+    ).offset(skip).limit(limit).all()
+    return json_response(customer_rows_adapter, rows_to_dicts(rows))
+
+@router.post("/import")
+async def import_customers_file(
+    request: Request,
+    format: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Importación masiva (CSV con encabezados o NDJSON, según Content-Type o
+    ?format=csv|ndjson). Responde NDJSON en streaming: una línea por fila
+    (created, duplicate, invalid, failed) y al final el resumen.
+    """
+    fmt = detect_format(request.headers.get("content-type"), format)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Formato no soportado: use text/csv o application/x-ndjson")
+    body = await request.body()
+    if len(body) > IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"El archivo excede {IMPORT_MAX_BYTES} bytes")
+    try:
+        body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El archivo debe estar en UTF-8")
+    created_by = current_user.id
+
+    def report():
+        # Sesión propia: el reporte se sigue generando después de retornar la ruta
+        db = SessionLocal()
+        try:
+            for item in import_customers(db, parse_rows(body, fmt), created_by):
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(report(), media_type="application/x-ndjson")
+
+@router.post("/exposure", response_model=List[CustomerExposure])
+def get_exposures(
+    request: ExposureBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Exposición de varios clientes a la vez (pantallas de evaluación); omite los ids inexistentes."""
+    exposures = customer_exposures(db, request.customer_ids)
+    return [exposures[customer_id] for customer_id in request.customer_ids if customer_id in exposures]
+
+@router.get("/{customer_id}/exposure", response_model=CustomerExposure)
+def get_exposure(
+    customer_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Saldo vigente, préstamos activos, peor atraso y DTI agregado del cliente."""
+    exposure = customer_exposures(db, [customer_id]).get(customer_id)
+    if not exposure:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Cliente no encontrado"
+        )
+    return exposure
 
 @router.get("/{customer_id}", response_model=CustomerResponse)
 def get_customer(
@@ -44,13 +114,13 @@ def get_customer(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    customer = db.query(Customer).filter(Customer.id == customer_id).first()
-    if not customer:
+    content = _cached_customer(db, customer_id)
+    if content is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Cliente no encontrado"
         )
-    return customer
+    return Response(content=content, media_type="application/json")
 
 @router.get("/dni/{dni}", response_model=CustomerResponse)
 def get_customer_by_dni(
@@ -58,13 +128,25 @@ def get_customer_by_dni(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    customer = db.query(Customer).filter(Customer.dni == dni).first()
-    if not customer:
+    customer_id = cached("customer_dni", dni, lambda: _customer_id_by_dni(db, dni))
+    content = _cached_customer(db, customer_id) if customer_id else None
+    if content is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Cliente no encontrado"
         )
-    return customer
+    return Response(content=content, media_type="application/json")
+
+def _cached_customer(db: Session, customer_id):
+    """JSON de CustomerResponse desde la caché de entidades (o la base si no está)."""
+    def load():
+        customer = db.query(Customer).filter(Customer.id == customer_id).first()
+        return CustomerResponse.model_validate(customer).model_dump_json() if customer else None
+    return cached("customer", customer_id, load)
+
+def _customer_id_by_dni(db: Session, dni: str):
+    customer_id = db.query(Customer.id).filter(Customer.dni == dni).scalar()
+    return str(customer_id) if customer_id else None
 
 @router.put("/{customer_id}", response_model=CustomerResponse)
 def update_customer(
@@ -81,6 +163,7 @@ def update_customer(
         setattr(customer, key, value)
     
     db.commit()
+    exposure_cache.delete(str(customer_id))  # El ingreso cambia el DTI
     db.refresh(customer)
     return customer
 
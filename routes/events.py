@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from jose import JWTError, jwt
+
+from config.database import SessionLocal
+from models.models import User
+from utils.events import TOPICS, event_hub
+from utils.security import SECRET_KEY, ALGORITHM
+
+router = APIRouter(tags=["Events"])
+
+
+def _authenticate_admin(token: str):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("role") != "admin" or not payload.get("sub"):
+        return None
+
+    db = SessionLocal()
+    try:
+        return db.query(User).filter(User.email == payload["sub"], User.is_active == True).first()
+    finally:
+        db.close()
+
+
+def _parse_topics(raw: str) -> set:
+    if not raw:
+        return set(TOPICS)
+    return {topic.strip() for topic in raw.split(",") if topic.strip() in TOPICS}
+
+
+@router.websocket("/ws/events")
+async def events_websocket(websocket: WebSocket, token: str = None, topics: str = None):
+    """
+    Canal de eventos para el panel de administración.
+    Autenticación: ?token=<jwt admin>. Suscripción: ?topics=payments,loans
+    o mensajes {"action": "subscribe" | "unsubscribe", "topics": [...]}.
+    """
+    user = await asyncio.to_thread(_authenticate_admin, token) if token else None
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    subscriber = event_hub.subscribe(_parse_topics(topics))
+
+    async def sender():
+        while True:
+            message = await subscriber.queue.get()
+            if event_hub.is_lagging(subscriber):
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return
+            await websocket.send_text(message)
+
+    async def receiver():
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                continue
+            # JSON válido pero no un objeto {"action", "topics": [...]}: se ignora
+            if not isinstance(message, dict) or not isinstance(message.get("topics", []), list):
+                continue
+            requested = {topic for topic in message.get("topics", []) if isinstance(topic, str) and topic in TOPICS}
+            if message.get("action") == "subscribe":
+                subscriber.topics |= requested
+            elif message.get("action") == "unsubscribe":
+                subscriber.topics -= requested
+            await websocket.send_text(json.dumps({"type": "subscriptions", "topics": sorted(subscriber.topics)}))
+
+    tasks = [asyncio.create_task(sender()), asyncio.create_task(receiver())]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error and not isinstance(error, WebSocketDisconnect):
+                print(f"Error en websocket de eventos: {str(error)}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        event_hub.unsubscribe(subscriber)
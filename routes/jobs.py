@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from config.database import get_db
+from models.models import User
+from utils.security import get_current_user
+from utils.scheduler import SCHEDULER_ENABLED, job_history, scheduler
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+@router.get("/")
+def get_jobs(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Estado de las tareas periódicas: métricas del clúster y de este worker."""
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso denegado: Se requiere rol de administrador.")
+    return {
+        "enabled": SCHEDULER_ENABLED,
+        "owner": scheduler.owner,
+        "cluster": job_history(db),
+        "worker": scheduler.metrics(),
+    }
@@ -1,48 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import Response
+from sqlalchemy.orm import Session, noload
+from typing import List, Optional
 from uuid import UUID
-from datetime import datetime
+from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 from decimal import Decimal
 from config.database import get_db
-from models.models import Loan, Customer, PaymentSchedule, User
-from schemas.schemas import LoanCreate, LoanResponse, LoanWithSchedule
+from models.models import Loan, Customer, PaymentSchedule, PaymentScheduleHistory, User
+from schemas.schemas import LoanCreate, LoanResponse, LoanWithSchedule, LoanRow, LoanBalance, LoanRestructure, ScheduleHistoryItem
 from utils.security import get_current_user
+from utils.db_policy import db_policy
+from utils.amortization import calculate_payment_schedule
+from utils.loan_numbers import loan_number_allocator
+from utils.virtual_schedule import (
+    DEFAULT_SCHEDULE_MODE, installment_id, is_virtual, loan_with_schedule, merge_schedule_rows
+)
+from utils.events import publish_event, loan_event_data
+from utils.loan_summary import refresh_loan_summary
+from utils.ledger import loan_balance, post_disbursement_entry
+from utils.archive import load_archived_loan
+from utils.entity_cache import cached
+from utils.restructure import RestructureError, restructure_loan
+from utils.fast_json import (
+    load_schedule_rows, loan_rows_adapter, loan_rows_with_schedule_adapter, rows_to_dicts, json_response
+)
+from utils.fields import INCLUDE_PENDING_SCHEDULE, parse_fields, parse_include, projected_columns
 
 router = APIRouter(prefix="/loans", tags=["Loans"])
 
-def calculate_payment_schedule(loan: Loan):
-    """Calcula el cronograma de pagos con método de capital fijo"""
-    schedule = []
-    remaining_balance = loan.principal_amount
-    monthly_interest = loan.interest_rate / 100 / 12
-    fixed_principal = loan.principal_amount / loan.term_months
-    
-    current_date = loan.first_payment_date
-    
-    for i in range(1, loan.term_months + 1):
-        interest_amount = remaining_balance * monthly_interest
-        total_payment = fixed_principal + interest_amount
-        remaining_balance -= fixed_principal
-        
-        if remaining_balance < 0.01:
-            remaining_balance = Decimal('0.00')
-        
-        schedule.append({
-            'installment_number': i,
-            'due_date': current_date,
-            'principal_amount': round(fixed_principal, 2),
-            'interest_amount': round(interest_amount, 2),
-            'total_amount': round(total_payment, 2),
-            'remaining_balance': round(remaining_balance, 2),
-            'status': 'pending'
-        })
-        
-        current_date = current_date + relativedelta(months=1)
-    
-    return schedule
-
 @router.post("/", response_model=LoanWithSchedule, status_code=status.HTTP_201_CREATED)
 def create_loan(
     loan: LoanCreate,
@@ -62,7 +48,9 @@ def create_loan(
         **loan.model_dump(),
         maturity_date=maturity_date,
         created_by=current_user.id,
-        status='active'
+        loan_number=loan_number_allocator.next_number(),
+        status='active',
+        schedule_mode=DEFAULT_SCHEDULE_MODE
     )
     
     schedule_data = calculate_payment_schedule(new_loan)
@@ -70,16 +58,19 @@ def create_loan(
     total_interest = sum(item['interest_amount'] for item in schedule_data)
     new_loan.total_interest = total_interest
     new_loan.total_amount = new_loan.principal_amount + total_interest
-    new_loan.outstanding_balance = new_loan.total_amount
     
     if customer.monthly_income and customer.monthly_income > 0:
         new_loan.dti_ratio = (new_loan.total_amount / loan.term_months) / customer.monthly_income * 100
     
     db.add(new_loan)
     db.flush()
+    # Lo adeudado entra al libro mayor: el saldo del préstamo se calcula desde ahí
+    post_disbursement_entry(db, new_loan)
     
-    for item in schedule_data:
+    # En modo virtual el cronograma se deriva al leer; no se guardan filas
+    for item in ([] if is_virtual(new_loan) else schedule_data):
         payment = PaymentSchedule(
+            id=installment_id(new_loan.id, item['installment_number']),
             loan_id=new_loan.id,
             installment_number=item['installment_number'],
             due_date=item['due_date'],
@@ -92,24 +83,42 @@ def create_loan(
         )
         db.add(payment)
     
+    refresh_loan_summary(db, new_loan)
     db.commit()
     db.refresh(new_loan)
+    publish_event("loans", "loan.created", loan_event_data(new_loan))
     
-    return new_loan
+    return loan_with_schedule(db, new_loan)
 
 @router.get("/", response_model=List[LoanResponse])
 def get_loans(
     skip: int = 0,
     limit: int = 100,
     status: str = None,
+    fields: Optional[str] = None,
+    include: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    query = db.query(Loan)
+    # Ruta rápida: tuplas de columnas -> bytes JSON, sin instanciar ORM ni modelos.
+    # ?fields= reduce tanto el SELECT como el JSON; ?include=schedule[.pending] agrega cuotas
+    field_names = parse_fields(fields, LoanRow)
+    include = parse_include(include)
+    
+    query = db.query(*projected_columns(Loan, field_names))
     if status:
         query = query.filter(Loan.status == status)
-    loans = query.offset(skip).limit(limit).all()
-    return loans
+    loans = rows_to_dicts(query.offset(skip).limit(limit).all())
+    
+    if not include:
+        return json_response(loan_rows_adapter, loans)
+    
+    pending_only = include == INCLUDE_PENDING_SCHEDULE
+    loan_ids = [loan["id"] for loan in loans]
+    schedules = merge_schedule_rows(db, loans, load_schedule_rows(db, loan_ids, pending_only), pending_only)
+    for loan in loans:
+        loan["payment_schedule"] = schedules[loan["id"]]
+    return json_response(loan_rows_with_schedule_adapter, loans)
 
 @router.get("/{loan_id}", response_model=LoanWithSchedule)
 def get_loan(
@@ -117,10 +126,97 @@ def get_loan(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    def load():
+        loan = db.query(Loan).filter(Loan.id == loan_id).first()
+        # Los préstamos cancelados antiguos se leen desde el archivo
+        result = loan_with_schedule(db, loan) if loan else load_archived_loan(db, loan_id)
+        return LoanWithSchedule.model_validate(result).model_dump_json() if result else None
+
+    # Las cuotas derivadas calculan la mora con la fecha de hoy: entra en la clave
+    content = cached("loan", loan_id, load, variant=date.today().isoformat())
+    if content is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Préstamo no encontrado"
+        )
+    return Response(content=content, media_type="application/json")
+
+@router.get("/{loan_id}/balance", response_model=LoanBalance)
+def get_loan_balance(
+    loan_id: UUID,
+    as_of: Optional[date] = Query(None, description="Fecha de corte (por defecto hoy)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Saldo calculado desde el libro mayor (foto de saldos + movimientos posteriores)."""
+    loan = db.query(Loan).options(noload(Loan.payment_schedule)).filter(Loan.id == loan_id).first()
+    if not loan:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Préstamo no encontrado"
+        )
+    return loan_balance(db, loan, as_of)
+
+
+@router.post("/{loan_id}/restructure", response_model=LoanWithSchedule)
+@db_policy(timeout_ms=30000)
+def restructure(
+    loan_id: UUID,
+    data: LoanRestructure,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Reprograma las cuotas impagas (nuevo plazo, tasa, gracia o capitalización
+    de atrasos). Las cuotas reemplazadas quedan en el historial de versiones.
+    """
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso denegado: Se requiere rol de administrador.")
+
     loan = db.query(Loan).filter(Loan.id == loan_id).first()
     if not loan:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Préstamo no encontrado"
         )
-    return loan
\ No newline at end of file
+    if loan.status not in ('active', 'approved'):
+        raise HTTPException(status_code=400, detail="Solo se pueden reprogramar préstamos activos")
+
+    try:
+        result = restructure_loan(
+            db, loan,
+            term_months=data.term_months,
+            interest_rate=data.interest_rate,
+            grace_months=data.grace_months,
+            capitalize_arrears=data.capitalize_arrears,
+        )
+    except RestructureError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    note = f"[Reprogramación v{result['version']}] {data.term_months} cuotas, capital S/ {result['restructured_principal']:.2f}"
+    if data.notes:
+        note = f"{note} - {data.notes}"
+    loan.notes = f"{loan.notes}\n{note}" if loan.notes else note
+
+    refresh_loan_summary(db, loan)
+    db.commit()
+    db.refresh(loan)
+    publish_event("loans", "loan.restructured", {**loan_event_data(loan), **result})
+    return loan_with_schedule(db, loan)
+
+
+@router.get("/{loan_id}/schedule-history", response_model=List[ScheduleHistoryItem])
+def get_schedule_history(
+    loan_id: UUID,
+    version: Optional[int] = Query(None, description="Solo las cuotas de esa versión"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Cuotas reemplazadas por reprogramaciones, de la más reciente a la más antigua."""
+    query = db.query(PaymentScheduleHistory).filter(PaymentScheduleHistory.loan_id == loan_id)
+    if version is not None:
+        query = query.filter(PaymentScheduleHistory.schedule_version == version)
+    return query.order_by(
+        PaymentScheduleHistory.superseded_by_version.desc(), PaymentScheduleHistory.installment_number
+    ).all()
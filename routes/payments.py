@@ -1,11 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
+from typing import Optional
 from uuid import UUID
+from datetime import date
 from config.database import get_db
 from models.models import Payment, Loan, PaymentSchedule, User, Customer
-from schemas.schemas import PaymentCreate, PaymentResponse
+from schemas.schemas import PaymentBatchApproval, PaymentBatchApprove, PaymentCreate, PaymentResponse, PaymentPage
 from utils.security import get_current_user, get_current_customer
-from decimal import Decimal
+from utils.events import publish_event, payment_event_data
+from utils.pagination import encode_cursor, keyset_filter
+from utils.db_policy import db_policy
+from utils.loan_summary import refresh_loan_summary
+from utils.virtual_schedule import find_installment, open_installments
+from utils.money import from_cents, to_cents
+from utils.ledger import allocate_to_installment, post_payment_entries
+from utils.payment_approval import APPROVED, FAILED, SKIPPED, apply_payment, approve_payments
 
 router = APIRouter(prefix="/payments", tags=["Payments"])
 
@@ -24,7 +33,9 @@ def create_payment_admin(
     La lógica de aprobación y aplicación de pago es idéntica a la ruta de cliente,
     pero la autenticación se realiza con el token del administrador (User).
     """
-    loan = db.query(Loan).filter(Loan.id == payment.loan_id).first()
+    # Bloqueo del préstamo como en approve_payments: dos pagos concurrentes no
+    # pueden leer las mismas cuotas abiertas ni pisar los saldos
+    loan = db.query(Loan).filter(Loan.id == payment.loan_id).with_for_update(of=Loan).populate_existing().first()
     if not loan:
         raise HTTPException(status_code=404, detail="Préstamo no encontrado")
     
@@ -46,11 +57,10 @@ def create_payment_admin(
         "status": 'approved' # CAMBIO CLAVE: Asumimos la aprobación inmediata
     }
 
+    allocations = []  # Asignaciones por cuota para el libro mayor
     if payment.schedule_id:
         # --- ESCENARIO 1: PAGO DE CUOTA ESPECÍFICA ---
-        schedule = db.query(PaymentSchedule).filter(
-            PaymentSchedule.id == payment.schedule_id
-        ).first()
+        schedule = find_installment(db, loan, payment.schedule_id)
         
         if not schedule:
             raise HTTPException(status_code=404, detail="Cuota no encontrada")
@@ -59,11 +69,11 @@ def create_payment_admin(
             raise HTTPException(status_code=400, detail="Esta cuota ya está pagada")
         
         # Validación del monto
-        expected_amount = Decimal(str(schedule.total_amount)) - Decimal(str(schedule.paid_amount or 0))
-        if abs(Decimal(str(payment.amount)) - expected_amount) > Decimal('0.01'):
+        expected_cents = to_cents(schedule.total_amount) - to_cents(schedule.paid_amount)
+        if abs(to_cents(payment.amount) - expected_cents) > 1:
             raise HTTPException(
                 status_code=400, 
-                detail=f"El monto debe ser S/ {expected_amount:.2f}"
+                detail=f"El monto debe ser S/ {from_cents(expected_cents):.2f}"
             )
         
         # 1a. Actualizar datos del nuevo pago
@@ -72,56 +82,60 @@ def create_payment_admin(
         new_payment_data["interest_paid"] = schedule.interest_amount
         
         # 1b. *** LÓGICA DE ACTUALIZACIÓN DE CUOTA (Cronograma) ***
+        allocations.append(allocate_to_installment(schedule, to_cents(payment.amount)))
         schedule.paid_amount = schedule.total_amount
         schedule.paid_principal = schedule.principal_amount
         schedule.paid_interest = schedule.interest_amount
         schedule.status = 'paid' # Marca la cuota como PAGADA
+        db.add(schedule) # En cronogramas virtuales materializa la cuota
 
     else:
         # --- ESCENARIO 2: PAGO LIBRE / ADELANTO ---
         
         # 2a. *** LÓGICA DE APLICACIÓN DE PAGO EN ORDEN ***
-        remaining_amount = Decimal(str(payment.amount))
-        schedules = db.query(PaymentSchedule).filter(
-            PaymentSchedule.loan_id == payment.loan_id,
-            PaymentSchedule.status.in_(['pending', 'partial'])
-        ).order_by(PaymentSchedule.installment_number).all()
+        remaining_cents = to_cents(payment.amount)
+        schedules = open_installments(db, loan)
         
         # Aplicar el pago a las cuotas en orden (tomado de approve_payment)
         for schedule in schedules:
-            if remaining_amount <= 0:
+            if remaining_cents <= 0:
                 break
             
-            outstanding = Decimal(str(schedule.total_amount)) - Decimal(str(schedule.paid_amount or 0))
-            payment_to_apply = min(remaining_amount, outstanding)
+            total_cents = to_cents(schedule.total_amount)
+            paid_cents = to_cents(schedule.paid_amount)
+            cents_to_apply = min(remaining_cents, total_cents - paid_cents)
             
-            schedule.paid_amount = Decimal(str(schedule.paid_amount or 0)) + payment_to_apply
+            paid_cents += cents_to_apply
+            schedule.paid_amount = from_cents(paid_cents)
+            allocations.append(allocate_to_installment(schedule, cents_to_apply))
+            db.add(schedule)
             
             # Recalcular el status de la cuota
-            if schedule.paid_amount >= Decimal(str(schedule.total_amount)) - Decimal('0.01'):
+            if paid_cents >= total_cents - 1:
                 schedule.status = 'paid'
-            elif schedule.paid_amount > Decimal('0.00'):
+            elif paid_cents > 0:
                 schedule.status = 'partial'
             
-            remaining_amount -= payment_to_apply
+            remaining_cents -= cents_to_apply
         
         # En pagos libres, principal/interest_paid se puede calcular
         # más detalladamente, pero por simplicidad de este fix,
         # lo dejamos en None si no se especifica cuota.
         
     # -----------------------------------------------------------
-    # 2. REGISTRAR PAGO Y ACTUALIZAR SALDO DEL PRÉSTAMO
+    # 2. REGISTRAR PAGO EN EL LIBRO MAYOR
     # -----------------------------------------------------------
     new_payment = Payment(**new_payment_data)
     db.add(new_payment)
-
-    # *** ACTUALIZACIÓN DEL PRÉSTAMO (Loan) ***
-    loan.paid_amount = Decimal(str(loan.paid_amount or 0)) + Decimal(str(payment.amount))
-    loan.outstanding_balance = Decimal(str(loan.total_amount)) - Decimal(str(loan.paid_amount))
+    # Solo INSERT: el saldo del préstamo se calcula desde el libro mayor al leerlo
+    post_payment_entries(db, new_payment, allocations)
+    refresh_loan_summary(db, loan)
     
-    # Commit para guardar: new_payment, el/los schedules actualizados, y loan actualizado.
+    customer_id = loan.customer_id
+    # Commit para guardar: new_payment, sus movimientos, el/los schedules actualizados y el resumen del préstamo.
     db.commit() 
     db.refresh(new_payment)
+    publish_event("payments", "payment.created", payment_event_data(new_payment, customer_id))
     return new_payment
 
 
@@ -134,7 +148,9 @@ def create_payment(
     db: Session = Depends(get_db),
     current_customer: Customer = Depends(get_current_customer)
 ):
-    loan = db.query(Loan).filter(Loan.id == payment.loan_id).first()
+    # Bloqueo del préstamo como en approve_payments: dos pagos concurrentes no
+    # pueden leer las mismas cuotas abiertas ni pisar los saldos
+    loan = db.query(Loan).filter(Loan.id == payment.loan_id).with_for_update(of=Loan).populate_existing().first()
     if not loan:
         raise HTTPException(status_code=404, detail="Préstamo no encontrado")
     
@@ -152,11 +168,10 @@ def create_payment(
         "status": 'approved' # CAMBIO CLAVE: Asumimos la aprobación inmediata
     }
 
+    allocations = []  # Asignaciones por cuota para el libro mayor
     if payment.schedule_id:
         # --- ESCENARIO 1: PAGO DE CUOTA ESPECÍFICA ---
-        schedule = db.query(PaymentSchedule).filter(
-            PaymentSchedule.id == payment.schedule_id
-        ).first()
+        schedule = find_installment(db, loan, payment.schedule_id)
         
         if not schedule:
             raise HTTPException(status_code=404, detail="Cuota no encontrada")
@@ -165,11 +180,11 @@ def create_payment(
             raise HTTPException(status_code=400, detail="Esta cuota ya está pagada")
         
         # Validación del monto
-        expected_amount = Decimal(str(schedule.total_amount)) - Decimal(str(schedule.paid_amount or 0))
-        if abs(Decimal(str(payment.amount)) - expected_amount) > Decimal('0.01'):
+        expected_cents = to_cents(schedule.total_amount) - to_cents(schedule.paid_amount)
+        if abs(to_cents(payment.amount) - expected_cents) > 1:
             raise HTTPException(
                 status_code=400, 
-                detail=f"El monto debe ser S/ {expected_amount:.2f}"
+                detail=f"El monto debe ser S/ {from_cents(expected_cents):.2f}"
             )
         
         # 1a. Actualizar datos del nuevo pago
@@ -178,56 +193,60 @@ def create_payment(
         new_payment_data["interest_paid"] = schedule.interest_amount
         
         # 1b. *** LÓGICA DE ACTUALIZACIÓN DE CUOTA (Cronograma) ***
+        allocations.append(allocate_to_installment(schedule, to_cents(payment.amount)))
         schedule.paid_amount = schedule.total_amount
         schedule.paid_principal = schedule.principal_amount
         schedule.paid_interest = schedule.interest_amount
         schedule.status = 'paid' # Marca la cuota como PAGADA
+        db.add(schedule) # En cronogramas virtuales materializa la cuota
 
     else:
         # --- ESCENARIO 2: PAGO LIBRE / ADELANTO ---
         
         # 2a. *** LÓGICA DE APLICACIÓN DE PAGO EN ORDEN ***
-        remaining_amount = Decimal(str(payment.amount))
-        schedules = db.query(PaymentSchedule).filter(
-            PaymentSchedule.loan_id == payment.loan_id,
-            PaymentSchedule.status.in_(['pending', 'partial'])
-        ).order_by(PaymentSchedule.installment_number).all()
+        remaining_cents = to_cents(payment.amount)
+        schedules = open_installments(db, loan)
         
         # Aplicar el pago a las cuotas en orden (tomado de approve_payment)
         for schedule in schedules:
-            if remaining_amount <= 0:
+            if remaining_cents <= 0:
                 break
             
-            outstanding = Decimal(str(schedule.total_amount)) - Decimal(str(schedule.paid_amount or 0))
-            payment_to_apply = min(remaining_amount, outstanding)
+            total_cents = to_cents(schedule.total_amount)
+            paid_cents = to_cents(schedule.paid_amount)
+            cents_to_apply = min(remaining_cents, total_cents - paid_cents)
             
-            schedule.paid_amount = Decimal(str(schedule.paid_amount or 0)) + payment_to_apply
+            paid_cents += cents_to_apply
+            schedule.paid_amount = from_cents(paid_cents)
+            allocations.append(allocate_to_installment(schedule, cents_to_apply))
+            db.add(schedule)
             
             # Recalcular el status de la cuota
-            if schedule.paid_amount >= Decimal(str(schedule.total_amount)) - Decimal('0.01'):
+            if paid_cents >= total_cents - 1:
                 schedule.status = 'paid'
-            elif schedule.paid_amount > Decimal('0.00'):
+            elif paid_cents > 0:
                 schedule.status = 'partial'
             
-            remaining_amount -= payment_to_apply
+            remaining_cents -= cents_to_apply
         
         # En pagos libres, principal/interest_paid se puede calcular
         # más detalladamente, pero por simplicidad de este fix,
         # lo dejamos en None si no se especifica cuota.
         
     # -----------------------------------------------------------
-    # 2. REGISTRAR PAGO Y ACTUALIZAR SALDO DEL PRÉSTAMO
+    # 2. REGISTRAR PAGO EN EL LIBRO MAYOR
     # -----------------------------------------------------------
     new_payment = Payment(**new_payment_data)
     db.add(new_payment)
-
-    # *** ACTUALIZACIÓN DEL PRÉSTAMO (Loan) ***
-    loan.paid_amount = Decimal(str(loan.paid_amount or 0)) + Decimal(str(payment.amount))
-    loan.outstanding_balance = Decimal(str(loan.total_amount)) - Decimal(str(loan.paid_amount))
+    # Solo INSERT: el saldo del préstamo se calcula desde el libro mayor al leerlo
+    post_payment_entries(db, new_payment, allocations)
+    refresh_loan_summary(db, loan)
     
-    # Commit para guardar: new_payment, el/los schedules actualizados, y loan actualizado.
+    customer_id = loan.customer_id
+    # Commit para guardar: new_payment, sus movimientos, el/los schedules actualizados y el resumen del préstamo.
     db.commit() 
     db.refresh(new_payment)
+    publish_event("payments", "payment.created", payment_event_data(new_payment, customer_id))
     return new_payment
 
 # EL RESTO DE LAS FUNCIONES QUEDAN IGUALES
@@ -237,63 +256,54 @@ def approve_payment(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    payment = db.query(Payment).filter(Payment.id == payment_id).first()
+    # Bloqueo del pago y del préstamo como en approve_payments: un lote
+    # concurrente no puede aplicar el mismo pago ni pisar los saldos
+    payment = db.query(Payment).filter(Payment.id == payment_id).with_for_update().populate_existing().first()
     if not payment:
         raise HTTPException(status_code=404, detail="Pago no encontrado")
     
     if payment.status != 'pending':
         raise HTTPException(status_code=400, detail="El pago ya fue procesado")
     
-    loan = db.query(Loan).filter(Loan.id == payment.loan_id).first()
-    
-    if payment.schedule_id:
-        schedule = db.query(PaymentSchedule).filter(
-            PaymentSchedule.id == payment.schedule_id
-        ).first()
-        
-        if schedule:
-            schedule.paid_amount = schedule.total_amount
-            schedule.paid_principal = schedule.principal_amount
-            schedule.paid_interest = schedule.interest_amount
-            schedule.status = 'paid'
-    else:
-        remaining_amount = Decimal(str(payment.amount))
-        schedules = db.query(PaymentSchedule).filter(
-            PaymentSchedule.loan_id == payment.loan_id,
-            PaymentSchedule.status.in_(['pending', 'partial'])
-        ).order_by(PaymentSchedule.installment_number).all()
-        
-        for schedule in schedules:
-            if remaining_amount <= 0:
-                break
-            
-            outstanding = Decimal(str(schedule.total_amount)) - Decimal(str(schedule.paid_amount or 0))
-            payment_to_apply = min(remaining_amount, outstanding)
-            
-            schedule.paid_amount = Decimal(str(schedule.paid_amount or 0)) + payment_to_apply
-            if schedule.paid_amount >= Decimal(str(schedule.total_amount)) - Decimal('0.01'):
-                schedule.status = 'paid'
-            else:
-                schedule.status = 'partial'
-            
-            remaining_amount -= payment_to_apply
-    
-    loan.paid_amount = Decimal(str(loan.paid_amount or 0)) + Decimal(str(payment.amount))
-    loan.outstanding_balance = Decimal(str(loan.total_amount)) - Decimal(str(loan.paid_amount))
-    
-    payment.status = 'approved'
+    loan = db.query(Loan).filter(Loan.id == payment.loan_id).with_for_update(of=Loan).populate_existing().one()
+    apply_payment(db, loan, payment)
+    refresh_loan_summary(db, loan)
+    customer_id = loan.customer_id
     
     db.commit()
     db.refresh(payment)
+    publish_event("payments", "payment.approved", payment_event_data(payment, customer_id))
     return payment
 
+@router.post("/approve-batch", response_model=PaymentBatchApproval)
+@db_policy(timeout_ms=60000)
+def approve_payment_batch(
+    request: PaymentBatchApprove,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Aprueba en una sola transacción los pagos indicados o, sin ids, los
+    `limit` pendientes más antiguos. Los que otro proceso está aprobando se
+    saltan (SKIP LOCKED) y se informan como 'skipped'.
+    """
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso denegado: Se requiere rol de administrador.")
+    results = approve_payments(db, request.payment_ids, None if request.payment_ids else request.limit)
+    return {
+        "approved": sum(1 for result in results if result["status"] == APPROVED),
+        "failed": sum(1 for result in results if result["status"] == FAILED),
+        "skipped": sum(1 for result in results if result["status"] == SKIPPED),
+        "results": results,
+    }
+
 @router.put("/{payment_id}/reject", response_model=PaymentResponse)
 def reject_payment(
     payment_id: UUID,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    payment = db.query(Payment).filter(Payment.id == payment_id).first()
+    payment = db.query(Payment).filter(Payment.id == payment_id).with_for_update().populate_existing().first()
     if not payment:
         raise HTTPException(status_code=404, detail="Pago no encontrado")
     
@@ -301,23 +311,91 @@ def reject_payment(
         raise HTTPException(status_code=400, detail="El pago ya fue procesado")
     
     payment.status = 'rejected'
+    customer_id = db.query(Loan.customer_id).filter(Loan.id == payment.loan_id).scalar()
     db.commit()
     db.refresh(payment)
+    publish_event("payments", "payment.rejected", payment_event_data(payment, customer_id))
     return payment
 
-@router.get("/loan/{loan_id}")
+# Columnas necesarias para PaymentResponse (evita cargar la entidad completa)
+PAYMENT_LIST_COLUMNS = (
+    Payment.id,
+    Payment.status,
+    Payment.loan_id,
+    Payment.payment_date,
+    Payment.amount,
+    Payment.principal_paid,
+    Payment.interest_paid,
+    Payment.late_fee_paid,
+    Payment.late_interest_paid,
+    Payment.payment_method,
+    Payment.reference_number,
+    Payment.created_at,
+)
+
+def _list_payments(db: Session, filters: list, limit: int, cursor: Optional[str], descending: bool) -> PaymentPage:
+    query = db.query(*PAYMENT_LIST_COLUMNS).filter(*filters)
+    if cursor:
+        query = query.filter(keyset_filter(Payment.created_at, Payment.id, cursor, descending))
+    
+    if descending:
+        query = query.order_by(Payment.created_at.desc(), Payment.id.desc())
+    else:
+        query = query.order_by(Payment.created_at, Payment.id)
+    
+    # Se pide una fila extra para saber si hay otra página
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    
+    items = [PaymentResponse.model_validate(row) for row in rows]
+    return PaymentPage(items=items, next_cursor=next_cursor)
+
+def _payment_filters(
+    date_from: Optional[date],
+    date_to: Optional[date],
+    payment_method: Optional[str]
+) -> list:
+    filters = []
+    if date_from:
+        filters.append(Payment.payment_date >= date_from)
+    if date_to:
+        filters.append(Payment.payment_date <= date_to)
+    if payment_method:
+        filters.append(Payment.payment_method == payment_method)
+    return filters
+
+@router.get("/loan/{loan_id}", response_model=PaymentPage)
+@db_policy(timeout_ms=2000, max_rows=2000)
 def get_payments_by_loan(
     loan_id: UUID,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    payment_method: Optional[str] = None,
+    status: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    payments = db.query(Payment).filter(Payment.loan_id == loan_id).all()
-    return payments
+    filters = [Payment.loan_id == loan_id] + _payment_filters(date_from, date_to, payment_method)
+    if status:
+        filters.append(Payment.status == status)
+    return _list_payments(db, filters, limit, cursor, descending=True)
 
-@router.get("/pending")
+@router.get("/pending", response_model=PaymentPage)
+@db_policy(timeout_ms=2000, max_rows=2000)
 def get_pending_payments(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    payment_method: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    payments = db.query(Payment).filter(Payment.status == 'pending').all()
-    return payments
\ No newline at end of file
+    # Cola FIFO: los pagos pendientes más antiguos primero
+    filters = [Payment.status == 'pending'] + _payment_filters(date_from, date_to, payment_method)
+    return _list_payments(db, filters, limit, cursor, descending=False)
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from models.models import User
+from utils.security import get_current_user
+from utils.profiling import PROFILING_ENABLED, PROFILING_SAMPLE_RATE, list_profiles, profile_path
+
+router = APIRouter(prefix="/admin/profiles", tags=["Profiling"])
+
+
+def _require_admin(current_user: User):
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso denegado: Se requiere rol de administrador.")
+
+
+@router.get("/")
+def get_profiles(
+    limit: int = 50,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Perfiles guardados (más recientes primero). Para perfilar una petición:
+    cabecera `X-Profile: 1` con token de administrador, o PROFILING_SAMPLE_RATE.
+    """
+    _require_admin(current_user)
+    return {
+        "enabled": PROFILING_ENABLED,
+        "sample_rate": PROFILING_SAMPLE_RATE,
+        "profiles": list_profiles(limit),
+    }
+
+
+@router.get("/{profile_id}")
+def download_profile(
+    profile_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Metadatos del perfil con las sentencias SQL y sus tiempos (JSON)."""
+    _require_admin(current_user)
+    path = profile_path(profile_id, "json")
+    if not path:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return FileResponse(path, media_type="application/json", filename=f"{profile_id}.json")
+
+
+@router.get("/{profile_id}/collapsed")
+def download_collapsed(
+    profile_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Pilas en formato collapsed (flamegraph.pl, speedscope)."""
+    _require_admin(current_user)
+    path = profile_path(profile_id, "collapsed")
+    if not path:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.collapsed")
@@ -0,0 +1,36 @@
+from decimal import Decimal
+from typing import List
+
+from fastapi import APIRouter, HTTPException, Query
+
+from schemas.schemas import QuoteGrid
+from utils.quotes import QuoteError, quote_grid
+
+router = APIRouter(prefix="/quotes", tags=["Quotes"])
+
+@router.get("/", response_model=QuoteGrid, response_model_exclude_none=True)
+def get_quotes(
+    principal_amount: Decimal = Query(..., gt=0, le=Decimal("9999999999.99"), decimal_places=2),
+    interest_rate: List[Decimal] = Query(..., description="Una o varias tasas anuales (%)"),
+    term_months: List[int] = Query(..., description="Uno o varios plazos en meses"),
+    method: str = Query("fixed_capital", description="Método de amortización"),
+    include_schedule: bool = False,
+):
+    """
+    Calculadora pública: cotiza cada combinación tasa x plazo sin tocar la
+    base, con el mismo redondeo que el cronograma real del préstamo.
+    """
+    if any(rate < 0 or rate > 100 for rate in interest_rate):
+        raise HTTPException(status_code=400, detail="La tasa debe estar entre 0 y 100")
+    if any(term < 1 or term > 360 for term in term_months):
+        raise HTTPException(status_code=400, detail="El plazo debe estar entre 1 y 360 meses")
+    try:
+        quotes = quote_grid(principal_amount, interest_rate, term_months, method, include_schedule)
+    except QuoteError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "principal_amount": principal_amount,
+        "method": method,
+        "quotes": quotes,
+    }
@@ -0,0 +1,6 @@
+from utils.bootstrap import script_session
+from utils.underwriting import underwrite_pending_loans
+
+with script_session() as db:
+    totals = underwrite_pending_loans(db)
+    print(f"✅ Aprobadas: {totals['approved']} - rechazadas: {totals['rejected']} - en revisión: {totals['review']}")
@@ -1,9 +1,16 @@
-from pydantic import BaseModel, EmailStr, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field, ConfigDict, PlainSerializer
+from typing import Annotated, Dict, List, Optional
+from typing_extensions import TypedDict
 from datetime import date, datetime
 from decimal import Decimal
 from uuid import UUID
 
+# Montos: siempre como string con 2 decimales en JSON
+def _money_to_str(value: Decimal) -> str:
+    return f"{value:.2f}"
+
+Money = Annotated[Decimal, PlainSerializer(_money_to_str, return_type=str, when_used="json")]
+
 # Auth Schemas
 class UserLogin(BaseModel):
     email: EmailStr
@@ -52,13 +59,13 @@ class CustomerResponse(CustomerBase):
 # Loan Schemas
 class LoanBase(BaseModel):
     customer_id: UUID
-    principal_amount: Decimal = Field(..., gt=0)
+    principal_amount: Decimal = Field(..., gt=0, decimal_places=2)
     interest_rate: Decimal = Field(..., ge=0, le=100)
     interest_type: str = Field(..., pattern="^(fixed|variable|indexed)$")
     term_months: int = Field(..., gt=0)
     amortization_method: str = Field(default="fixed_capital", pattern="^(fixed_capital|french|german|american)$")
     late_interest_rate: Optional[Decimal] = Field(default=0.00, ge=0)
-    late_fee_amount: Optional[Decimal] = Field(default=0.00, ge=0)
+    late_fee_amount: Optional[Decimal] = Field(default=0.00, ge=0, decimal_places=2)
     disbursement_date: date
     first_payment_date: date
     notes: Optional[str] = None
@@ -88,6 +95,11 @@ class LoanResponse(LoanBase):
     paid_amount: Decimal
     outstanding_balance: Optional[Decimal]
     dti_ratio: Optional[Decimal]
+    next_due_date: Optional[date] = None
+    next_due_amount: Optional[Decimal] = None
+    overdue_count: Optional[int] = 0
+    overdue_amount: Optional[Decimal] = None
+    last_payment_date: Optional[date] = None
     version: int
     created_at: datetime
     updated_at: datetime
@@ -102,7 +114,7 @@ class LoanWithSchedule(LoanResponse):
 class PaymentCreate(BaseModel):
     loan_id: UUID
     schedule_id: Optional[UUID] = None
-    amount: Decimal
+    amount: Decimal = Field(..., decimal_places=2)
     payment_date: datetime
     payment_method: str
     reference_number: Optional[str] = None
@@ -125,6 +137,116 @@ class PaymentResponse(BaseModel):
     
     model_config = ConfigDict(from_attributes=True)
 
+class PaymentPage(BaseModel):
+    items: List[PaymentResponse]
+    next_cursor: Optional[str] = None
+
+class PaymentBatchApprove(BaseModel):
+    payment_ids: Optional[List[UUID]] = Field(None, min_length=1, max_length=1000)
+    limit: int = Field(200, ge=1, le=1000)  # Sin ids: cuántos pendientes tomar
+
+class PaymentApprovalResult(BaseModel):
+    payment_id: UUID
+    loan_id: Optional[UUID] = None
+    status: str  # approved | failed | skipped
+    detail: Optional[str] = None
+
+class PaymentBatchApproval(BaseModel):
+    approved: int
+    failed: int
+    skipped: int
+    results: List[PaymentApprovalResult]
+
+class LoanBalance(BaseModel):
+    loan_id: UUID
+    as_of: date
+    principal_paid: Decimal
+    interest_paid: Decimal
+    late_fee_paid: Decimal
+    late_interest_paid: Decimal
+    unapplied: Decimal
+    total_paid: Decimal
+    principal_due: Decimal
+    total_due: Decimal
+    outstanding_principal: Decimal
+    outstanding_balance: Decimal
+    snapshot_date: Optional[date] = None
+
+class CustomerExposure(BaseModel):
+    customer_id: UUID
+    monthly_income: Optional[Decimal]
+    active_loans: int
+    outstanding_balance: Decimal
+    monthly_obligation: Decimal
+    dti_ratio: Optional[Decimal]
+    overdue_amount: Decimal
+    overdue_installments: int
+    worst_days_overdue: int
+    next_due_date: Optional[date]
+
+class ExposureBatchRequest(BaseModel):
+    customer_ids: List[UUID] = Field(..., min_length=1, max_length=500)
+
+class LoanRestructure(BaseModel):
+    term_months: int = Field(..., gt=0, le=360)  # Cuotas del nuevo tramo
+    interest_rate: Optional[Decimal] = None  # Nueva tasa anual; por defecto la actual
+    grace_months: int = Field(0, ge=0, le=12)
+    capitalize_arrears: bool = False  # Sumar las cuotas vencidas impagas al nuevo capital
+    notes: Optional[str] = None
+
+class ScheduleHistoryItem(BaseModel):
+    schedule_id: UUID
+    installment_number: int
+    due_date: date
+    principal_amount: Decimal
+    interest_amount: Decimal
+    total_amount: Decimal
+    paid_amount: Optional[Decimal]
+    status: Optional[str]
+    schedule_version: int
+    superseded_by_version: int
+    superseded_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class QuoteInstallment(BaseModel):
+    installment_number: int
+    principal_amount: Decimal
+    interest_amount: Decimal
+    total_amount: Decimal
+    remaining_balance: Decimal
+
+class LoanQuote(BaseModel):
+    interest_rate: Decimal
+    term_months: int
+    first_installment: Decimal
+    last_installment: Decimal
+    total_interest: Decimal
+    total_amount: Decimal
+    schedule: Optional[List[QuoteInstallment]] = None  # Solo con include_schedule=true
+
+class QuoteGrid(BaseModel):
+    principal_amount: Decimal
+    method: str
+    quotes: List[LoanQuote]
+
+class CashflowAmounts(BaseModel):
+    scheduled: Decimal
+    expected: Decimal
+    installments: int
+
+class CashflowPeriod(CashflowAmounts):
+    period_start: date
+
+class CashflowForecast(BaseModel):
+    as_of: date
+    granularity: str
+    horizon: date
+    collection_rates: Dict[str, float]
+    overdue: CashflowAmounts
+    periods: List[CashflowPeriod]
+    total: CashflowAmounts
+
 class PaymentScheduleResponse(BaseModel):
     id: UUID
     installment_number: int
@@ -147,22 +269,104 @@ class LoanWithSchedule(BaseModel):
     status: str
     outstanding_balance: Decimal
     paid_amount: Decimal
+    next_due_date: Optional[date] = None
+    next_due_amount: Optional[Decimal] = None
+    overdue_count: Optional[int] = 0
+    overdue_amount: Optional[Decimal] = None
     payment_schedule: List[PaymentScheduleResponse] = []
     
     class Config:
         from_attributes = True
 
 class LoanRequestCreate(BaseModel):
-    principal_amount: Decimal
+    principal_amount: Decimal = Field(..., decimal_places=2)
     interest_rate: Decimal
-    term_months: int
+    term_months: int = Field(..., gt=0, le=360)
     disbursement_date: date
+    first_payment_date: Optional[date] = None
     interest_type: str = 'fixed'
 
+class PasswordSetup(BaseModel):
+    token: str  # Emitido por la importación masiva de clientes
+    password: str = Field(..., min_length=8)
+
 class CustomerRegister(BaseModel):
     dni: str
     full_name: str
     email: str
     phone: Optional[str] = None
     password: str
-    
\ No newline at end of file
+
+# Filas planas para la serialización rápida (TypeAdapter.dump_json sin pasar por modelos)
+class ScheduleRow(TypedDict):
+    id: UUID
+    installment_number: int
+    due_date: date
+    principal_amount: Money
+    interest_amount: Money
+    total_amount: Money
+    remaining_balance: Money
+    status: str
+
+class LoanRow(TypedDict):
+    customer_id: UUID
+    principal_amount: Money
+    interest_rate: Money
+    interest_type: str
+    term_months: int
+    amortization_method: Optional[str]
+    late_interest_rate: Optional[Money]
+    late_fee_amount: Optional[Money]
+    disbursement_date: date
+    first_payment_date: date
+    notes: Optional[str]
+    id: UUID
+    loan_number: Optional[str]
+    maturity_date: date
+    status: str
+    total_amount: Optional[Money]
+    total_interest: Optional[Money]
+    paid_amount: Optional[Money]
+    outstanding_balance: Optional[Money]
+    dti_ratio: Optional[Money]
+    next_due_date: Optional[date]
+    next_due_amount: Optional[Money]
+    overdue_count: Optional[int]
+    overdue_amount: Optional[Money]
+    last_payment_date: Optional[date]
+    version: Optional[int]
+    created_at: datetime
+    updated_at: datetime
+
+class LoanRowWithSchedule(LoanRow):
+    payment_schedule: List[ScheduleRow]
+
+class CustomerRow(TypedDict):
+    dni: str
+    full_name: str
+    phone: Optional[str]
+    email: Optional[str]
+    address: Optional[str]
+    monthly_income: Optional[Money]
+    employment_status: Optional[str]
+    employer_name: Optional[str]
+    credit_score: Optional[int]
+    id: UUID
+    is_active: Optional[bool]
+    created_at: datetime
+    updated_at: datetime
+
+class LoanWithScheduleRow(TypedDict):
+    id: UUID
+    loan_number: Optional[str]
+    principal_amount: Money
+    interest_rate: Money
+    term_months: int
+    status: str
+    outstanding_balance: Optional[Money]
+    paid_amount: Optional[Money]
+    next_due_date: Optional[date]
+    next_due_amount: Optional[Money]
+    overdue_count: Optional[int]
+    overdue_amount: Optional[Money]
+    payment_schedule: List[ScheduleRow]
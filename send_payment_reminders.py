@@ -0,0 +1,11 @@
+from config.database import SessionLocal
+from utils.notifications import generate_payment_reminders, dispatch_pending_notifications
+
+db = SessionLocal()
+
+try:
+    created = generate_payment_reminders(db, days_ahead=3)
+    result = dispatch_pending_notifications(db)
+    print(f"✅ Recordatorios creados: {created} - enviados: {result['sent']} - fallidos: {result['failed']}")
+finally:
+    db.close()
@@ -1,19 +1,16 @@
 from sqlalchemy.orm import Session
-from config.database import SessionLocal
+from utils.bootstrap import script_session
 from models.models import Customer
 from utils.security import get_password_hash
 
-db = SessionLocal()
+with script_session() as db:
+    # Buscar cliente por DNI o email
+    customer = db.query(Customer).filter(Customer.dni == "12345678").first()
 
-# Buscar cliente por DNI o email
-customer = db.query(Customer).filter(Customer.dni == "12345678").first()
-
-if customer:
-    customer.email = "juan@example.com"  # Asegúrate que tenga email
-    customer.password_hash = get_password_hash("123456")
-    db.commit()
-    print(f"✅ Cliente actualizado: {customer.full_name} - {customer.email}")
-else:
-    print("❌ Cliente no encontrado")
-
-db.close()
\ No newline at end of file
+    if customer:
+        customer.email = "juan@example.com"  # Asegúrate que tenga email
+        customer.password_hash = get_password_hash("123456")
+        db.commit()
+        print(f"✅ Cliente actualizado: {customer.full_name} - {customer.email}")
+    else:
+        print("❌ Cliente no encontrado")
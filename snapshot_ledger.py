@@ -0,0 +1,30 @@
+import sys
+from datetime import date
+from config.database import SessionLocal
+from utils.ledger import backfill_opening_entries, check_ledger_projection, take_balance_snapshots
+
+# Uso: python snapshot_ledger.py [--backfill] [AAAA-MM-DD]
+#      python snapshot_ledger.py --check   (pagos aprobados contra el libro mayor)
+db = SessionLocal()
+
+try:
+    if "--check" in sys.argv:
+        mismatched = check_ledger_projection(db)
+        if mismatched:
+            print(f"❌ Préstamos cuyos pagos aprobados no coinciden con el libro mayor: {len(mismatched)}")
+            for loan_id in mismatched:
+                print(f"   {loan_id}")
+            sys.exit(1)
+        print("✅ Los pagos aprobados coinciden con el libro mayor en todos los préstamos")
+        sys.exit(0)
+
+    if "--backfill" in sys.argv:
+        created = backfill_opening_entries(db)
+        print(f"✅ Movimientos de apertura: {created}")
+
+    dates = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    as_of = date.fromisoformat(dates[0]) if dates else None
+    created = take_balance_snapshots(db, as_of)
+    print(f"✅ Fotos de saldo creadas: {created}")
+finally:
+    db.close()
@@ -0,0 +1,50 @@
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("SCHEDULER_ENABLED", "false")
+
+import pytest
+from fastapi.testclient import TestClient
+
+from config.database import Base, SessionLocal, engine
+from models.models import Customer, User
+from utils.security import create_access_token
+
+
+@pytest.fixture
+def db():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client(db):
+    import main
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def admin_headers(db):
+    db.add(User(email="admin@test.com", password_hash="x", full_name="Admin", role="admin"))
+    db.commit()
+    token = create_access_token({"sub": "admin@test.com", "role": "admin"})
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def customer(db):
+    customer = Customer(dni="12345678", full_name="Cliente", email="cliente@test.com", monthly_income=3000)
+    db.add(customer)
+    db.commit()
+    return customer
+
+
+@pytest.fixture
+def customer_headers(customer):
+    token = create_access_token({"sub": customer.email, "role": "customer"})
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,39 @@
+"""
+Copia congelada del cálculo original del cronograma (routes/loans.py, con
+Decimal). Referencia de las pruebas de propiedad y del benchmark de dinero:
+no modificar.
+"""
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+
+
+def reference_payment_schedule(loan):
+    schedule = []
+    remaining_balance = loan.principal_amount
+    monthly_interest = loan.interest_rate / 100 / 12
+    fixed_principal = loan.principal_amount / loan.term_months
+
+    current_date = loan.first_payment_date
+
+    for i in range(1, loan.term_months + 1):
+        interest_amount = remaining_balance * monthly_interest
+        total_payment = fixed_principal + interest_amount
+        remaining_balance -= fixed_principal
+
+        if remaining_balance < 0.01:
+            remaining_balance = Decimal('0.00')
+
+        schedule.append({
+            'installment_number': i,
+            'due_date': current_date,
+            'principal_amount': round(fixed_principal, 2),
+            'interest_amount': round(interest_amount, 2),
+            'total_amount': round(total_payment, 2),
+            'remaining_balance': round(remaining_balance, 2),
+            'status': 'pending'
+        })
+
+        current_date = current_date + relativedelta(months=1)
+
+    return schedule
@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+from uuid import UUID
+
+from sqlalchemy import delete, update
+
+import utils.audit
+from models.models import Customer, PaymentSchedule
+from utils.delinquency import update_overdue_installments
+
+
+def test_bulk_statements_are_audited(client, db, admin_headers, customer, monkeypatch):
+    records = []
+    monkeypatch.setattr(utils.audit.audit_writer, "put", records.append)
+    first_due = date.today() + timedelta(days=10)
+    loan = client.post("/loans/", headers=admin_headers, json={
+        "customer_id": str(customer.id),
+        "principal_amount": "1000",
+        "interest_rate": "12",
+        "interest_type": "fixed",
+        "term_months": 6,
+        "disbursement_date": date.today().isoformat(),
+        "first_payment_date": first_due.isoformat(),
+    }).json()
+    loan_id = UUID(loan["id"])
+    first_id = db.query(PaymentSchedule.id).filter(
+        PaymentSchedule.loan_id == loan_id, PaymentSchedule.installment_number == 1
+    ).scalar()
+
+    records.clear()
+    update_overdue_installments(db, first_due + timedelta(days=5))
+    overdue = [r for r in records if r["entity_type"] == "payment_schedule"]
+    assert [(r["action"], r["entity_id"]) for r in overdue] == [("update", first_id)]
+    assert overdue[0]["old_data"] == {"days_overdue": 0} and overdue[0]["new_data"] == {"days_overdue": 5}
+    assert any(r["entity_type"] == "loan" and r["entity_id"] == loan_id for r in records)
+
+    # Sin cambios reales no hay registro; el borrado guarda la fila anterior
+    records.clear()
+    db.execute(update(Customer), [{"id": customer.id, "full_name": "Cliente"}])
+    db.execute(delete(PaymentSchedule).where(PaymentSchedule.id == first_id), execution_options={"synchronize_session": False})
+    db.commit()
+    assert [(r["action"], r["entity_id"]) for r in records] == [("delete", first_id)]
+    assert records[0]["old_data"]["installment_number"] == 1
+
+
+def test_rolled_back_savepoint_keeps_earlier_records(db, monkeypatch):
+    records = []
+    monkeypatch.setattr(utils.audit.audit_writer, "put", records.append)
+    utils.audit.install_audit_hooks()
+    db.add(Customer(dni="1", full_name="Uno"))
+    db.flush()
+    try:
+        with db.begin_nested():
+            db.add(Customer(dni="2", full_name="Dos"))
+            db.flush()
+            raise ValueError
+    except ValueError:
+        pass
+    db.commit()
+    assert [r["new_data"]["dni"] for r in records] == ["1"]
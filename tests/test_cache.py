@@ -0,0 +1,39 @@
+import json
+
+import utils.entity_cache
+from utils.cache import TTLCache
+from utils.entity_cache import LocalBackend, _collapse, invalidation_chunks
+
+
+def test_invalidation_chunks_fit_in_a_notify(monkeypatch):
+    monkeypatch.setattr(utils.entity_cache, "INVALIDATION_KEYS_MAX", 10_000)
+    keys = _collapse({("loan", f"{number:032x}") for number in range(2000)})
+    chunks = invalidation_chunks(keys)
+    assert len(chunks) > 1
+    assert sum(len(chunk) for chunk in chunks) == 2000
+    for chunk in chunks:
+        message = json.dumps({"topic": "cache", "type": "entities.invalidated", "data": {"keys": chunk}})
+        assert len(message.encode()) < 8000
+
+
+def test_many_keys_collapse_to_generation_bump():
+    pending = {("loan", str(number)) for number in range(1000)} | {("customer", "c1")}
+    assert _collapse(pending) == [("loan", None), ("customer", "c1")]
+
+
+def test_local_backend_keeps_live_versions():
+    backend = LocalBackend(max_entries=2)
+    for key in ("a", "b", "c"):
+        backend.set(key, key, ttl=60)
+        backend.incr(f"ver:{key}", ttl=60)
+    assert backend.get("a") is None and backend.get("c") == "c"
+    assert [backend.counter(f"ver:{key}") for key in ("a", "b", "c")] == [1, 1, 1]
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(ttl=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
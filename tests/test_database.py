@@ -0,0 +1,15 @@
+import pytest
+
+from config.database import pool_sizes
+
+
+def test_pool_sizes_discount_worker_extras():
+    pool_size, max_overflow = pool_sizes(30, 4, listen_connections=1, background_connections=3)
+    assert pool_size + max_overflow + 1 == 30 // 4
+
+
+def test_pool_sizes_raise_when_budget_is_too_small():
+    with pytest.raises(ValueError):
+        pool_sizes(30, 8, listen_connections=1, background_connections=3)
+    with pytest.raises(ValueError):
+        pool_sizes(2, 3)
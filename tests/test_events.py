@@ -0,0 +1,82 @@
+import asyncio
+import json
+from datetime import date, timedelta
+
+import utils.delinquency
+from utils.delinquency import update_overdue_installments
+from utils.events import EventHub, PostgresBroker
+from utils.security import create_access_token
+
+
+def test_overdue_event_only_on_transition(client, db, admin_headers, customer, monkeypatch):
+    first_due = date.today() + timedelta(days=10)
+    published = []
+    monkeypatch.setattr(utils.delinquency, "publish_event", lambda topic, event_type, data: published.append((event_type, data)))
+    loan = client.post("/loans/", headers=admin_headers, json={
+        "customer_id": str(customer.id),
+        "principal_amount": "1000",
+        "interest_rate": "12",
+        "interest_type": "fixed",
+        "term_months": 6,
+        "disbursement_date": date.today().isoformat(),
+        "first_payment_date": first_due.isoformat(),
+    }).json()
+
+    update_overdue_installments(db, first_due)
+    assert published == []
+
+    update_overdue_installments(db, first_due + timedelta(days=5))
+    assert [event_type for event_type, _ in published] == ["loan.overdue"]
+    assert str(published[0][1]["id"]) == loan["id"]
+    assert published[0][1]["overdue_count"] == 1
+
+    # Ya estaba en mora: otra cuota vencida no es una transición
+    update_overdue_installments(db, first_due + timedelta(days=40))
+    assert len(published) == 1
+
+
+def test_dropped_resets_when_subscriber_catches_up():
+    hub = EventHub(max_queue=2, max_dropped=3)
+    subscriber = hub.subscribe({"loans"})
+    message = json.dumps({"topic": "loans", "type": "loan.created", "data": {}})
+    for _ in range(5):
+        hub.dispatch(message)
+    assert subscriber.dropped == 3
+    assert not hub.is_lagging(subscriber)
+
+    while not subscriber.queue.empty():
+        subscriber.queue.get_nowait()
+    hub.dispatch(message)
+    assert subscriber.dropped == 0
+
+
+class FakeConnection:
+    def __init__(self):
+        self.sent = []
+
+    async def execute(self, query, channel, payload):
+        messages = payload if isinstance(payload, list) else [payload]
+        if any("bad" in message for message in messages):
+            raise ValueError("payload string too long")
+        self.sent += messages
+
+
+def test_flush_isolates_failing_message():
+    async def run():
+        broker = PostgresBroker("postgresql://test")
+        broker.connection = FakeConnection()
+        broker.send_lock = asyncio.Lock()
+        broker.pending = ["a", "bad", "c"]
+        await broker._flush()
+        return broker.connection.sent
+
+    assert asyncio.run(run()) == ["a", "c"]
+
+
+def test_receiver_ignores_messages_that_are_not_objects(client, admin_headers):
+    token = create_access_token({"sub": "admin@test.com", "role": "admin"})
+    with client.websocket_connect(f"/ws/events?token={token}&topics=payments") as websocket:
+        for raw in ("[1, 2]", '"loans"', "3", '{"action": "subscribe", "topics": "loans"}'):
+            websocket.send_text(raw)
+        websocket.send_text(json.dumps({"action": "subscribe", "topics": ["loans", {"x": 1}]}))
+        assert json.loads(websocket.receive_text()) == {"type": "subscriptions", "topics": ["loans", "payments"]}
@@ -0,0 +1,50 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from uuid import UUID
+
+from dateutil.relativedelta import relativedelta
+
+from models.models import Loan
+
+
+def test_balances_come_from_ledger_entries(client, db, admin_headers, customer):
+    today = date.today()
+    loan = client.post("/loans/", headers=admin_headers, json={
+        "customer_id": str(customer.id),
+        "principal_amount": "1200",
+        "interest_rate": "12",
+        "interest_type": "fixed",
+        "term_months": 6,
+        "disbursement_date": (today - relativedelta(months=3)).isoformat(),
+        "first_payment_date": (today - relativedelta(months=2)).isoformat(),
+    }).json()
+    assert Decimal(loan["outstanding_balance"]) == Decimal("1242.00")
+
+    response = client.post("/payments/admin", headers=admin_headers, json={
+        "loan_id": loan["id"],
+        "amount": "100.00",
+        "payment_date": f"{today - relativedelta(months=2)}T00:00:00",
+        "payment_method": "cash",
+    })
+    assert response.status_code == 201
+
+    # Registrar el pago no escribe saldos en la fila del préstamo
+    stored = db.query(Loan).filter(Loan.id == UUID(loan["id"])).one()
+    assert stored.legacy_paid_amount == Decimal("0.00")
+    assert stored.legacy_outstanding_balance is None
+    assert stored.paid_amount == Decimal("100.00")
+    assert stored.outstanding_balance == Decimal("1142.00")
+
+    response = client.post(f"/loans/{loan['id']}/restructure", headers=admin_headers, json={
+        "term_months": 6, "capitalize_arrears": True,
+    })
+    assert response.status_code == 200
+
+    # El capital pendiente anterior a la reprogramación no cambia con la capitalización
+    before = client.get(f"/loans/{loan['id']}/balance", headers=admin_headers, params={
+        "as_of": (today - timedelta(days=1)).isoformat(),
+    }).json()
+    after = client.get(f"/loans/{loan['id']}/balance", headers=admin_headers).json()
+    assert Decimal(before["principal_due"]) == Decimal("1200.00")
+    assert Decimal(after["principal_due"]) > Decimal("1200.00")
+    assert Decimal(after["outstanding_balance"]) == Decimal(response.json()["outstanding_balance"])
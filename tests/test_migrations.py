@@ -0,0 +1,39 @@
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+
+from config.database import engine
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+NEW_TABLES = (
+    "job_runs", "scheduler_locks", "loan_archives", "loan_ledger_entries",
+    "payment_schedule_history", "loan_number_counters",
+)
+
+
+def test_upgrade_brings_old_schema_to_models(db):
+    # Base creada antes de estos cambios (sin tablas, columnas ni índices nuevos)
+    with engine.begin() as conn:
+        for table in NEW_TABLES:
+            conn.execute(text(f"DROP TABLE {table}"))
+        for index in ("ix_schedule_status_due", "ix_payments_loan_created", "ix_notifications_schedule_type"):
+            conn.execute(text(f"DROP INDEX {index}"))
+        for column in ("schedule_mode", "overdue_count", "last_payment_date"):
+            conn.execute(text(f"ALTER TABLE loans DROP COLUMN {column}"))
+        conn.execute(text("DROP INDEX ux_snapshots_loan_as_of"))
+        conn.execute(text("ALTER TABLE loan_balance_snapshots DROP COLUMN total_due"))
+        conn.execute(text("CREATE UNIQUE INDEX ux_snapshots_loan_as_of ON loan_balance_snapshots (loan_id, as_of_date)"))
+
+    config = Config(ALEMBIC_INI)
+    command.stamp(config, "0001_baseline")
+    command.upgrade(config, "head")
+    # Falla si el esquema migrado difiere de los modelos
+    command.check(config)
+
+    assert set(NEW_TABLES) <= set(inspect(engine).get_table_names())
+    # La migración se puede revertir y volver a aplicar
+    command.downgrade(config, "0001_baseline")
+    command.upgrade(config, "head")
+    command.check(config)
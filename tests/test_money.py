@@ -0,0 +1,118 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from tests.reference_schedule import reference_payment_schedule
+from utils.amortization import _cached_factors, _installment_cents, calculate_payment_schedule, installment_totals
+from utils.money import HALF_EVEN, HALF_UP, from_cents, to_cents
+from utils.quotes import quote
+
+FIELDS = ('principal_amount', 'interest_amount', 'total_amount', 'remaining_balance')
+
+
+def random_loans(n_cases: int, seed: int = 2026):
+    rng = random.Random(seed)
+    for _ in range(n_cases):
+        yield SimpleNamespace(
+            principal_amount=rng.choice([
+                Decimal(rng.randint(1, 10_000_000)).scaleb(-2),
+                Decimal(rng.randint(1, 10_000_000)).scaleb(-2) * 100,
+                Decimal(rng.randint(1, 100_000)),
+                Decimal(rng.randint(1, 300)).scaleb(-2),
+            ]),
+            interest_rate=Decimal(rng.randint(0, 10_000)).scaleb(-2),
+            term_months=rng.choice([1, 3, 6, 12, 18, 24, 36, 48, 60, 120, 240, 360, rng.randint(1, 360)]),
+            first_payment_date=date(2024, 1, 1) + timedelta(days=rng.randint(0, 730)),
+        )
+
+
+def test_schedule_matches_reference():
+    for loan in random_loans(500):
+        expected = reference_payment_schedule(loan)
+        actual = calculate_payment_schedule(loan)
+        assert len(actual) == len(expected)
+        for old, new in zip(expected, actual):
+            assert old['due_date'] == new['due_date'], loan
+            for field in FIELDS:
+                assert old[field] == new[field], (loan, old, new, field)
+
+
+def test_installment_totals_match_schedule():
+    for loan in random_loans(200, seed=37):
+        expected = [(item['due_date'], to_cents(item['total_amount'])) for item in reference_payment_schedule(loan)]
+        assert installment_totals(
+            loan.principal_amount, loan.interest_rate, loan.term_months, loan.first_payment_date
+        ) == expected
+
+
+def test_installment_totals_share_cache_across_dates():
+    _installment_cents.cache_clear()
+    first = installment_totals(Decimal("1000"), Decimal("12"), 6, date(2024, 1, 31))
+    second = installment_totals(Decimal("1000.00"), Decimal("12.0"), 6, date(2024, 3, 15))
+    assert [cents for _, cents in first] == [cents for _, cents in second]
+    assert second[1][0] == date(2024, 4, 15)
+    info = _installment_cents.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
+
+
+def test_quote_scales_cached_factors():
+    _cached_factors.cache_clear()
+    for loan in random_loans(100, seed=45):
+        expected = reference_payment_schedule(loan)
+        result = quote(loan.principal_amount, loan.interest_rate, loan.term_months, include_schedule=True)
+        assert result["total_interest"] == sum(item['interest_amount'] for item in expected)
+        assert [item["total_amount"] for item in result["schedule"]] == [item['total_amount'] for item in expected]
+
+    _cached_factors.cache_clear()
+    quote(Decimal("1000.00"), Decimal("12"), 12)
+    quote(Decimal("2500.00"), Decimal("12.00"), 12, method="german")
+    info = _cached_factors.cache_info()
+    assert (info.misses, info.hits) == (1, 1)
+
+
+@pytest.mark.parametrize("value, cents", [
+    (Decimal("12.34"), 1234),
+    (Decimal("12.3"), 1230),
+    (Decimal("12.3400"), 1234),
+    ("0.01", 1),
+    (7, 700),
+    (None, 0),
+    (Decimal("-5.05"), -505),
+])
+def test_to_cents_exact(value, cents):
+    assert to_cents(value) == cents
+
+
+def test_to_cents_rejects_fractions_of_cent():
+    with pytest.raises(ValueError):
+        to_cents(Decimal("10.005"))
+
+
+def test_to_cents_explicit_rounding():
+    assert to_cents(Decimal("10.005"), HALF_EVEN) == 1000
+    assert to_cents(Decimal("10.015"), HALF_EVEN) == 1002
+    assert to_cents(Decimal("10.005"), HALF_UP) == 1001
+    assert from_cents(to_cents(Decimal("10.015"), HALF_UP)) == Decimal("10.02")
+
+
+def test_payment_with_fractions_of_cent_is_rejected(client, admin_headers, customer):
+    loan = client.post("/loans/", headers=admin_headers, json={
+        "customer_id": str(customer.id),
+        "principal_amount": "1000",
+        "interest_rate": "12",
+        "interest_type": "fixed",
+        "term_months": 6,
+        "disbursement_date": date.today().isoformat(),
+        "first_payment_date": (date.today() + timedelta(days=30)).isoformat(),
+    }).json()
+    response = client.post("/payments/admin", headers=admin_headers, json={
+        "loan_id": loan["id"],
+        "amount": "10.005",
+        "payment_date": "2026-02-01T00:00:00",
+        "payment_method": "cash",
+    })
+    assert response.status_code == 422
+    assert any(error["loc"][-1] == "amount" for error in response.json()["detail"])
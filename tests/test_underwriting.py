@@ -0,0 +1,33 @@
+from datetime import date
+from decimal import Decimal
+
+import utils.audit
+import utils.underwriting
+from models.models import Loan
+from utils.underwriting import underwrite_pending_loans
+
+
+def test_each_decision_is_audited_and_published(client, db, customer, monkeypatch):
+    records, published = [], []
+    monkeypatch.setattr(utils.audit.audit_writer, "put", records.append)
+    monkeypatch.setattr(utils.underwriting, "publish_event", lambda topic, event_type, data: published.append((event_type, data)))
+    customer.credit_score = 700
+    for number, term in (("SOL-1", 6), ("SOL-2", 0)):
+        db.add(Loan(
+            customer_id=customer.id, loan_number=number, principal_amount=Decimal("1000"), interest_rate=Decimal("12"),
+            interest_type="fixed", term_months=term, status="pending", disbursement_date=date(2026, 1, 1),
+            first_payment_date=date(2026, 2, 1), maturity_date=date(2026, 7, 1), total_amount=Decimal("1035"),
+        ))
+    db.commit()
+    records.clear()
+
+    assert underwrite_pending_loans(db) == {"approved": 1, "rejected": 0, "review": 1}
+
+    changed = {event["loan_number"]: event for event_type, event in published if event_type == "loan.status_changed"}
+    assert {number: event["status"] for number, event in changed.items()} == {"SOL-1": "approved", "SOL-2": "review"}
+    assert all(event["customer_id"] == customer.id and event["previous_status"] == "pending" for event in changed.values())
+
+    audited = {record["entity_id"]: record for record in records if record["entity_type"] == "loan"}
+    assert {changed[number]["id"] for number in changed} == set(audited)
+    assert all(record["old_data"]["status"] == "pending" for record in audited.values())
+    assert {record["new_data"]["status"] for record in audited.values()} == {"approved", "review"}
@@ -0,0 +1,33 @@
+import routes.loans
+from utils.virtual_schedule import VIRTUAL
+
+
+def test_pending_schedule_hides_paid_virtual_installment(client, admin_headers, customer, customer_headers, monkeypatch):
+    monkeypatch.setattr(routes.loans, "DEFAULT_SCHEDULE_MODE", VIRTUAL)
+    loan = client.post("/loans/", headers=admin_headers, json={
+        "customer_id": str(customer.id),
+        "principal_amount": "1000",
+        "interest_rate": "12",
+        "interest_type": "fixed",
+        "term_months": 3,
+        "disbursement_date": "2026-01-01",
+        "first_payment_date": "2026-02-01",
+    }).json()
+    first = loan["payment_schedule"][0]
+    response = client.post("/payments/admin", headers=admin_headers, json={
+        "loan_id": loan["id"],
+        "schedule_id": first["id"],
+        "amount": first["total_amount"],
+        "payment_date": "2026-02-01T00:00:00",
+        "payment_method": "cash",
+    })
+    assert response.status_code == 201, response.text
+
+    staff = client.get("/loans/?fields=id&include=schedule.pending", headers=admin_headers).json()
+    portal = client.get("/customer-portal/loans?fields=id&include=schedule.pending", headers=customer_headers).json()
+    for loans in (staff, portal):
+        numbers = [item["installment_number"] for item in loans[0]["payment_schedule"]]
+        assert numbers == [2, 3]
+
+    full = client.get("/loans/?fields=id&include=schedule", headers=admin_headers).json()
+    assert [item["status"] for item in full[0]["payment_schedule"]] == ["paid", "pending", "pending"]
@@ -0,0 +1,175 @@
+import os
+from calendar import monthrange
+from datetime import date
+from decimal import Decimal, getcontext
+from functools import lru_cache
+from models.models import Loan
+from utils.money import div_round, from_cents, to_cents
+
+# Factores por (tasa, plazo, método) en memoria: cada entrada guarda dos enteros por cuota
+AMORTIZATION_CACHE_SIZE = int(os.getenv("AMORTIZATION_CACHE_SIZE", 512))
+# Totales por cuota por (monto, tasa, plazo): los préstamos virtuales con mismas condiciones comparten entrada
+INSTALLMENT_CACHE_SIZE = int(os.getenv("INSTALLMENT_CACHE_SIZE", 2048))
+# El alemán es el mismo método de capital fijo
+FIXED_CAPITAL_METHODS = ("fixed_capital", "german")
+
+
+def add_one_month(current: date) -> date:
+    """Equivale a current + relativedelta(months=1) (ajusta al último día del mes)."""
+    year, month = (current.year + 1, 1) if current.month == 12 else (current.year, current.month + 1)
+    return date(year, month, min(current.day, monthrange(year, month)[1]))
+
+
+def amortization_factors(interest_rate, term_months: int) -> tuple:
+    """
+    Parte del cálculo de capital fijo que no depende del monto, por (tasa,
+    plazo): denominador común D y, por cuota, los multiplicadores del interés
+    y del total. El monto exacto en centavos es capital_centavos * m / D.
+    Incluye la tasa mensual Decimal del cálculo histórico para los empates.
+    """
+    rate = Decimal(interest_rate)
+    rn, rd = rate.as_integer_ratio()
+    base = 1200 * rd
+    weights = tuple(
+        ((term_months - i) * rn, base + (term_months - i) * rn) for i in range(term_months)
+    )
+    return base * term_months, weights, rate / 100 / 12
+
+
+def cached_amortization_factors(interest_rate, term_months: int, method: str = "fixed_capital") -> tuple:
+    """
+    amortization_factors con caché acotada. La clave se normaliza: la tasa
+    por su valor exacto (12 y 12.00 comparten entrada) y los alias del
+    método de capital fijo al mismo nombre.
+    """
+    if method not in FIXED_CAPITAL_METHODS:
+        raise ValueError(f"Método de amortización no soportado: {method}")
+    return _cached_factors(Decimal(interest_rate).normalize(), int(term_months), "fixed_capital")
+
+
+@lru_cache(maxsize=AMORTIZATION_CACHE_SIZE)
+def _cached_factors(interest_rate: Decimal, term_months: int, method: str) -> tuple:
+    return amortization_factors(interest_rate, term_months)
+
+
+def schedule_cents(principal_amount, factors: tuple) -> list:
+    """
+    Montos de cada cuota en centavos enteros: (capital, interés, total, saldo),
+    cada uno redondeado una vez con HALF_EVEN.
+
+    Los resultados son los del cálculo histórico con Decimal (28 dígitos):
+    - el saldo se arrastra restando la cuota de capital, como Decimal, con
+      enteros a la escala de esa cuota (y su redondeo a 28 dígitos);
+    - interés y total salen exactos de los factores; solo si el valor exacto
+      cae justo en medio centavo se calcula ese monto con Decimal, porque ahí
+      el resultado histórico depende de su redondeo interno.
+    """
+    denominator, weights, monthly_interest = factors
+    term_months = len(weights)
+    principal_cents = to_cents(principal_amount)
+    precision = getcontext().prec
+
+    # Cuota de capital tal como la calcula Decimal, en enteros a su escala
+    fixed = Decimal(principal_amount) / term_months
+    exponent = min(fixed.as_tuple().exponent, Decimal(principal_amount).as_tuple().exponent)
+    scale = max(-exponent, 2)
+    cent = 10 ** (scale - 2)
+    fixed_scaled = int(fixed.scaleb(scale))
+    balance = principal_cents * cent
+    # Saldos con más de `precision` dígitos de coeficiente se redondean
+    limit = 10 ** (precision + scale + exponent)
+
+    # El histórico compara el saldo con el float 0.01 (apenas mayor a un
+    # centavo): saldo < 0.01 equivale a saldo * den < num * 10**scale
+    threshold_num, threshold_den = (0.01).as_integer_ratio()
+    threshold = threshold_num * 10 ** scale
+
+    fixed_cents = div_round(fixed_scaled, cent)
+    amounts = []
+    cleared = False  # saldo anterior menor a 0.01 (se lleva a cero)
+    for interest_weight, total_weight in weights:
+        if cleared:
+            interest_cents = 0
+            total_cents = fixed_cents
+        else:
+            interest_cents, interest_tie = _round_exact(principal_cents * interest_weight, denominator)
+            total_cents, total_tie = _round_exact(principal_cents * total_weight, denominator)
+            if interest_tie or total_tie:
+                interest = Decimal(balance).scaleb(-scale) * monthly_interest
+                interest_cents = to_cents(round(interest, 2))
+                total_cents = to_cents(round(fixed + interest, 2))
+
+        balance -= fixed_scaled
+        if abs(balance) >= limit:
+            quantum = 10
+            while abs(balance) >= limit * quantum:
+                quantum *= 10
+            balance = div_round(balance, quantum) * quantum
+        if balance * threshold_den < threshold:
+            cleared = True
+            balance = 0
+
+        amounts.append((fixed_cents, interest_cents, total_cents, div_round(balance, cent)))
+    return amounts
+
+
+def _round_exact(numerator: int, denominator: int) -> tuple:
+    """(centavos redondeados HALF_EVEN, True si el valor exacto es x.5)."""
+    quotient, remainder = divmod(numerator, denominator)
+    twice = 2 * remainder
+    if twice < denominator:
+        return quotient, False
+    if twice > denominator:
+        return quotient + 1, False
+    return quotient + (quotient & 1), True
+
+
+def schedule_amounts(principal_amount, interest_rate, term_months: int) -> list:
+    """Montos del cronograma como Decimal (capital, interés, total, saldo) por cuota."""
+    return [
+        tuple(from_cents(cents) for cents in item)
+        for item in schedule_cents(principal_amount, amortization_factors(interest_rate, term_months))
+    ]
+
+
+def calculate_payment_schedule(loan: Loan):
+    """Calcula el cronograma de pagos con método de capital fijo"""
+    schedule = []
+    current_date = loan.first_payment_date
+    amounts = schedule_amounts(loan.principal_amount, loan.interest_rate, loan.term_months)
+
+    for i, (principal_amount, interest_amount, total_amount, remaining_balance) in enumerate(amounts, start=1):
+        schedule.append({
+            'installment_number': i,
+            'due_date': current_date,
+            'principal_amount': principal_amount,
+            'interest_amount': interest_amount,
+            'total_amount': total_amount,
+            'remaining_balance': remaining_balance,
+            'status': 'pending'
+        })
+
+        current_date = add_one_month(current_date)
+
+    return schedule
+
+
+def installment_totals(principal_amount, interest_rate, term_months: int, first_payment_date: date) -> list:
+    """
+    (vencimiento, total en centavos) de cada cuota, sin armar el cronograma
+    completo. Mismos montos y fechas que calculate_payment_schedule. Los
+    montos salen de una caché acotada sobre los factores en caché; las
+    fechas dependen solo del primer vencimiento y se arman aparte.
+    """
+    installments = []
+    due_date = first_payment_date
+    for total_cents in _installment_cents(to_cents(principal_amount), Decimal(interest_rate).normalize(), int(term_months)):
+        installments.append((due_date, total_cents))
+        due_date = add_one_month(due_date)
+    return installments
+
+
+@lru_cache(maxsize=INSTALLMENT_CACHE_SIZE)
+def _installment_cents(principal_cents: int, interest_rate: Decimal, term_months: int) -> tuple:
+    factors = cached_amortization_factors(interest_rate, term_months)
+    return tuple(item[2] for item in schedule_cents(from_cents(principal_cents), factors))
@@ -0,0 +1,201 @@
+import gzip
+import hashlib
+import json
+import os
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import delete, insert, or_, select
+from sqlalchemy.orm import Session
+
+from models.models import (
+    LedgerEntry, Loan, LoanArchive, LoanBalanceSnapshot, Notification, Payment, PaymentSchedule,
+    PaymentScheduleHistory
+)
+from schemas.schemas import LoanWithSchedule, PaymentScheduleResponse
+from utils.events import loan_event_data, publish_event
+from utils.virtual_schedule import derive_installments, is_virtual
+
+# Meses desde el último pago para archivar un préstamo cancelado
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", 12))
+
+# Orden de copia; al borrar se recorre al revés (primero los que referencian)
+ARCHIVED_MODELS = (
+    Loan, PaymentSchedule, PaymentScheduleHistory, Payment, LedgerEntry, LoanBalanceSnapshot, Notification
+)
+
+
+def _default(value):
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value)}")
+
+
+def _loan_column(model):
+    return model.id if model is Loan else model.loan_id
+
+
+def encode_archive(rows: list) -> tuple:
+    """Filas (tabla, dict) -> (NDJSON comprimido, sha256 del NDJSON)."""
+    ndjson = "".join(
+        json.dumps({"table": table, "row": row}, default=_default, separators=(",", ":")) + "\n"
+        for table, row in rows
+    ).encode("utf-8")
+    return gzip.compress(ndjson), hashlib.sha256(ndjson).hexdigest()
+
+
+def decode_archive(payload: bytes, checksum: str = None) -> list:
+    ndjson = gzip.decompress(payload)
+    if checksum is not None and hashlib.sha256(ndjson).hexdigest() != checksum:
+        raise ValueError("Checksum del archivo no coincide")
+    return [json.loads(line) for line in ndjson.splitlines()]
+
+
+def closed_loans_query(cutoff: date):
+    """Préstamos sin saldo ni cuotas pendientes cuyo último pago es anterior al corte."""
+    return select(
+        Loan.id, Loan.customer_id, Loan.loan_number, Loan.status, Loan.outstanding_balance, Loan.last_payment_date
+    ).where(
+        Loan.outstanding_balance <= 0,
+        Loan.next_due_date.is_(None),
+        Loan.last_payment_date < cutoff,
+    )
+
+
+def _copy_rows(db: Session, loan_ids: list) -> dict:
+    """
+    Una consulta por tabla para todo el lote; filas agrupadas por préstamo.
+    La fila del préstamo guarda los saldos del libro mayor en sus columnas
+    paid_amount/outstanding_balance: sus movimientos dejan las tablas activas.
+    """
+    balances = {
+        row.id: row for row in db.execute(
+            select(Loan.id, Loan.paid_amount, Loan.outstanding_balance).where(Loan.id.in_(loan_ids))
+        )
+    }
+    rows = {loan_id: [] for loan_id in loan_ids}
+    for model in ARCHIVED_MODELS:
+        table = model.__table__
+        for row in db.execute(select(table).where(_loan_column(model).in_(loan_ids))).mappings():
+            loan_id = row["id"] if model is Loan else row["loan_id"]
+            row = dict(row)
+            if model is Loan:
+                row["paid_amount"] = balances[loan_id].paid_amount
+                row["outstanding_balance"] = balances[loan_id].outstanding_balance
+            rows[loan_id].append((table.name, row))
+    return rows
+
+
+def archive_closed_loans(db: Session, months: int = None, batch_size: int = 200, today: date = None) -> int:
+    """
+    Mueve a loan_archives los préstamos cancelados hace más de `months`
+    meses. Por lote: copia masiva, verificación del archivo guardado
+    (checksum y cantidad de filas) y borrado de las tablas activas, todo en
+    la misma transacción. Cada préstamo archivado se publica como
+    loan.archived al confirmar su lote.
+    """
+    months = ARCHIVE_AFTER_MONTHS if months is None else months
+    cutoff = (today or date.today()) - relativedelta(months=months)
+    archived = 0
+
+    while True:
+        loans = db.execute(closed_loans_query(cutoff).order_by(Loan.id).limit(batch_size)).all()
+        if not loans:
+            break
+        loan_ids = [loan.id for loan in loans]
+        rows = _copy_rows(db, loan_ids)
+
+        archives = []
+        for loan in loans:
+            payload, checksum = encode_archive(rows[loan.id])
+            archives.append({
+                "loan_id": loan.id,
+                "customer_id": loan.customer_id,
+                "loan_number": loan.loan_number,
+                "closed_on": loan.last_payment_date,
+                "format": "ndjson+gzip",
+                "payload": payload,
+                "checksum": checksum,
+                "row_count": len(rows[loan.id]),
+                "archived_at": datetime.utcnow(),
+            })
+        db.execute(insert(LoanArchive), archives)
+
+        # Verificar lo que quedó guardado antes de borrar nada
+        stored = db.execute(
+            select(LoanArchive.loan_id, LoanArchive.payload, LoanArchive.checksum).where(LoanArchive.loan_id.in_(loan_ids))
+        ).all()
+        for archive in stored:
+            if len(decode_archive(archive.payload, archive.checksum)) != len(rows[archive.loan_id]):
+                db.rollback()
+                raise ValueError(f"Archivo incompleto para el préstamo {archive.loan_id}")
+        if len(stored) != len(loan_ids):
+            db.rollback()
+            raise ValueError("No se guardaron todos los archivos del lote")
+
+        schedule_ids = select(PaymentSchedule.id).where(PaymentSchedule.loan_id.in_(loan_ids))
+        db.execute(
+            delete(Notification).where(or_(Notification.loan_id.in_(loan_ids), Notification.schedule_id.in_(schedule_ids))),
+            execution_options={"synchronize_session": False}
+        )
+        for model in reversed(ARCHIVED_MODELS[:-1]):
+            db.execute(
+                delete(model).where(_loan_column(model).in_(loan_ids)),
+                execution_options={"synchronize_session": False}
+            )
+        db.commit()
+        archived += len(loans)
+        for loan in loans:
+            publish_event("loans", "loan.archived", loan_event_data(loan))
+
+        if len(loans) < batch_size:
+            break
+
+    print(f"Préstamos archivados: {archived} (cancelados antes de {cutoff})")
+    return archived
+
+
+def _restore(model, row: dict) -> dict:
+    """Convierte los valores del JSON a los tipos de las columnas."""
+    restored = {}
+    for column in model.__table__.columns:
+        value = row.get(column.name)
+        if value is not None:
+            python_type = column.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+            elif python_type in (Decimal, uuid.UUID):
+                value = python_type(value)
+        restored[column.key] = value
+    return restored
+
+
+def load_archived_loan(db: Session, loan_id):
+    """LoanWithSchedule de un préstamo archivado, o None si no existe."""
+    archive = db.get(LoanArchive, loan_id)
+    if archive is None:
+        return None
+
+    loan = None
+    schedules = []
+    for item in decode_archive(archive.payload, archive.checksum):
+        if item["table"] == Loan.__tablename__:
+            # paid_amount/outstanding_balance: saldos del libro mayor al archivar (ver _copy_rows)
+            loan = Loan(**_restore(Loan, item["row"]))
+        elif item["table"] == PaymentSchedule.__tablename__:
+            schedules.append(PaymentSchedule(**_restore(PaymentSchedule, item["row"])))
+    schedules.sort(key=lambda item: item.installment_number)
+
+    if is_virtual(loan):
+        overrides = {item.installment_number: item for item in schedules}
+        schedules = [overrides.get(item.installment_number, item) for item in derive_installments(loan)]
+
+    response = LoanWithSchedule.model_validate(loan)
+    response.payment_schedule = [PaymentScheduleResponse.model_validate(item) for item in schedules]
+    return response
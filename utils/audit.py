@@ -0,0 +1,301 @@
+import os
+import queue
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import event, insert, inspect, select, true
+from sqlalchemy.orm import Session
+
+from config.database import engine
+from models.models import AuditLog, Customer, Loan, Payment, PaymentSchedule
+
+AUDITED_ENTITIES = {
+    Customer: "customer",
+    Loan: "loan",
+    Payment: "payment",
+    PaymentSchedule: "payment_schedule",
+}
+
+# Columnas que no aportan al diff
+IGNORED_COLUMNS = {"created_at", "updated_at", "password_hash"}
+
+# Contexto de la petición actual (ip, user agent, usuario). Se guarda un dict
+# mutable para que get_current_user pueda completarlo desde el threadpool.
+audit_context: ContextVar = ContextVar("audit_context", default=None)
+
+
+def set_request_context(ip_address: str = None, user_agent: str = None) -> dict:
+    context = {"ip_address": ip_address, "user_agent": user_agent, "user_id": None}
+    audit_context.set(context)
+    return context
+
+
+def set_current_user_id(user_id):
+    context = audit_context.get()
+    if context is not None:
+        context["user_id"] = user_id
+
+
+def _to_json(value):
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+# -----------------------------------------------------------
+# ESCRITOR EN SEGUNDO PLANO (INSERTS MULTI-FILA)
+# -----------------------------------------------------------
+class AuditWriter:
+    """
+    Cola en memoria con un hilo que la vacía con INSERTs multi-fila.
+    La cola es acotada: si se llena se descartan registros (y se cuentan)
+    en lugar de bloquear la petición.
+    """
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 500, flush_interval: float = 1.0):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        # Vaciar lo que quede en la cola antes de apagar
+        self.flush()
+
+    def put(self, record: dict):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f"⚠️ Cola de auditoría llena, registros descartados: {self.dropped}")
+
+    def _drain(self) -> list:
+        records = []
+        while len(records) < self.batch_size:
+            try:
+                records.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return records
+
+    def _write(self, records: list):
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(AuditLog), records)
+        except Exception as e:
+            print(f"Error escribiendo auditoría ({len(records)} registros): {str(e)}")
+
+    def flush(self):
+        while True:
+            records = self._drain()
+            if not records:
+                break
+            self._write(records)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            records = [first] + self._drain()
+            self._write(records)
+
+
+audit_writer = AuditWriter(
+    max_queue=int(os.getenv("AUDIT_MAX_QUEUE", 10000)),
+    batch_size=int(os.getenv("AUDIT_BATCH_SIZE", 500)),
+)
+
+
+# -----------------------------------------------------------
+# CAPTURA DE CAMBIOS EN LA SESIÓN ORM
+# -----------------------------------------------------------
+def _snapshot(obj) -> dict:
+    state = inspect(obj)
+    return {
+        attr.key: _to_json(attr.value)
+        for attr in state.attrs
+        if attr.key in state.mapper.columns and attr.key not in IGNORED_COLUMNS
+    }
+
+
+def _diff(obj):
+    state = inspect(obj)
+    old_data, new_data = {}, {}
+    for attr in state.attrs:
+        if attr.key not in state.mapper.columns or attr.key in IGNORED_COLUMNS:
+            continue
+        history = attr.history
+        if not history.has_changes():
+            continue
+        old_data[attr.key] = _to_json(history.deleted[0]) if history.deleted else None
+        new_data[attr.key] = _to_json(history.added[0]) if history.added else None
+    return old_data, new_data
+
+
+def _record(action: str, entity_type: str, entity_id, old_data, new_data) -> dict:
+    context = audit_context.get() or {}
+    return {
+        "id": uuid.uuid4(),
+        "user_id": context.get("user_id"),
+        "action": action,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "old_data": old_data,
+        "new_data": new_data,
+        "ip_address": context.get("ip_address"),
+        "user_agent": context.get("user_agent"),
+        "created_at": datetime.utcnow(),
+    }
+
+
+def _after_flush(session, flush_context):
+    records = []
+    for obj in session.new:
+        if type(obj) in AUDITED_ENTITIES:
+            records.append(_record("create", AUDITED_ENTITIES[type(obj)], obj.id, None, _snapshot(obj)))
+    for obj in session.dirty:
+        if type(obj) in AUDITED_ENTITIES and session.is_modified(obj, include_collections=False):
+            old_data, new_data = _diff(obj)
+            if new_data:
+                records.append(_record("update", AUDITED_ENTITIES[type(obj)], obj.id, old_data, new_data))
+    for obj in session.deleted:
+        if type(obj) in AUDITED_ENTITIES:
+            records.append(_record("delete", AUDITED_ENTITIES[type(obj)], obj.id, _snapshot(obj), None))
+
+    # Se encolan al confirmar la transacción; si hay rollback se descartan
+    session.info.setdefault("audit_pending", []).extend(records)
+
+
+# -----------------------------------------------------------
+# CAPTURA DE SENTENCIAS POR LOTES (NO PASAN POR EL FLUSH)
+# -----------------------------------------------------------
+def _table_columns(mapper) -> dict:
+    """Atributos mapeados a columnas de la tabla (sin expresiones como los saldos del libro mayor)."""
+    return {
+        prop.key: prop.columns[0]
+        for prop in mapper.column_attrs
+        if getattr(prop.columns[0], "table", None) is mapper.local_table and prop.key not in IGNORED_COLUMNS
+    }
+
+
+def _current_rows(session, mapper, criteria) -> dict:
+    """Filas que cumplen el criterio, por id, leídas en la misma transacción."""
+    columns = _table_columns(mapper)
+    query = select(*[column.label(key) for key, column in columns.items()]).where(criteria)
+    return {
+        row["id"]: {key: _to_json(value) for key, value in row.items()}
+        for row in session.connection().execute(query).mappings()
+    }
+
+
+def _do_orm_execute(state):
+    """
+    insert/update/delete por lotes sobre entidades auditadas: se registra
+    una fila de auditoría por registro afectado, igual que en el flush.
+    Para update y delete se leen las filas antes (y después) de ejecutar
+    la sentencia; los INSERT se auditan con los valores enviados, que en
+    este código siempre incluyen el id.
+    """
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return None
+    mapper = state.bind_mapper
+    if mapper is None or mapper.class_ not in AUDITED_ENTITIES:
+        return None
+    entity_type = AUDITED_ENTITIES[mapper.class_]
+    params = state.parameters
+    rows = params if isinstance(params, list) else [params] if params else []
+
+    records = []
+    if state.is_insert:
+        result = state.invoke_statement()
+        for row in rows:
+            if row.get("id") is not None:
+                new_data = {key: _to_json(value) for key, value in row.items() if key not in IGNORED_COLUMNS}
+                records.append(_record("create", entity_type, row["id"], None, new_data))
+    else:
+        id_column = mapper.local_table.c.id
+        if rows:
+            # UPDATE por lotes por clave primaria
+            criteria = id_column.in_([row["id"] for row in rows])
+        else:
+            criteria = state.statement.whereclause if state.statement.whereclause is not None else true()
+        before = _current_rows(state.session, mapper, criteria)
+        result = state.invoke_statement()
+        if state.is_delete:
+            records = [_record("delete", entity_type, entity_id, old, None) for entity_id, old in before.items()]
+        elif before:
+            after = _current_rows(state.session, mapper, id_column.in_(list(before)))
+            for entity_id, old in before.items():
+                new = after.get(entity_id, {})
+                changed = [key for key in new if new[key] != old.get(key)]
+                if changed:
+                    records.append(_record(
+                        "update", entity_type, entity_id,
+                        {key: old.get(key) for key in changed}, {key: new[key] for key in changed},
+                    ))
+
+    state.session.info.setdefault("audit_pending", []).extend(records)
+    return result
+
+
+def _after_transaction_create(session, transaction):
+    # Si se deshace un SAVEPOINT solo se descartan los registros posteriores a él
+    if transaction.nested:
+        marks = session.info.setdefault("audit_savepoints", {})
+        marks[transaction] = len(session.info.get("audit_pending", []))
+
+
+def _after_commit(session):
+    session.info.pop("audit_savepoints", None)
+    for record in session.info.pop("audit_pending", []):
+        audit_writer.put(record)
+
+
+def _after_soft_rollback(session, previous_transaction):
+    if previous_transaction.nested:
+        mark = session.info.get("audit_savepoints", {}).pop(previous_transaction, None)
+        if mark is not None:
+            del session.info.get("audit_pending", [])[mark:]
+        return
+    session.info.pop("audit_savepoints", None)
+    session.info.pop("audit_pending", None)
+
+
+def _track_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+def install_audit_hooks():
+    if event.contains(Session, "after_flush", _after_flush):
+        return
+    # active_history carga el valor previo aunque el atributo esté expirado,
+    # así el diff tiene old_data real después de un commit
+    for cls in AUDITED_ENTITIES:
+        for column in inspect(cls).columns:
+            if column.key not in IGNORED_COLUMNS:
+                event.listen(getattr(cls, column.key), "set", _track_old_value, active_history=True, retval=True)
+    event.listen(Session, "after_flush", _after_flush)
+    event.listen(Session, "do_orm_execute", _do_orm_execute)
+    event.listen(Session, "after_transaction_create", _after_transaction_create)
+    event.listen(Session, "after_commit", _after_commit)
+    event.listen(Session, "after_soft_rollback", _after_soft_rollback)
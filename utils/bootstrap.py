@@ -0,0 +1,23 @@
+from contextlib import contextmanager
+
+from config.database import SessionLocal
+import utils.entity_cache  # noqa: F401 - registra en la sesión la invalidación de la caché de lectura
+from utils.audit import audit_writer, install_audit_hooks
+
+
+@contextmanager
+def script_session():
+    """
+    Sesión para los scripts de línea de comandos, con los mismos ganchos de
+    sesión que la API: al confirmar se invalida la caché de lectura (y se
+    avisa a los workers) y los cambios quedan en la auditoría. La cola de
+    auditoría se vacía al salir.
+    """
+    install_audit_hooks()
+    audit_writer.start()
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        audit_writer.stop()
@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Caché en memoria del proceso con vencimiento por tiempo y tamaño acotado
+    (LRU: al llenarse se descartan las menos usadas). Segura entre hilos (las
+    rutas síncronas corren en el threadpool).
+
+    evict_live=False nunca descarta entradas vigentes por tamaño: al pasar
+    max_entries solo se purgan las vencidas (contadores de versión que no se
+    pueden perder antes de tiempo).
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1000, evict_live: bool = True):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evict_live = evict_live
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _live(self, key, now: float):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] < now:
+            del self._data[key]
+            return None
+        return entry
+
+    def _evict(self, now: float):
+        if len(self._data) <= self.max_entries:
+            return
+        if self.evict_live:
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        else:
+            self._data = OrderedDict((key, entry) for key, entry in self._data.items() if entry[0] >= now)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            now = time.monotonic()
+            self._data[key] = (now + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            self._evict(now)
+
+    def incr(self, key, ttl: float = None) -> int:
+        """Suma 1 a un contador (0 si no existe o venció) y renueva su vencimiento."""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._live(key, now)
+            value = (entry[1] if entry else 0) + 1
+            self._data[key] = (now + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            self._evict(now)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def values(self) -> list:
+        """Valores vigentes (copia: se pueden recorrer sin el lock)."""
+        with self._lock:
+            now = time.monotonic()
+            return [value for expires, value in self._data.values() if expires >= now]
+
+    def clear(self, *_):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,344 @@
+import os
+import threading
+import uuid
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from models.models import Loan, PaymentSchedule
+from utils.amortization import installment_totals
+from utils.cache import TTLCache
+from utils.events import event_hub
+from utils.money import from_cents, to_cents
+from utils.virtual_schedule import VIRTUAL
+
+ACTIVE_STATUSES = ("active", "approved")
+
+WEEK = "week"
+MONTH = "month"
+
+# Tramos de mora según las cuotas vencidas actuales del préstamo
+BANDS = ("current", "1", "2", "3+")
+
+# Cuotas vencidas hace menos de estos días aún pueden cobrarse: no entran al histórico
+GRACE_DAYS = int(os.getenv("CASHFLOW_GRACE_DAYS", 30))
+LOOKBACK_MONTHS = int(os.getenv("CASHFLOW_LOOKBACK_MONTHS", 12))
+
+CACHE_TTL = float(os.getenv("CASHFLOW_CACHE_TTL", 900))
+
+# Resultado final por (granularidad, meses, día): armarlo desde las partes es barato
+cashflow_cache = TTLCache(ttl=CACHE_TTL, max_entries=16)
+# Agregado SQL de las cuotas guardadas por horizonte (StoredAmounts, se actualiza por fecha)
+stored_cache = TTLCache(ttl=CACHE_TTL, max_entries=4)
+# Aporte de las cuotas derivadas por horizonte (VirtualAmounts, se actualiza por préstamo)
+virtual_cache = TTLCache(ttl=CACHE_TTL, max_entries=4)
+# Las tasas salen del histórico y cambian despacio: no se invalidan con cada pago
+rates_cache = TTLCache(ttl=float(os.getenv("CASHFLOW_RATES_TTL", 6 * 3600)), max_entries=4)
+
+
+def _band():
+    return case(
+        (func.coalesce(Loan.overdue_count, 0) == 0, "current"),
+        (Loan.overdue_count == 1, "1"),
+        (Loan.overdue_count == 2, "2"),
+        else_="3+",
+    ).label("band")
+
+
+def _band_of(overdue_count) -> str:
+    overdue_count = overdue_count or 0
+    return BANDS[min(overdue_count, 3)]
+
+
+def collection_rates(db: Session, today: date) -> dict:
+    """
+    Probabilidad de cobro por tramo de mora: monto cobrado / monto exigible de
+    las cuotas que vencieron en la ventana histórica. Una sola consulta
+    agregada para toda la cartera.
+    """
+    cached = rates_cache.get(today)
+    if cached is not None:
+        return cached
+
+    since = today - relativedelta(months=LOOKBACK_MONTHS)
+    until = today - timedelta(days=GRACE_DAYS)
+    band = _band()
+    paid_amount = func.coalesce(PaymentSchedule.paid_amount, 0)
+    paid = case((paid_amount > PaymentSchedule.total_amount, PaymentSchedule.total_amount), else_=paid_amount)
+    rows = db.execute(
+        select(band, func.sum(PaymentSchedule.total_amount).label("due"), func.sum(paid).label("paid"))
+        .join(Loan, Loan.id == PaymentSchedule.loan_id)
+        .where(PaymentSchedule.due_date >= since, PaymentSchedule.due_date < until)
+        .group_by(band)
+    ).all()
+
+    due_total = sum(float(row.due or 0) for row in rows)
+    paid_total = sum(float(row.paid or 0) for row in rows)
+    # Sin historia en un tramo se usa la tasa global (o 1 si no hay nada)
+    overall = paid_total / due_total if due_total else 1.0
+    rates = {name: overall for name in BANDS}
+    for row in rows:
+        if row.due:
+            rates[row.band] = float(row.paid or 0) / float(row.due)
+    rates_cache.set(today, rates)
+    return rates
+
+
+class StoredAmounts:
+    """
+    Cuotas guardadas impagas hasta un horizonte, agregadas en la base por
+    (vencimiento, tramo). Un préstamo solo aporta a sus propias fechas de
+    vencimiento: tras un evento se vuelven a agregar en SQL solo esas
+    fechas, que reemplazan por completo a las anteriores.
+    """
+
+    def __init__(self, horizon: date):
+        self.horizon = horizon
+        self.totals = {}
+        self.stale = set()
+        self.lock = threading.Lock()
+
+    def _aggregate(self, db: Session, due_dates=None) -> list:
+        band = _band()
+        pending = PaymentSchedule.total_amount - func.coalesce(PaymentSchedule.paid_amount, 0)
+        query = (
+            select(
+                PaymentSchedule.due_date,
+                band,
+                func.sum(pending).label("amount"),
+                func.count().label("installments"),
+            )
+            .join(Loan, Loan.id == PaymentSchedule.loan_id)
+            .where(
+                PaymentSchedule.status != 'paid',
+                PaymentSchedule.due_date < self.horizon,
+                Loan.status.in_(ACTIVE_STATUSES),
+            )
+            .group_by(PaymentSchedule.due_date, band)
+        )
+        if due_dates is not None:
+            query = query.where(PaymentSchedule.due_date.in_(due_dates))
+        return db.execute(query).all()
+
+    def load(self, db: Session):
+        with self.lock:
+            self.stale.clear()
+            self.totals = {
+                (row.due_date, row.band): (to_cents(row.amount), row.installments) for row in self._aggregate(db)
+            }
+
+    def invalidate(self, loan_id):
+        with self.lock:
+            self.stale.add(loan_id)
+
+    def amounts(self, db: Session) -> list:
+        """(vencimiento, tramo, centavos, cuotas); antes reagrega las fechas de los préstamos con eventos."""
+        with self.lock:
+            if self.stale:
+                due_dates = set(db.execute(
+                    select(PaymentSchedule.due_date).where(
+                        PaymentSchedule.loan_id.in_(list(self.stale)),
+                        PaymentSchedule.due_date < self.horizon,
+                    ).distinct()
+                ).scalars())
+                self.stale.clear()
+                if due_dates:
+                    self.totals = {key: value for key, value in self.totals.items() if key[0] not in due_dates}
+                    for row in self._aggregate(db, list(due_dates)):
+                        self.totals[(row.due_date, row.band)] = (to_cents(row.amount), row.installments)
+            return [(due_date, band, cents, installments) for (due_date, band), (cents, installments) in self.totals.items()]
+
+
+def _stored_amounts(db: Session, horizon: date) -> list:
+    part = stored_cache.get(horizon)
+    if part is None:
+        part = StoredAmounts(horizon)
+        part.load(db)
+        stored_cache.set(horizon, part)
+    return part.amounts(db)
+
+
+class VirtualAmounts:
+    """
+    Cuotas derivadas (sin fila propia) de los préstamos virtuales, agregadas
+    por (vencimiento, tramo) hasta un horizonte. Por préstamo solo se guarda
+    la firma de lo que aportó (condiciones, tramo y cuotas ya guardadas):
+    un evento de un préstamo resta su aporte anterior y suma el actual sin
+    volver a derivar toda la cartera.
+    """
+
+    def __init__(self, horizon: date):
+        self.horizon = horizon
+        self.totals = {}
+        self.signatures = {}
+        self.stale = set()
+        self.lock = threading.Lock()
+
+    def _signatures(self, db: Session, loan_ids=None) -> dict:
+        loans = select(
+            Loan.id, Loan.principal_amount, Loan.interest_rate, Loan.term_months, Loan.first_payment_date, Loan.overdue_count
+        ).where(Loan.schedule_mode == VIRTUAL, Loan.status.in_(ACTIVE_STATUSES))
+        persisted = (
+            select(PaymentSchedule.loan_id, PaymentSchedule.installment_number)
+            .join(Loan, Loan.id == PaymentSchedule.loan_id)
+            .where(Loan.schedule_mode == VIRTUAL, Loan.status.in_(ACTIVE_STATUSES))
+        )
+        if loan_ids is not None:
+            loans = loans.where(Loan.id.in_(loan_ids))
+            persisted = persisted.where(PaymentSchedule.loan_id.in_(loan_ids))
+
+        numbers = {}
+        for loan_id, installment_number in db.execute(persisted):
+            numbers.setdefault(loan_id, set()).add(installment_number)
+        return {
+            row.id: (
+                row.principal_amount, row.interest_rate, row.term_months, row.first_payment_date,
+                _band_of(row.overdue_count), frozenset(numbers.get(row.id, ())),
+            )
+            for row in db.execute(loans)
+        }
+
+    def _apply(self, signature: tuple, sign: int):
+        principal_amount, interest_rate, term_months, first_payment_date, band, persisted = signature
+        installments = installment_totals(principal_amount, interest_rate, term_months, first_payment_date)
+        for number, (due_date, cents) in enumerate(installments, start=1):
+            if due_date >= self.horizon:
+                break
+            if number in persisted:
+                continue
+            bucket = self.totals.setdefault((due_date, band), [0, 0])
+            bucket[0] += sign * cents
+            bucket[1] += sign
+
+    def load(self, db: Session):
+        with self.lock:
+            self.signatures = self._signatures(db)
+            self.stale.clear()
+            for signature in self.signatures.values():
+                self._apply(signature, 1)
+
+    def invalidate(self, loan_id):
+        with self.lock:
+            self.stale.add(loan_id)
+
+    def amounts(self, db: Session) -> list:
+        """(vencimiento, tramo, centavos, cuotas); antes reaplica los préstamos con eventos."""
+        with self.lock:
+            if self.stale:
+                loan_ids = list(self.stale)
+                self.stale.clear()
+                current = self._signatures(db, loan_ids)
+                for loan_id in loan_ids:
+                    old, new = self.signatures.pop(loan_id, None), current.get(loan_id)
+                    if old == new:
+                        if old is not None:
+                            self.signatures[loan_id] = old
+                        continue
+                    if old is not None:
+                        self._apply(old, -1)
+                    if new is not None:
+                        self._apply(new, 1)
+                        self.signatures[loan_id] = new
+            return [
+                (due_date, band, cents, installments)
+                for (due_date, band), (cents, installments) in self.totals.items() if installments
+            ]
+
+
+def _virtual_amounts(db: Session, horizon: date) -> list:
+    part = virtual_cache.get(horizon)
+    if part is None:
+        part = VirtualAmounts(horizon)
+        part.load(db)
+        virtual_cache.set(horizon, part)
+    return part.amounts(db)
+
+
+# Eventos de préstamos que no mueven fechas de vencimiento ya agregadas
+PER_LOAN_EVENTS = {"loan.created", "loan.overdue", "loan.archived"}
+
+
+def _on_event(event: dict):
+    """
+    Un pago o un evento de un solo préstamo (alta, mora, archivo) invalida el
+    resultado armado y solo el aporte de ese préstamo. Otros eventos de préstamos (reprogramación, cambios por
+    lotes) pueden cambiar fechas o muchos préstamos: se recalcula todo.
+    """
+    data = event.get("data") or {}
+    cashflow_cache.clear()
+    if event.get("topic") == "payments":
+        loan_id = data.get("loan_id")
+    else:
+        loan_id = data.get("id") if event.get("type") in PER_LOAN_EVENTS else None
+    if loan_id is None:
+        stored_cache.clear()
+        virtual_cache.clear()
+        return
+    for part in stored_cache.values() + virtual_cache.values():
+        part.invalidate(uuid.UUID(str(loan_id)))
+
+
+# Los pagos y préstamos nuevos cambian la proyección (llega a todos los workers vía broker)
+event_hub.add_listener(("payments", "loans"), _on_event)
+
+
+def _period_start(due_date: date, granularity: str) -> date:
+    if granularity == WEEK:
+        return due_date - timedelta(days=due_date.weekday())
+    return due_date.replace(day=1)
+
+
+def cashflow_forecast(db: Session, granularity: str = MONTH, months: int = 12, today: date = None) -> dict:
+    """
+    Cobranza esperada por semana o mes para los próximos `months` meses.
+    La base agrega por fecha de vencimiento y tramo (cientos de filas aunque
+    haya millones de cuotas); aquí solo se agrupan por periodo y se aplican
+    las probabilidades de cobro. Lo vencido e impago va en 'overdue'.
+    """
+    today = today or date.today()
+    key = (granularity, months, today)
+    cached = cashflow_cache.get(key)
+    if cached is not None:
+        return cached
+
+    horizon = today + relativedelta(months=months)
+    rates = collection_rates(db, today)
+
+    overdue = {"scheduled": 0, "expected": 0, "installments": 0}
+    buckets = {}
+    for due_date, band, cents, installments in _stored_amounts(db, horizon) + _virtual_amounts(db, horizon):
+        expected = round(cents * rates[band])
+        if due_date < today:
+            bucket = overdue
+        else:
+            period = _period_start(due_date, granularity)
+            bucket = buckets.setdefault(period, {"scheduled": 0, "expected": 0, "installments": 0})
+        bucket["scheduled"] += cents
+        bucket["expected"] += expected
+        bucket["installments"] += installments
+
+    def _money(bucket: dict) -> dict:
+        return {
+            "scheduled": from_cents(bucket["scheduled"]),
+            "expected": from_cents(bucket["expected"]),
+            "installments": bucket["installments"],
+        }
+
+    result = {
+        "as_of": today,
+        "granularity": granularity,
+        "horizon": horizon,
+        "collection_rates": {band: round(rate, 4) for band, rate in rates.items()},
+        "overdue": _money(overdue),
+        "periods": [
+            {"period_start": period, **_money(bucket)}
+            for period, bucket in sorted(buckets.items())
+        ],
+        "total": _money({
+            field: sum(bucket[field] for bucket in buckets.values()) for field in ("scheduled", "expected", "installments")
+        }),
+    }
+    cashflow_cache.set(key, result)
+    return result
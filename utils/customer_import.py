@@ -0,0 +1,178 @@
+import csv
+import io
+import json
+import os
+import uuid
+from datetime import datetime
+
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.models import Customer
+from schemas.schemas import CustomerCreate
+from utils.security import create_password_setup_token
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 500))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 20 * 1024 * 1024))
+
+CSV = "csv"
+NDJSON = "ndjson"
+
+CREATED = "created"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+FAILED = "failed"
+
+
+def detect_format(content_type: str, requested: str = None):
+    if requested:
+        return requested if requested in (CSV, NDJSON) else None
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        return CSV
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines"):
+        return NDJSON
+    return None
+
+
+def parse_rows(body: bytes, fmt: str):
+    """(línea, dict) por registro; si la línea no se puede leer, (línea, mensaje de error)."""
+    text = body.decode("utf-8-sig")
+    if fmt == CSV:
+        reader = csv.DictReader(io.StringIO(text))
+        for row in reader:
+            # Celdas vacías = sin dato (los opcionales quedan en None)
+            yield reader.line_num, {key.strip(): (value.strip() or None) if isinstance(value, str) else value
+                                    for key, value in row.items() if key}
+        return
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, f"JSON inválido: {e.msg}"
+            continue
+        yield line_number, row if isinstance(row, dict) else "Se esperaba un objeto JSON"
+
+
+def _validation_detail(error: ValidationError) -> str:
+    first = error.errors()[0]
+    field = ".".join(str(part) for part in first["loc"]) or "registro"
+    return f"{field}: {first['msg']}"
+
+
+def _chunks(iterable, size: int):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _insert_rows(db: Session, values: list) -> set:
+    """INSERT por lotes; si choca con otra importación concurrente, fila por fila (SAVEPOINT). Devuelve los ids fallidos."""
+    try:
+        db.execute(insert(Customer), values)
+        db.commit()
+        return set()
+    except IntegrityError:
+        db.rollback()
+
+    failed = set()
+    for value in values:
+        try:
+            with db.begin_nested():
+                db.execute(insert(Customer), [value])
+        except IntegrityError:
+            failed.add(value["id"])
+    db.commit()
+    return failed
+
+
+def import_customers(db: Session, rows, created_by=None, chunk_size: int = None):
+    """
+    Importa clientes por bloques y va devolviendo el resultado de cada fila.
+    Por bloque: validación, una sola consulta de DNIs y emails existentes,
+    INSERT por lotes y commit. No se calculan hashes: cada cliente con email
+    recibe un token para definir su contraseña después
+    (POST /auth/customer/setup-password). La última entrada es el resumen.
+    """
+    totals = {CREATED: 0, DUPLICATE: 0, INVALID: 0, FAILED: 0}
+    seen_dnis = {}
+    seen_emails = {}
+
+    for chunk in _chunks(rows, chunk_size or IMPORT_CHUNK_SIZE):
+        reports = []
+        candidates = []
+        for line, row in chunk:
+            if isinstance(row, str):
+                reports.append({"line": line, "status": INVALID, "detail": row})
+                continue
+            try:
+                customer = CustomerCreate.model_validate(row)
+            except ValidationError as e:
+                reports.append({"line": line, "status": INVALID, "dni": row.get("dni"), "detail": _validation_detail(e)})
+                continue
+            # Repetidos dentro del mismo archivo
+            if customer.dni in seen_dnis:
+                reports.append({"line": line, "status": DUPLICATE, "dni": customer.dni,
+                                "detail": f"DNI repetido en el archivo (línea {seen_dnis[customer.dni]})"})
+                continue
+            if customer.email and customer.email in seen_emails:
+                reports.append({"line": line, "status": DUPLICATE, "dni": customer.dni,
+                                "detail": f"Email repetido en el archivo (línea {seen_emails[customer.email]})"})
+                continue
+            seen_dnis[customer.dni] = line
+            if customer.email:
+                seen_emails[customer.email] = line
+            candidates.append((line, customer))
+
+        if candidates:
+            # Una consulta por bloque contra los ya registrados
+            dnis = [customer.dni for _, customer in candidates]
+            emails = [customer.email for _, customer in candidates if customer.email]
+            conditions = [Customer.dni.in_(dnis)] + ([Customer.email.in_(emails)] if emails else [])
+            existing = db.execute(select(Customer.dni, Customer.email).where(or_(*conditions))).all()
+            existing_dnis = {row.dni for row in existing}
+            existing_emails = {row.email for row in existing if row.email}
+
+            new = []
+            now = datetime.utcnow()
+            for line, customer in candidates:
+                if customer.dni in existing_dnis:
+                    reports.append({"line": line, "status": DUPLICATE, "dni": customer.dni, "detail": "Cliente con este DNI ya existe"})
+                elif customer.email and customer.email in existing_emails:
+                    reports.append({"line": line, "status": DUPLICATE, "dni": customer.dni, "detail": "Email ya registrado"})
+                else:
+                    new.append((line, {
+                        "id": uuid.uuid4(),
+                        **customer.model_dump(),
+                        "is_active": True,
+                        "created_by": created_by,
+                        "created_at": now,
+                        "updated_at": now,
+                    }))
+
+            failed = _insert_rows(db, [value for _, value in new]) if new else set()
+            for line, value in new:
+                if value["id"] in failed:
+                    reports.append({"line": line, "status": FAILED, "dni": value["dni"], "detail": "DNI o email registrado durante la importación"})
+                    continue
+                report = {"line": line, "status": CREATED, "dni": value["dni"], "customer_id": str(value["id"])}
+                if value["email"]:
+                    report["setup_token"] = create_password_setup_token(value["id"])
+                reports.append(report)
+
+        reports.sort(key=lambda report: report["line"])
+        for report in reports:
+            totals[report["status"]] += 1
+            yield report
+
+    print(f"Importación de clientes: {totals}")
+    yield {"summary": totals}
@@ -0,0 +1,139 @@
+import os
+
+from sqlalchemy import event, text
+
+# Límites por defecto según el método HTTP (ms; 0 = sin límite)
+DB_READ_TIMEOUT_MS = int(os.getenv("DB_READ_TIMEOUT_MS", 5000))
+DB_WRITE_TIMEOUT_MS = int(os.getenv("DB_WRITE_TIMEOUT_MS", 15000))
+# Presupuestos por petición (0 = sin presupuesto) y qué hacer al excederlos: log | raise
+DB_QUERY_BUDGET = int(os.getenv("DB_QUERY_BUDGET", 0))
+DB_ROW_BUDGET = int(os.getenv("DB_ROW_BUDGET", 0))
+DB_BUDGET_MODE = os.getenv("DB_BUDGET_MODE", "log")
+
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryPolicy:
+    def __init__(self, timeout_ms: int = None, read_only: bool = None, max_queries: int = None,
+                 max_rows: int = None, mode: str = None):
+        self.timeout_ms = timeout_ms
+        self.read_only = read_only
+        self.max_queries = max_queries
+        self.max_rows = max_rows
+        self.mode = mode
+
+    def resolve(self, method: str) -> "QueryPolicy":
+        """Completa lo no declarado con los valores por defecto del método."""
+        read = method in READ_METHODS
+        return QueryPolicy(
+            timeout_ms=self.timeout_ms if self.timeout_ms is not None else (DB_READ_TIMEOUT_MS if read else DB_WRITE_TIMEOUT_MS),
+            read_only=self.read_only if self.read_only is not None else read,
+            max_queries=self.max_queries if self.max_queries is not None else DB_QUERY_BUDGET,
+            max_rows=self.max_rows if self.max_rows is not None else DB_ROW_BUDGET,
+            mode=self.mode or DB_BUDGET_MODE,
+        )
+
+
+def db_policy(**options):
+    """
+    Límites de base de datos de un endpoint (debajo de @router.*):
+    timeout_ms, read_only, max_queries, max_rows y mode ('log' o 'raise').
+    """
+    def decorator(endpoint):
+        endpoint.__db_policy__ = QueryPolicy(**options)
+        return endpoint
+    return decorator
+
+
+def policy_for(request) -> tuple:
+    """(etiqueta de la ruta, política resuelta) para la petición en curso."""
+    route = request.scope.get("route") if request is not None else None
+    method = request.method if request is not None else "POST"
+    declared = getattr(getattr(route, "endpoint", None), "__db_policy__", None) or QueryPolicy()
+    label = f"{method} {getattr(route, 'path_format', None) or (request.url.path if request is not None else '-')}"
+    return label, declared.resolve(method)
+
+
+class QueryBudget:
+    """Consultas y filas usadas por la sesión de una petición."""
+
+    def __init__(self, label: str, policy: QueryPolicy):
+        self.label = label
+        self.policy = policy
+        self.queries = 0
+        self.rows = 0
+        self.reported = False
+
+    def _violation(self, message: str):
+        if self.policy.mode == "raise":
+            raise QueryBudgetExceeded(f"{self.label}: {message}")
+        if not self.reported:
+            self.reported = True
+            print(f"⚠️ Presupuesto de consultas excedido en {self.label}: {message}")
+
+    def before_query(self):
+        max_queries = self.policy.max_queries
+        if max_queries and self.queries >= max_queries:
+            self._violation(f"más de {max_queries} consultas")
+        self.queries += 1
+
+    def after_query(self, rowcount: int):
+        self.rows += max(rowcount, 0)
+        max_rows = self.policy.max_rows
+        if max_rows and self.rows > max_rows:
+            self._violation(f"{self.rows} filas (máximo {max_rows})")
+
+
+def apply_policy(db, request):
+    """Asocia la política de la ruta a la sesión; se aplica al empezar cada transacción."""
+    label, policy = policy_for(request)
+    db.info["query_policy"] = policy
+    db.info["query_budget"] = QueryBudget(label, policy)
+
+
+# -----------------------------------------------------------
+# GANCHOS
+# -----------------------------------------------------------
+def _after_begin(session, transaction, connection):
+    policy = session.info.get("query_policy")
+    if policy is None:
+        return
+    if connection.dialect.name == "postgresql":
+        # Primeras sentencias de la transacción; SET LOCAL se descarta al terminarla
+        if policy.read_only:
+            connection.execute(text("SET TRANSACTION READ ONLY"))
+        connection.execute(text(f"SET LOCAL statement_timeout = {int(policy.timeout_ms)}"))
+    # La conexión (del pool) lleva el presupuesto mientras la use esta sesión
+    connection.info["query_budget"] = session.info["query_budget"]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    budget = conn.info.get("query_budget")
+    if budget is not None:
+        budget.before_query()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    budget = conn.info.get("query_budget")
+    if budget is not None:
+        budget.after_query(cursor.rowcount)
+
+
+def _checkin(dbapi_connection, connection_record):
+    connection_record.info.pop("query_budget", None)
+
+
+def install_db_policies(engine, session_factory):
+    event.listen(session_factory, "after_begin", _after_begin)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "checkin", _checkin)
+
+
+def is_statement_timeout(error) -> bool:
+    """OperationalError de Postgres por statement_timeout (SQLSTATE 57014)."""
+    return getattr(getattr(error, "orig", None), "pgcode", None) == "57014"
@@ -0,0 +1,65 @@
+from datetime import date, timedelta
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from models.models import Loan, PaymentSchedule
+from utils.events import loan_event_data, publish_event
+from utils.loan_summary import refresh_loan_summaries
+from utils.virtual_schedule import materialize_due_installments
+
+OVERDUE_EVENT_COLUMNS = (
+    Loan.id, Loan.customer_id, Loan.loan_number, Loan.status,
+    Loan.outstanding_balance, Loan.overdue_count, Loan.overdue_amount,
+)
+
+
+def update_overdue_installments(db: Session, today: date = None, batch_size: int = 1000) -> int:
+    """
+    Actualiza days_overdue de las cuotas vencidas e impagas y el resumen de
+    los préstamos afectados, todo en la misma transacción.
+    Se emite un UPDATE por fecha de vencimiento distinta (pocas) en lugar de
+    uno por cuota. Las cuotas vencidas de préstamos virtuales se guardan
+    antes, así entran en el mismo recorrido. Tras confirmar se publica
+    loan.overdue por cada préstamo que pasó de al día a moroso.
+    """
+    today = today or date.today()
+    materialize_due_installments(db, today - timedelta(days=1), today)
+    overdue = (PaymentSchedule.status != 'paid', PaymentSchedule.due_date < today)
+
+    due_dates = db.execute(
+        select(PaymentSchedule.due_date).where(*overdue).distinct()
+    ).scalars().all()
+
+    updated = 0
+    for due_date in due_dates:
+        result = db.execute(
+            update(PaymentSchedule)
+            .where(PaymentSchedule.due_date == due_date, PaymentSchedule.status != 'paid')
+            .values(days_overdue=(today - due_date).days),
+            execution_options={"synchronize_session": False}
+        )
+        updated += result.rowcount
+
+    loan_ids = db.execute(
+        select(PaymentSchedule.loan_id).where(*overdue).distinct()
+    ).scalars().all()
+    events = []
+    for i in range(0, len(loan_ids), batch_size):
+        batch = loan_ids[i:i + batch_size]
+        # Antes del recálculo: los que estaban al día
+        current = db.execute(
+            select(Loan.id).where(Loan.id.in_(batch), func.coalesce(Loan.overdue_count, 0) == 0)
+        ).scalars().all()
+        refresh_loan_summaries(db, batch, today)
+        if current:
+            events += [
+                {**loan_event_data(row), "overdue_count": row.overdue_count, "overdue_amount": row.overdue_amount}
+                for row in db.execute(select(*OVERDUE_EVENT_COLUMNS).where(Loan.id.in_(current)))
+            ]
+
+    db.commit()
+    for data in events:
+        publish_event("loans", "loan.overdue", data)
+    print(f"Cuotas vencidas actualizadas: {updated} - préstamos: {len(loan_ids)} ({len(events)} nuevos en mora)")
+    return updated
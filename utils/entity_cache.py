@@ -0,0 +1,287 @@
+import json
+import os
+import threading
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from config.database import WEB_CONCURRENCY
+from models.models import Customer, Loan, PaymentSchedule
+from utils.cache import TTLCache
+from utils.events import event_broker, event_hub, publish_event
+
+# Tiempo de vida por entidad (segundos)
+ENTITY_TTLS = {
+    "customer": float(os.getenv("ENTITY_CACHE_TTL_CUSTOMER", 300)),
+    "customer_dni": float(os.getenv("ENTITY_CACHE_TTL_CUSTOMER", 300)),
+    "loan": float(os.getenv("ENTITY_CACHE_TTL_LOAN", 60)),
+}
+# auto: solo si las invalidaciones llegan a todos los procesos, es decir con
+# caché compartida (ENTITY_CACHE_URL) o con EVENTS_BROKER=postgres.
+# true: fuerza la caché local; solo se admite con un único worker y las
+# escrituras de otros procesos (scripts) se ven recién al vencer el TTL.
+ENTITY_CACHE_MODE = os.getenv("ENTITY_CACHE_ENABLED", "auto").lower()
+ENTITY_CACHE_URL = os.getenv("ENTITY_CACHE_URL")  # redis://... para compartirla entre workers
+ENTITY_CACHE_MAX = int(os.getenv("ENTITY_CACHE_MAX", 20000))
+
+# Las versiones deben vivir más que cualquier dato guardado bajo ellas
+VERSION_TTL = 2 * max(ENTITY_TTLS.values())
+CACHE_TOPIC = "cache"
+# NOTIFY admite hasta 8000 bytes por mensaje: las claves se publican en
+# tandas de este tamaño (el resto del sobre del evento ocupa menos de 200)
+INVALIDATION_PAYLOAD_MAX = int(os.getenv("ENTITY_CACHE_INVALIDATION_BYTES", 7000))
+# Con más registros de una misma entidad se sube su generación: una sola clave
+INVALIDATION_KEYS_MAX = int(os.getenv("ENTITY_CACHE_INVALIDATION_KEYS", 500))
+
+# Qué entradas invalida la escritura de cada modelo
+_MODEL_ENTITIES = {Customer: "customer", Loan: "loan", PaymentSchedule: "loan"}
+
+
+# -----------------------------------------------------------
+# BACKENDS
+# -----------------------------------------------------------
+class LocalBackend:
+    """LRU en memoria del proceso con vencimiento por entrada (también sustituye al compartido en desarrollo)."""
+
+    shared = False
+
+    def __init__(self, max_entries: int = 20000):
+        self._data = TTLCache(max_entries=max_entries)
+        # Los contadores de versión no compiten con los datos en el LRU ni se
+        # descartan antes de vencer: perder uno volvería a servir datos viejos
+        self._counters = TTLCache(max_entries=max_entries, evict_live=False)
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def set(self, key, value, ttl: float):
+        self._data.set(key, value, ttl)
+
+    def counter(self, key) -> int:
+        return self._counters.get(key) or 0
+
+    def incr(self, key, ttl: float) -> int:
+        return self._counters.incr(key, ttl)
+
+    def clear(self):
+        self._data.clear()
+        self._counters.clear()
+
+    def stats(self) -> dict:
+        return {"backend": "local", "entries": len(self._data), "versions": len(self._counters)}
+
+
+class RedisBackend:
+    """Caché compartida entre workers (paquete redis opcional, solo si se configura ENTITY_CACHE_URL)."""
+
+    shared = True
+
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl: float):
+        self.client.set(key, value, px=int(ttl * 1000))
+
+    def counter(self, key) -> int:
+        value = self.client.get(key)
+        return int(value) if value else 0
+
+    def incr(self, key, ttl: float) -> int:
+        with self.client.pipeline() as pipe:
+            pipe.incr(key)
+            pipe.pexpire(key, int(ttl * 1000))
+            return pipe.execute()[0]
+
+    def clear(self):
+        for key in self.client.scan_iter("entity:*"):
+            self.client.delete(key)
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+# -----------------------------------------------------------
+# CACHÉ DE LECTURA
+# -----------------------------------------------------------
+class EntityCache:
+    """
+    Caché de lectura (read-through) de respuestas JSON por entidad.
+
+    La clave incluye la generación de la entidad (escrituras masivas) y la
+    versión del registro: invalidar es subir la versión, así una lectura que
+    empezó antes del commit guarda su resultado bajo una versión que ya nadie
+    consulta. Los fallos simultáneos de la misma clave en este proceso
+    esperan a una sola carga.
+    """
+
+    def __init__(self, backend, ttls: dict):
+        self.backend = backend
+        self.ttls = ttls
+        self._loading = {}
+        self._loading_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, entity: str, key, variant) -> str:
+        generation = self.backend.counter(f"entity:gen:{entity}")
+        version = self.backend.counter(f"entity:ver:{entity}:{key}")
+        return f"entity:{entity}:{generation}:{key}:{version}:{variant or ''}"
+
+    def get_or_load(self, entity: str, key, loader, variant=None):
+        """
+        Valor cacheado o el de loader() (que se guarda salvo que sea None).
+        `variant` distingue representaciones del mismo registro y se
+        invalida junto con él.
+        """
+        cache_key = self._key(entity, key, variant)
+        value = self.backend.get(cache_key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        with self._loading_lock:
+            lock = self._loading.setdefault(cache_key, threading.Lock())
+        with lock:
+            # Otro hilo pudo haberlo cargado mientras se esperaba
+            value = self.backend.get(cache_key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+            try:
+                value = loader()
+                if value is not None:
+                    self.backend.set(cache_key, value, self.ttls[entity])
+            finally:
+                with self._loading_lock:
+                    self._loading.pop(cache_key, None)
+        return value
+
+    def invalidate(self, entity: str, key=None):
+        """Sube la versión del registro o, sin key, la generación de toda la entidad."""
+        if key is None:
+            self.backend.incr(f"entity:gen:{entity}", VERSION_TTL)
+        else:
+            self.backend.incr(f"entity:ver:{entity}:{key}", VERSION_TTL)
+
+    def stats(self) -> dict:
+        return {**self.backend.stats(), "hits": self.hits, "misses": self.misses}
+
+
+def _default_backend():
+    if ENTITY_CACHE_URL:
+        return RedisBackend(ENTITY_CACHE_URL)
+    return LocalBackend(ENTITY_CACHE_MAX)
+
+
+def _cache_enabled(backend) -> bool:
+    propagated = backend.shared or event_broker.cross_process
+    if ENTITY_CACHE_MODE == "auto":
+        return propagated
+    if ENTITY_CACHE_MODE != "true":
+        return False
+    if not propagated and WEB_CONCURRENCY > 1:
+        raise RuntimeError(
+            "ENTITY_CACHE_ENABLED=true con caché local y varios workers: configure ENTITY_CACHE_URL "
+            "o EVENTS_BROKER=postgres para que las invalidaciones lleguen a todos"
+        )
+    return True
+
+
+entity_cache = EntityCache(_default_backend(), ENTITY_TTLS)
+ENTITY_CACHE_ENABLED = _cache_enabled(entity_cache.backend)
+
+
+def cached(entity: str, key, loader, variant=None):
+    if not ENTITY_CACHE_ENABLED:
+        return loader()
+    return entity_cache.get_or_load(entity, str(key), loader, variant)
+
+
+# -----------------------------------------------------------
+# INVALIDACIÓN DESDE LA SESIÓN ORM
+# -----------------------------------------------------------
+def _pending(session) -> set:
+    return session.info.setdefault("entity_invalidations", set())
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed(session, flush_context):
+    pending = _pending(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        entity = _MODEL_ENTITIES.get(type(obj))
+        if entity is None:
+            continue
+        key = obj.loan_id if isinstance(obj, PaymentSchedule) else obj.id
+        pending.add((entity, str(key) if key is not None else None))
+        if isinstance(obj, Customer):
+            # El índice DNI -> id, con el DNI anterior y el nuevo
+            history = inspect(obj).attrs.dni.history
+            for dni in (*history.added, *history.unchanged, *history.deleted):
+                pending.add(("customer_dni", dni))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk(orm_execute_state):
+    # INSERT/UPDATE/DELETE por lotes: no se sabe qué filas cambian, se invalida la entidad
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        entity = _MODEL_ENTITIES.get(mapper.class_) if mapper is not None else None
+        if entity is not None:
+            _pending(orm_execute_state.session).add((entity, None))
+
+
+def _collapse(pending: set) -> list:
+    """Claves a invalidar; una entidad con demasiados registros pasa a invalidarse entera."""
+    counts = {}
+    for entity, key in pending:
+        counts[entity] = counts.get(entity, 0) + 1
+    whole = {entity for entity, count in counts.items() if count > INVALIDATION_KEYS_MAX}
+    whole |= {entity for entity, key in pending if key is None}
+    keys = [(entity, None) for entity in sorted(whole)]
+    keys += sorted((entity, key) for entity, key in pending if entity not in whole)
+    return keys
+
+
+def invalidation_chunks(keys: list) -> list:
+    """Listas de claves cuyo JSON no supera INVALIDATION_PAYLOAD_MAX bytes."""
+    chunks = []
+    chunk, size = [], 0
+    for entity, key in keys:
+        item_size = len(json.dumps([entity, key])) + 1
+        if chunk and size + item_size > INVALIDATION_PAYLOAD_MAX:
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append([entity, key])
+        size += item_size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_invalidations(session):
+    pending = session.info.pop("entity_invalidations", None)
+    if not pending or not ENTITY_CACHE_ENABLED:
+        return
+    keys = _collapse(pending)
+    for entity, key in keys:
+        entity_cache.invalidate(entity, key)
+    if not entity_cache.backend.shared:
+        # Los demás workers tienen su propia caché local
+        for chunk in invalidation_chunks(keys):
+            publish_event(CACHE_TOPIC, "entities.invalidated", {"keys": chunk})
+
+
+def _on_remote_invalidation(event: dict):
+    for entity, key in (event.get("data") or {}).get("keys", []):
+        entity_cache.invalidate(entity, key)
+
+
+if not entity_cache.backend.shared:
+    event_hub.add_listener((CACHE_TOPIC,), _on_remote_invalidation)
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import os
+import threading
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import text
+
+TOPICS = ("payments", "loans")
+
+PG_CHANNEL = "prestamos_events"
+
+
+def _default(value):
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value)}")
+
+
+# -----------------------------------------------------------
+# HUB LOCAL: CLIENTES WEBSOCKET Y SUSCRIPCIONES
+# -----------------------------------------------------------
+class Subscriber:
+    def __init__(self, topics: set, max_queue: int = 100):
+        self.topics = set(topics)
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        # Descartados desde la última vez que vació su cola
+        self.dropped = 0
+
+
+class EventHub:
+    """
+    Reparte los eventos a los clientes conectados en este worker.
+    Cada cliente tiene una cola acotada; si no la consume a tiempo se
+    descartan los eventos más antiguos y, si acumula demasiados descartes
+    sin llegar a vaciar su cola, se desconecta. Un cliente que se pone al
+    día vuelve a empezar la cuenta.
+    """
+
+    def __init__(self, max_queue: int = 100, max_dropped: int = 500):
+        self.subscribers = set()
+        self.listeners = []
+        self.max_queue = max_queue
+        self.max_dropped = max_dropped
+
+    def add_listener(self, topics, callback):
+        """Callback interno (p. ej. invalidar cachés) para los eventos de esos tópicos."""
+        self.listeners.append((set(topics), callback))
+
+    def subscribe(self, topics) -> Subscriber:
+        subscriber = Subscriber(topics, self.max_queue)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def dispatch(self, message: str):
+        event = json.loads(message)
+        topic = event.get("topic")
+        for topics, callback in self.listeners:
+            if topic in topics:
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"Error en listener de eventos: {str(e)}")
+        for subscriber in list(self.subscribers):
+            if topic not in subscriber.topics:
+                continue
+            if subscriber.queue.empty():
+                subscriber.dropped = 0
+            elif subscriber.queue.full():
+                subscriber.queue.get_nowait()
+                subscriber.dropped += 1
+            subscriber.queue.put_nowait(message)
+
+    def is_lagging(self, subscriber: Subscriber) -> bool:
+        return subscriber.dropped > self.max_dropped
+
+
+# -----------------------------------------------------------
+# BROKERS: REPARTO ENTRE WORKERS
+# -----------------------------------------------------------
+class InMemoryBroker:
+    """Broker local (un solo proceso). Útil en desarrollo y pruebas."""
+
+    # Los eventos no salen del proceso que los publica
+    cross_process = False
+
+    def __init__(self):
+        self.hub = None
+        self.loop = None
+
+    async def start(self, hub: EventHub):
+        self.hub = hub
+        self.loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        self.hub = None
+
+    def publish(self, message: str):
+        # Se llama desde las rutas síncronas (threadpool)
+        if self.hub is not None and self.loop is not None:
+            self.loop.call_soon_threadsafe(self.hub.dispatch, message)
+
+
+class PostgresBroker:
+    """
+    Reparto entre workers con LISTEN/NOTIFY de Postgres.
+    En la API los NOTIFY no se envían desde el hilo de la petición: se
+    encolan y el loop los manda por la conexión asyncpg en una sola
+    sentencia por tanda. Sin loop (scripts y jobs) se envían en el momento.
+    """
+
+    cross_process = True
+
+    def __init__(self, database_url: str):
+        self.dsn = database_url.replace("postgresql+psycopg2://", "postgresql://")
+        self.connection = None
+        self.loop = None
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        self.flush_scheduled = False
+        self.send_lock = None
+
+    async def start(self, hub: EventHub):
+        import asyncpg
+
+        self.connection = await asyncpg.connect(self.dsn)
+        await self.connection.add_listener(
+            PG_CHANNEL, lambda conn, pid, channel, payload: hub.dispatch(payload)
+        )
+        self.send_lock = asyncio.Lock()
+        self.loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        if self.connection is not None:
+            await self._flush()
+            self.loop = None
+            await self.connection.close()
+            self.connection = None
+
+    def publish(self, message: str):
+        if self.loop is None:
+            from config.database import engine
+
+            with engine.begin() as conn:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": PG_CHANNEL, "payload": message})
+            return
+        with self.pending_lock:
+            self.pending.append(message)
+            if self.flush_scheduled:
+                return
+            self.flush_scheduled = True
+        self.loop.call_soon_threadsafe(self.loop.create_task, self._flush())
+
+    async def _flush(self):
+        # Un solo envío a la vez por la conexión; lo que llega mientras
+        # tanto sale en la tanda siguiente
+        async with self.send_lock:
+            with self.pending_lock:
+                messages, self.pending = self.pending, []
+                self.flush_scheduled = False
+            if not messages:
+                return
+            try:
+                await self.connection.execute(
+                    "SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload", PG_CHANNEL, messages
+                )
+                return
+            except Exception as e:
+                if len(messages) == 1:
+                    print(f"Error enviando evento: {str(e)}")
+                    return
+                print(f"Error enviando {len(messages)} eventos juntos, se reintentan uno por uno: {str(e)}")
+            # La tanda falla entera si un mensaje falla (p. ej. payload demasiado
+            # grande): solo se pierden los que fallan por sí solos
+            for message in messages:
+                try:
+                    await self.connection.execute("SELECT pg_notify($1, $2)", PG_CHANNEL, message)
+                except Exception as e:
+                    print(f"Error enviando evento: {str(e)}")
+
+
+def _default_broker():
+    if os.getenv("EVENTS_BROKER", "memory") == "postgres":
+        return PostgresBroker(os.getenv("DATABASE_URL"))
+    return InMemoryBroker()
+
+
+event_hub = EventHub()
+event_broker = _default_broker()
+
+
+def publish_event(topic: str, event_type: str, data: dict):
+    message = json.dumps(
+        {"topic": topic, "type": event_type, "data": data, "sent_at": datetime.utcnow()},
+        default=_default,
+    )
+    try:
+        event_broker.publish(message)
+    except Exception as e:
+        # Un fallo al notificar no debe romper la operación ya confirmada
+        print(f"Error publicando evento {event_type}: {str(e)}")
+
+
+def payment_event_data(payment, customer_id) -> dict:
+    """
+    customer_id lo pasa quien llama (ya tiene el préstamo cargado): leer
+    payment.loan cargaría el préstamo con su cronograma por cada evento.
+    """
+    return {
+        "id": payment.id,
+        "loan_id": payment.loan_id,
+        "customer_id": customer_id,
+        "amount": payment.amount,
+        "status": payment.status,
+        "payment_method": payment.payment_method,
+        "payment_date": payment.payment_date,
+    }
+
+
+def loan_event_data(loan) -> dict:
+    return {
+        "id": loan.id,
+        "customer_id": loan.customer_id,
+        "loan_number": loan.loan_number,
+        "status": loan.status,
+        "outstanding_balance": loan.outstanding_balance,
+    }
@@ -0,0 +1,88 @@
+import os
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from models.models import Customer, Loan
+from utils.cache import TTLCache
+from utils.events import event_hub
+
+ACTIVE_STATUSES = ("active", "approved")
+
+exposure_cache = TTLCache(ttl=float(os.getenv("EXPOSURE_CACHE_TTL", 300)), max_entries=10000)
+
+
+def invalidate_exposure(event: dict):
+    """Borra la exposición del cliente del evento; sin cliente identificable se vacía toda la caché."""
+    customer_id = (event.get("data") or {}).get("customer_id")
+    if customer_id:
+        exposure_cache.delete(str(customer_id))
+    else:
+        exposure_cache.clear()
+
+
+# Escrituras de préstamos y pagos (en todos los workers vía broker)
+event_hub.add_listener(("payments", "loans"), invalidate_exposure)
+
+
+def _exposure_rows(db: Session, customer_ids: list):
+    """Una sola consulta agregada (clientes LEFT JOIN préstamos vigentes) para todo el lote."""
+    return db.execute(
+        select(
+            Customer.id.label("customer_id"),
+            Customer.monthly_income,
+            func.count(Loan.id).label("active_loans"),
+            func.coalesce(func.sum(Loan.outstanding_balance), 0).label("outstanding_balance"),
+            func.coalesce(func.sum(Loan.total_amount / Loan.term_months), 0).label("monthly_obligation"),
+            func.coalesce(func.sum(Loan.overdue_amount), 0).label("overdue_amount"),
+            func.coalesce(func.sum(Loan.overdue_count), 0).label("overdue_installments"),
+            # next_due_date es la cuota impaga más antigua: define el peor atraso
+            func.min(Loan.next_due_date).label("oldest_unpaid_due_date"),
+        )
+        .outerjoin(Loan, and_(Loan.customer_id == Customer.id, Loan.status.in_(ACTIVE_STATUSES)))
+        .where(Customer.id.in_(customer_ids))
+        .group_by(Customer.id, Customer.monthly_income)
+    ).all()
+
+
+def _exposure(row, today: date) -> dict:
+    monthly_obligation = Decimal(str(row.monthly_obligation)).quantize(Decimal("0.01"))
+    income = Decimal(str(row.monthly_income)) if row.monthly_income else None
+    oldest = row.oldest_unpaid_due_date
+    return {
+        "customer_id": row.customer_id,
+        "monthly_income": income,
+        "active_loans": row.active_loans,
+        "outstanding_balance": Decimal(str(row.outstanding_balance)).quantize(Decimal("0.01")),
+        "monthly_obligation": monthly_obligation,
+        "dti_ratio": (monthly_obligation / income * 100).quantize(Decimal("0.01")) if income else None,
+        "overdue_amount": Decimal(str(row.overdue_amount)).quantize(Decimal("0.01")),
+        "overdue_installments": int(row.overdue_installments or 0),
+        "worst_days_overdue": max((today - oldest).days, 0) if oldest else 0,
+        "next_due_date": oldest,
+    }
+
+
+def customer_exposures(db: Session, customer_ids: list, today: date = None) -> dict:
+    """
+    Exposición de varios clientes: las que están en caché se devuelven tal
+    cual y el resto sale de una única consulta agregada.
+    """
+    today = today or date.today()
+    result = {}
+    missing = []
+    for customer_id in dict.fromkeys(customer_ids):
+        cached = exposure_cache.get(str(customer_id))
+        if cached is not None and cached[0] == today:
+            result[customer_id] = cached[1]
+        else:
+            missing.append(customer_id)
+
+    if missing:
+        for row in _exposure_rows(db, missing):
+            exposure = _exposure(row, today)
+            exposure_cache.set(str(row.customer_id), (today, exposure))
+            result[row.customer_id] = exposure
+    return result
@@ -0,0 +1,65 @@
+from typing import List
+
+from fastapi import Response
+from pydantic import TypeAdapter
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from models.models import Loan, PaymentSchedule
+from schemas.schemas import CustomerRow, LoanRow, LoanRowWithSchedule, LoanWithScheduleRow, ScheduleRow
+from utils.virtual_schedule import VIRTUAL
+
+
+class RawJSONResponse(Response):
+    """Respuesta con el JSON ya serializado (bytes), sin jsonable_encoder."""
+    media_type = "application/json"
+
+
+loan_rows_adapter = TypeAdapter(List[LoanRow])
+loan_rows_with_schedule_adapter = TypeAdapter(List[LoanRowWithSchedule])
+loan_with_schedule_rows_adapter = TypeAdapter(List[LoanWithScheduleRow])
+customer_rows_adapter = TypeAdapter(List[CustomerRow])
+
+
+def row_columns(model, row_type) -> list:
+    """Columnas del modelo que corresponden a las claves del TypedDict."""
+    return [getattr(model, key) for key in row_type.__annotations__ if key in model.__table__.columns]
+
+
+LOAN_ROW_COLUMNS = row_columns(Loan, LoanRow)
+LOAN_WITH_SCHEDULE_COLUMNS = row_columns(Loan, LoanWithScheduleRow)
+SCHEDULE_ROW_COLUMNS = row_columns(PaymentSchedule, ScheduleRow)
+
+
+def rows_to_dicts(rows) -> list:
+    return [row._asdict() for row in rows]
+
+
+def load_schedule_rows(db: Session, loan_ids: list, pending_only: bool = False) -> dict:
+    """
+    Cronogramas de varios préstamos en una sola consulta, agrupados por préstamo.
+    Con pending_only los préstamos virtuales traen igual todas sus filas: las
+    pagadas tapan a las derivadas y el filtro se aplica después de combinarlas
+    (merge_schedule_rows).
+    """
+    schedules = {loan_id: [] for loan_id in loan_ids}
+    if not loan_ids:
+        return schedules
+
+    query = db.query(PaymentSchedule.loan_id, *SCHEDULE_ROW_COLUMNS).filter(
+        PaymentSchedule.loan_id.in_(loan_ids)
+    )
+    if pending_only:
+        query = query.join(Loan, Loan.id == PaymentSchedule.loan_id).filter(
+            or_(PaymentSchedule.status.in_(['pending', 'partial']), Loan.schedule_mode == VIRTUAL)
+        )
+    rows = query.order_by(PaymentSchedule.loan_id, PaymentSchedule.installment_number).all()
+
+    for row in rows:
+        item = row._asdict()
+        schedules[item.pop("loan_id")].append(item)
+    return schedules
+
+
+def json_response(adapter: TypeAdapter, data, status_code: int = 200) -> RawJSONResponse:
+    return RawJSONResponse(content=adapter.dump_json(data), status_code=status_code)
@@ -0,0 +1,46 @@
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+INCLUDE_SCHEDULE = "schedule"
+INCLUDE_PENDING_SCHEDULE = "schedule.pending"
+INCLUDE_NONE = "none"
+INCLUDE_OPTIONS = (INCLUDE_SCHEDULE, INCLUDE_PENDING_SCHEDULE, INCLUDE_NONE)
+
+# Claves anidadas que solo se controlan con ?include=
+NESTED_KEYS = ("payment_schedule",)
+
+
+def parse_fields(fields: Optional[str], row_type) -> list:
+    """
+    Valida ?fields=a,b,c contra las claves del esquema de respuesta.
+    Sin el parámetro se devuelven todos los campos. El id siempre se incluye.
+    """
+    allowed = [key for key in row_type.__annotations__ if key not in NESTED_KEYS]
+    if not fields:
+        return allowed
+
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    invalid = [field for field in requested if field not in allowed]
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Campos no válidos: {', '.join(invalid)}"
+        )
+    return ["id"] + [field for field in allowed if field in requested and field != "id"]
+
+
+def parse_include(include: Optional[str], default: Optional[str] = None) -> Optional[str]:
+    include = include or default
+    if include is None:
+        return None
+    if include not in INCLUDE_OPTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"include no válido. Opciones: {', '.join(INCLUDE_OPTIONS)}"
+        )
+    return None if include == INCLUDE_NONE else include
+
+
+def projected_columns(model, field_names: list) -> list:
+    return [getattr(model, name) for name in field_names if name in model.__table__.columns]
@@ -0,0 +1,375 @@
+import os
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, case, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from models.models import LedgerEntry, Loan, LoanBalanceSnapshot, Payment, PaymentSchedule
+from utils.money import from_cents, to_cents
+
+ALLOCATION = "allocation"
+UNAPPLIED = "unapplied"
+OPENING = "opening"
+# Cargos: desembolso y atrasos capitalizados al reprogramar
+DISBURSEMENT, CAPITALIZATION = LedgerEntry.CHARGE_TYPES
+
+# Margen para que las transacciones en curso terminen antes de cerrar una foto
+SNAPSHOT_SETTLE_MINUTES = int(os.getenv("LEDGER_SNAPSHOT_SETTLE_MINUTES", 10))
+
+TOTAL_FIELDS = (
+    "principal_paid", "interest_paid", "late_fee_paid", "late_interest_paid", "unapplied", "total_paid",
+    "principal_due", "total_due",
+)
+
+
+def allocate_to_installment(schedule: PaymentSchedule, cents: int) -> dict:
+    """
+    Reparte un monto aplicado a una cuota: primero interés pendiente, luego
+    capital. Actualiza paid_interest/paid_principal de la cuota y devuelve
+    la asignación para el libro mayor.
+    """
+    interest_paid = to_cents(schedule.paid_interest)
+    interest_due = max(to_cents(schedule.interest_amount) - interest_paid, 0)
+    interest = min(cents, interest_due)
+    principal = cents - interest
+
+    schedule.paid_interest = from_cents(interest_paid + interest)
+    schedule.paid_principal = from_cents(to_cents(schedule.paid_principal) + principal)
+
+    return {
+        "schedule_id": schedule.id,
+        "installment_number": schedule.installment_number,
+        "principal": principal,
+        "interest": interest,
+    }
+
+
+def _as_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def post_payment_entries(db: Session, payment, allocations: list):
+    """
+    Registra en el libro mayor las asignaciones de un pago (solo INSERT).
+    Lo que no se aplicó a ninguna cuota queda como movimiento 'unapplied'.
+    """
+    # El pago debe existir antes de referenciarlo (la sesión no hace autoflush)
+    db.flush()
+    effective_date = _as_date(payment.payment_date)
+
+    entries = []
+    applied = 0
+    for allocation in allocations:
+        cents = allocation["principal"] + allocation["interest"]
+        applied += cents
+        entries.append({
+            "loan_id": payment.loan_id,
+            "payment_id": payment.id,
+            "schedule_id": allocation["schedule_id"],
+            "installment_number": allocation["installment_number"],
+            "entry_type": ALLOCATION,
+            "effective_date": effective_date,
+            "principal": from_cents(allocation["principal"]),
+            "interest": from_cents(allocation["interest"]),
+            "late_fee": from_cents(0),
+            "late_interest": from_cents(0),
+            "unapplied": from_cents(0),
+            "amount": from_cents(cents),
+        })
+
+    leftover = to_cents(payment.amount) - applied
+    if leftover:
+        entries.append({
+            "loan_id": payment.loan_id,
+            "payment_id": payment.id,
+            "schedule_id": None,
+            "installment_number": None,
+            "entry_type": UNAPPLIED,
+            "effective_date": effective_date,
+            "principal": from_cents(0),
+            "interest": from_cents(0),
+            "late_fee": from_cents(0),
+            "late_interest": from_cents(0),
+            "unapplied": from_cents(leftover),
+            "amount": from_cents(leftover),
+        })
+
+    if entries:
+        db.execute(insert(LedgerEntry), entries)
+
+
+def _charge_entry(loan: Loan, entry_type: str, effective_date: date, principal: int, interest: int, amount: int) -> dict:
+    return {
+        "loan_id": loan.id,
+        "payment_id": None,
+        "schedule_id": None,
+        "installment_number": None,
+        "entry_type": entry_type,
+        "effective_date": effective_date,
+        "principal": from_cents(principal),
+        "interest": from_cents(interest),
+        "late_fee": from_cents(0),
+        "late_interest": from_cents(0),
+        "unapplied": from_cents(0),
+        "amount": from_cents(amount),
+    }
+
+
+def post_disbursement_entry(db: Session, loan: Loan):
+    """Cargo de apertura del préstamo: capital, interés y total según sus condiciones."""
+    db.execute(insert(LedgerEntry), [_charge_entry(
+        loan, DISBURSEMENT, loan.disbursement_date,
+        to_cents(loan.principal_amount), to_cents(loan.total_interest), to_cents(loan.total_amount),
+    )])
+
+
+def post_capitalization_entry(db: Session, loan: Loan, effective_date: date, principal: int, interest: int, amount: int):
+    """
+    Cambio de lo adeudado al reprogramar (centavos, puede ser negativo en
+    interés y total). Se llama antes de cambiar las condiciones del préstamo:
+    si no tenía desembolso en el libro mayor (anterior a él) se registra
+    primero con las condiciones vigentes.
+    """
+    has_charges = db.execute(
+        select(LedgerEntry.id).where(LedgerEntry.loan_id == loan.id, LedgerEntry.entry_type.in_(LedgerEntry.CHARGE_TYPES)).limit(1)
+    ).first()
+    if not has_charges:
+        post_disbursement_entry(db, loan)
+    db.execute(insert(LedgerEntry), [_charge_entry(loan, CAPITALIZATION, effective_date, principal, interest, amount)])
+
+
+def _empty_totals() -> dict:
+    return {field: 0 for field in TOTAL_FIELDS}
+
+
+def _ledger_totals(db: Session, loan_ids: list, as_of: date, settled_before: datetime = None) -> dict:
+    """
+    Totales acumulados por préstamo hasta as_of: última foto con fecha <= as_of
+    más los movimientos que la foto no cubre. Dos consultas por lote.
+    Devuelve {loan_id: (totales en centavos, fecha de la foto, movimientos nuevos)}.
+    """
+    latest = (
+        select(LoanBalanceSnapshot.loan_id, func.max(LoanBalanceSnapshot.as_of_date).label("as_of_date"))
+        .where(LoanBalanceSnapshot.loan_id.in_(loan_ids), LoanBalanceSnapshot.as_of_date <= as_of)
+        .group_by(LoanBalanceSnapshot.loan_id)
+        .subquery()
+    )
+    snapshot = (
+        select(LoanBalanceSnapshot)
+        .join(latest, and_(
+            latest.c.loan_id == LoanBalanceSnapshot.loan_id,
+            latest.c.as_of_date == LoanBalanceSnapshot.as_of_date,
+        ))
+        .subquery()
+    )
+
+    results = {loan_id: (_empty_totals(), None, 0) for loan_id in loan_ids}
+    for row in db.execute(select(snapshot)).all():
+        totals = {field: to_cents(getattr(row, field)) for field in TOTAL_FIELDS}
+        results[row.loan_id] = (totals, row.as_of_date, 0)
+
+    # Movimientos posteriores a la foto, o anteriores pero registrados después de cerrarla
+    not_covered = or_(
+        snapshot.c.loan_id.is_(None),
+        LedgerEntry.effective_date > snapshot.c.as_of_date,
+        LedgerEntry.created_at >= snapshot.c.settled_before,
+    )
+    charge = LedgerEntry.entry_type.in_(LedgerEntry.CHARGE_TYPES)
+
+    def paid(column):
+        return func.sum(case((charge, 0), else_=column))
+
+    def due(column):
+        return func.sum(case((charge, column), else_=0))
+
+    query = (
+        select(
+            LedgerEntry.loan_id,
+            paid(LedgerEntry.principal).label("principal_paid"),
+            paid(LedgerEntry.interest).label("interest_paid"),
+            paid(LedgerEntry.late_fee).label("late_fee_paid"),
+            paid(LedgerEntry.late_interest).label("late_interest_paid"),
+            paid(LedgerEntry.unapplied).label("unapplied"),
+            paid(LedgerEntry.amount).label("total_paid"),
+            due(LedgerEntry.principal).label("principal_due"),
+            due(LedgerEntry.amount).label("total_due"),
+            func.count().label("entry_count"),
+        )
+        .outerjoin(snapshot, snapshot.c.loan_id == LedgerEntry.loan_id)
+        .where(LedgerEntry.loan_id.in_(loan_ids), LedgerEntry.effective_date <= as_of, not_covered)
+        .group_by(LedgerEntry.loan_id)
+    )
+    if settled_before is not None:
+        query = query.where(LedgerEntry.created_at < settled_before)
+
+    for row in db.execute(query).all():
+        totals, snapshot_date, _ = results[row.loan_id]
+        for field in TOTAL_FIELDS:
+            totals[field] += to_cents(getattr(row, field))
+        results[row.loan_id] = (totals, snapshot_date, row.entry_count)
+    return results
+
+
+def loan_balance(db: Session, loan: Loan, as_of: date = None) -> dict:
+    """
+    Saldo del préstamo a una fecha, calculado desde el libro mayor: lo
+    adeudado sale del desembolso y de los atrasos capitalizados hasta esa
+    fecha, no de las condiciones actuales del préstamo. Un préstamo anterior
+    al libro mayor sin reprogramaciones no tiene desembolso registrado: se
+    usan sus condiciones.
+    """
+    as_of = as_of or date.today()
+    totals, snapshot_date, _ = _ledger_totals(db, [loan.id], as_of)[loan.id]
+    if not totals["principal_due"] and not totals["total_due"] and loan.legacy_outstanding_balance is not None:
+        totals["principal_due"] = to_cents(loan.principal_amount)
+        totals["total_due"] = to_cents(loan.total_amount)
+    balance = {field: from_cents(cents) for field, cents in totals.items()}
+    balance.update({
+        "loan_id": loan.id,
+        "as_of": as_of,
+        "outstanding_principal": from_cents(totals["principal_due"] - totals["principal_paid"]),
+        "outstanding_balance": from_cents(totals["total_due"] - totals["total_paid"]),
+        "snapshot_date": snapshot_date,
+    })
+    return balance
+
+
+def check_ledger_projection(db: Session, batch_size: int = 1000) -> list:
+    """
+    Ids de préstamos cuyos pagos aprobados no suman lo mismo que los pagos
+    del libro mayor. Los saldos de loans ya salen del libro mayor; esto
+    verifica que cada pago aprobado haya quedado registrado en él (los
+    anteriores al libro mayor entran por el movimiento de apertura).
+    """
+    mismatched = []
+    last_id = None
+    while True:
+        query = select(Loan.id).order_by(Loan.id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(Loan.id > last_id)
+        loan_ids = db.execute(query).scalars().all()
+        if not loan_ids:
+            break
+        last_id = loan_ids[-1]
+
+        approved = dict(db.execute(
+            select(Payment.loan_id, func.sum(Payment.amount))
+            .where(Payment.loan_id.in_(loan_ids), Payment.status == 'approved')
+            .group_by(Payment.loan_id)
+        ).all())
+        totals = _ledger_totals(db, loan_ids, date.max)
+        for loan_id in loan_ids:
+            if to_cents(approved.get(loan_id) or 0) != totals[loan_id][0]["total_paid"]:
+                mismatched.append(loan_id)
+        if len(loan_ids) < batch_size:
+            break
+    return mismatched
+
+
+def _iter_ledger_loan_batches(db: Session, batch_size: int):
+    last_id = None
+    while True:
+        query = select(LedgerEntry.loan_id).distinct().order_by(LedgerEntry.loan_id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(LedgerEntry.loan_id > last_id)
+        loan_ids = db.execute(query).scalars().all()
+        if not loan_ids:
+            return
+        yield loan_ids
+        last_id = loan_ids[-1]
+
+
+def take_balance_snapshots(db: Session, as_of: date = None, batch_size: int = 1000) -> int:
+    """
+    Guarda una foto de saldos a as_of (por defecto ayer) para los préstamos
+    con movimientos nuevos desde su última foto. Devuelve cuántas se crearon.
+    """
+    as_of = as_of or date.today() - timedelta(days=1)
+    settled_before = datetime.utcnow() - timedelta(minutes=SNAPSHOT_SETTLE_MINUTES)
+    created = 0
+
+    for loan_ids in _iter_ledger_loan_batches(db, batch_size):
+        snapshots = []
+        for loan_id, (totals, snapshot_date, new_entries) in _ledger_totals(db, loan_ids, as_of, settled_before).items():
+            # Sin movimientos nuevos o con foto ya tomada para esa fecha
+            if not new_entries or snapshot_date == as_of:
+                continue
+            snapshots.append({
+                "loan_id": loan_id,
+                "as_of_date": as_of,
+                **{field: from_cents(cents) for field, cents in totals.items()},
+                "entry_count": new_entries,
+                "settled_before": settled_before,
+            })
+        if snapshots:
+            db.execute(insert(LoanBalanceSnapshot), snapshots)
+        db.commit()
+        created += len(snapshots)
+
+    print(f"Fotos de saldo a {as_of}: {created}")
+    return created
+
+
+def backfill_opening_entries(db: Session, batch_size: int = 1000) -> int:
+    """
+    Movimiento de apertura para préstamos con pagos anteriores al libro mayor:
+    capital e interés según las cuotas, el resto como no aplicado.
+    """
+    created = 0
+    last_id = None
+    while True:
+        query = (
+            select(Loan.id, Loan.legacy_paid_amount, Loan.last_payment_date, Loan.disbursement_date)
+            .where(Loan.legacy_paid_amount > 0, ~select(LedgerEntry.id).where(
+                LedgerEntry.loan_id == Loan.id, LedgerEntry.entry_type.notin_(LedgerEntry.CHARGE_TYPES)
+            ).exists())
+            .order_by(Loan.id)
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            query = query.where(Loan.id > last_id)
+        loans = db.execute(query).all()
+        if not loans:
+            break
+        last_id = loans[-1].id
+
+        paid = {
+            row.loan_id: (to_cents(row.principal), to_cents(row.interest))
+            for row in db.execute(
+                select(
+                    PaymentSchedule.loan_id,
+                    func.coalesce(func.sum(PaymentSchedule.paid_principal), 0).label("principal"),
+                    func.coalesce(func.sum(PaymentSchedule.paid_interest), 0).label("interest"),
+                )
+                .where(PaymentSchedule.loan_id.in_([loan.id for loan in loans]))
+                .group_by(PaymentSchedule.loan_id)
+            )
+        }
+
+        entries = []
+        for loan in loans:
+            principal, interest = paid.get(loan.id, (0, 0))
+            total = to_cents(loan.legacy_paid_amount)
+            entries.append({
+                "loan_id": loan.id,
+                "payment_id": None,
+                "schedule_id": None,
+                "installment_number": None,
+                "entry_type": OPENING,
+                "effective_date": loan.last_payment_date or loan.disbursement_date,
+                "principal": from_cents(principal),
+                "interest": from_cents(interest),
+                "late_fee": from_cents(0),
+                "late_interest": from_cents(0),
+                "unapplied": from_cents(total - principal - interest),
+                "amount": from_cents(total),
+            })
+        db.execute(insert(LedgerEntry), entries)
+        db.commit()
+        created += len(entries)
+
+        if len(loans) < batch_size:
+            break
+
+    print(f"Movimientos de apertura creados: {created}")
+    return created
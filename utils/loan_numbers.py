@@ -0,0 +1,69 @@
+import os
+import threading
+from datetime import date
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+
+from config.database import engine
+from models.models import LoanNumberCounter
+
+
+class LoanNumberAllocator:
+    """
+    Asigna números de préstamo legibles (PR-2026-000123) con reserva de
+    bloques tipo hi/lo: cada proceso reserva block_size números en una
+    transacción corta y propia sobre loan_number_counters, y los reparte en
+    memoria. La originación nunca bloquea la fila del contador.
+    """
+
+    def __init__(self, prefix: str = "PR", block_size: int = 50):
+        self.prefix = prefix
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks = {}
+
+    def reset(self):
+        # Tras un fork el hijo no debe reutilizar el bloque del padre
+        self._lock = threading.Lock()
+        self._blocks = {}
+
+    def _reserve_block(self, year: int):
+        for _ in range(3):
+            with engine.begin() as conn:
+                end = conn.execute(
+                    update(LoanNumberCounter)
+                    .where(LoanNumberCounter.year == year)
+                    .values(next_value=LoanNumberCounter.next_value + self.block_size)
+                    .returning(LoanNumberCounter.next_value)
+                ).scalar()
+            if end is not None:
+                return end - self.block_size, end
+
+            # Primer bloque del año
+            try:
+                with engine.begin() as conn:
+                    conn.execute(insert(LoanNumberCounter).values(year=year, next_value=1 + self.block_size))
+                return 1, 1 + self.block_size
+            except IntegrityError:
+                # Otro worker creó el contador al mismo tiempo: reintentar el UPDATE
+                continue
+        raise RuntimeError("No se pudo reservar un bloque de números de préstamo")
+
+    def next_number(self, year: int = None) -> str:
+        year = year or date.today().year
+        with self._lock:
+            current, end = self._blocks.get(year, (0, 0))
+            if current >= end:
+                current, end = self._reserve_block(year)
+            self._blocks[year] = (current + 1, end)
+        return f"{self.prefix}-{year}-{current:06d}"
+
+
+loan_number_allocator = LoanNumberAllocator(
+    prefix=os.getenv("LOAN_NUMBER_PREFIX", "PR"),
+    block_size=int(os.getenv("LOAN_NUMBER_BLOCK_SIZE", 50)),
+)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=loan_number_allocator.reset)
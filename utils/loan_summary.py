@@ -0,0 +1,195 @@
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import and_, case, func, inspect, select, text, update
+from sqlalchemy.orm import Session, noload
+
+from models.models import Loan, Payment, PaymentSchedule
+from utils.virtual_schedule import VIRTUAL, merged_schedule
+
+SUMMARY_FIELDS = ("next_due_date", "next_due_amount", "overdue_count", "overdue_amount", "last_payment_date")
+
+
+def _empty_summary() -> dict:
+    return {
+        "next_due_date": None,
+        "next_due_amount": None,
+        "overdue_count": 0,
+        "overdue_amount": Decimal("0.00"),
+        "last_payment_date": None,
+    }
+
+
+def compute_summaries(db: Session, loan_ids: list, today: date = None) -> dict:
+    """
+    Calcula el resumen de varios préstamos con tres consultas agregadas
+    (cuotas impagas, próxima cuota y último pago aprobado).
+    """
+    today = today or date.today()
+    summaries = {loan_id: _empty_summary() for loan_id in loan_ids}
+    if not loan_ids:
+        return summaries
+
+    unpaid = and_(PaymentSchedule.loan_id.in_(loan_ids), PaymentSchedule.status != 'paid')
+    pending_amount = PaymentSchedule.total_amount - func.coalesce(PaymentSchedule.paid_amount, 0)
+    is_overdue = PaymentSchedule.due_date < today
+
+    schedule_rows = db.execute(
+        select(
+            PaymentSchedule.loan_id,
+            func.min(PaymentSchedule.due_date).label("next_due_date"),
+            func.sum(case((is_overdue, 1), else_=0)).label("overdue_count"),
+            func.sum(case((is_overdue, pending_amount), else_=0)).label("overdue_amount"),
+        ).where(unpaid).group_by(PaymentSchedule.loan_id)
+    ).all()
+    for row in schedule_rows:
+        summary = summaries[row.loan_id]
+        summary["next_due_date"] = row.next_due_date
+        summary["overdue_count"] = int(row.overdue_count or 0)
+        summary["overdue_amount"] = Decimal(str(row.overdue_amount or 0)).quantize(Decimal("0.01"))
+
+    next_due = (
+        select(PaymentSchedule.loan_id, func.min(PaymentSchedule.due_date).label("due_date"))
+        .where(unpaid)
+        .group_by(PaymentSchedule.loan_id)
+        .subquery()
+    )
+    next_rows = db.execute(
+        select(PaymentSchedule.loan_id, func.sum(pending_amount).label("amount"))
+        .join(next_due, and_(
+            next_due.c.loan_id == PaymentSchedule.loan_id,
+            next_due.c.due_date == PaymentSchedule.due_date,
+        ))
+        .where(PaymentSchedule.status != 'paid')
+        .group_by(PaymentSchedule.loan_id)
+    ).all()
+    for row in next_rows:
+        summaries[row.loan_id]["next_due_amount"] = Decimal(str(row.amount or 0)).quantize(Decimal("0.01"))
+
+    payment_rows = db.execute(
+        select(Payment.loan_id, func.max(Payment.payment_date).label("last_payment_date"))
+        .where(Payment.loan_id.in_(loan_ids), Payment.status == 'approved')
+        .group_by(Payment.loan_id)
+    ).all()
+    for row in payment_rows:
+        summaries[row.loan_id]["last_payment_date"] = row.last_payment_date
+
+    # Los préstamos con cronograma virtual no tienen todas sus cuotas en la tabla
+    virtual_loans = db.execute(
+        select(Loan).options(noload(Loan.payment_schedule)).where(Loan.id.in_(loan_ids), Loan.schedule_mode == VIRTUAL)
+    ).scalars().all()
+    for loan in virtual_loans:
+        summaries[loan.id].update(_summary_from_installments(merged_schedule(db, loan), today))
+
+    return summaries
+
+
+def _pending(item) -> Decimal:
+    return Decimal(str(item.total_amount)) - Decimal(str(item.paid_amount or 0))
+
+
+def _summary_from_installments(installments: list, today: date) -> dict:
+    unpaid = [item for item in installments if item.status != 'paid']
+    overdue = [item for item in unpaid if item.due_date < today]
+
+    summary = {
+        "next_due_date": None,
+        "next_due_amount": None,
+        "overdue_count": len(overdue),
+        "overdue_amount": sum((_pending(item) for item in overdue), Decimal("0.00")).quantize(Decimal("0.01")),
+    }
+    if unpaid:
+        next_due_date = min(item.due_date for item in unpaid)
+        summary["next_due_date"] = next_due_date
+        summary["next_due_amount"] = sum(
+            (_pending(item) for item in unpaid if item.due_date == next_due_date), Decimal("0.00")
+        ).quantize(Decimal("0.01"))
+    return summary
+
+
+def refresh_loan_summary(db: Session, loan: Loan, today: date = None):
+    """Actualiza el resumen de un préstamo dentro de la transacción en curso."""
+    # La sesión no hace autoflush: los cambios del cronograma deben verse en la consulta
+    db.flush()
+    summary = compute_summaries(db, [loan.id], today)[loan.id]
+    for field, value in summary.items():
+        setattr(loan, field, value)
+
+
+def refresh_loan_summaries(db: Session, loan_ids: list, today: date = None):
+    """Recalcula y guarda el resumen de varios préstamos con un UPDATE por lotes."""
+    if not loan_ids:
+        return
+    summaries = compute_summaries(db, loan_ids, today)
+    db.execute(update(Loan), [{"id": loan_id, **summary} for loan_id, summary in summaries.items()])
+
+
+def add_summary_columns(db: Session) -> list:
+    """
+    Migración para bases creadas antes del resumen: create_all no altera
+    tablas existentes, así que se agregan con ALTER TABLE las columnas de
+    SUMMARY_FIELDS que falten en loans. Devuelve las sentencias ejecutadas;
+    después hay que reconstruir los resúmenes.
+    """
+    bind = db.get_bind()
+    table = Loan.__table__
+    existing = {column["name"] for column in inspect(bind).get_columns(table.name)}
+    statements = []
+    for field in SUMMARY_FIELDS:
+        column = table.c[field]
+        if column.name in existing:
+            continue
+        ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+        if column.default is not None:
+            ddl += f" DEFAULT {column.default.arg}"
+        db.execute(text(ddl))
+        statements.append(ddl)
+    db.commit()
+    return statements
+
+
+def _iter_loan_id_batches(db: Session, batch_size: int):
+    last_id = None
+    while True:
+        query = select(Loan.id).order_by(Loan.id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(Loan.id > last_id)
+        loan_ids = db.execute(query).scalars().all()
+        if not loan_ids:
+            return
+        yield loan_ids
+        last_id = loan_ids[-1]
+
+
+def rebuild_loan_summaries(db: Session, batch_size: int = 1000, today: date = None) -> int:
+    """Reconstruye el resumen de todos los préstamos."""
+    total = 0
+    for loan_ids in _iter_loan_id_batches(db, batch_size):
+        refresh_loan_summaries(db, loan_ids, today)
+        db.commit()
+        total += len(loan_ids)
+    return total
+
+
+def check_loan_summaries(db: Session, batch_size: int = 1000, today: date = None) -> list:
+    """Devuelve los ids de préstamos cuyo resumen guardado no coincide con el cronograma."""
+    mismatched = []
+    for loan_ids in _iter_loan_id_batches(db, batch_size):
+        stored = {
+            row.id: row
+            for row in db.execute(select(Loan.id, *[getattr(Loan, f) for f in SUMMARY_FIELDS]).where(Loan.id.in_(loan_ids)))
+        }
+        for loan_id, summary in compute_summaries(db, loan_ids, today).items():
+            row = stored[loan_id]
+            for field, expected in summary.items():
+                actual = getattr(row, field)
+                if field == "overdue_count":
+                    actual = actual or 0
+                elif field == "overdue_amount":
+                    actual = Decimal(str(actual or 0)).quantize(Decimal("0.01"))
+                elif field == "next_due_amount" and actual is not None:
+                    actual = Decimal(str(actual)).quantize(Decimal("0.01"))
+                if actual != expected:
+                    mismatched.append(loan_id)
+                    break
+    return mismatched
@@ -0,0 +1,47 @@
+from decimal import Decimal, ROUND_HALF_EVEN, ROUND_HALF_UP
+from typing import Optional
+
+# Políticas de redondeo explícitas.
+# HALF_EVEN es la que aplica round(Decimal, 2) en el cálculo histórico del cronograma.
+HALF_EVEN = ROUND_HALF_EVEN
+HALF_UP = ROUND_HALF_UP
+
+
+def to_cents(value, rounding: Optional[str] = None) -> int:
+    """
+    Convierte un monto (Decimal, str, int o float) a centavos enteros.
+    Un monto con fracciones de centavo se rechaza (ValueError) salvo que se
+    indique explícitamente cómo redondearlo.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, int):
+        return value * 100
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    numerator, denominator = value.as_integer_ratio()
+    if denominator == 1:
+        return numerator * 100
+    if rounding is None:
+        if 100 % denominator:
+            raise ValueError(f"El monto {value} tiene fracciones de centavo")
+        return numerator * (100 // denominator)
+    return div_round(numerator * 100, denominator, rounding)
+
+
+def from_cents(cents: int) -> Decimal:
+    """Centavos enteros a Decimal con 2 decimales (para el ORM y los esquemas)."""
+    return Decimal(cents).scaleb(-2)
+
+
+def div_round(numerator: int, denominator: int, rounding: str = HALF_EVEN) -> int:
+    """División entera con redondeo explícito (denominador positivo)."""
+    quotient, remainder = divmod(numerator, denominator)
+    twice = 2 * remainder
+    if twice < denominator:
+        return quotient
+    if twice > denominator:
+        return quotient + 1
+    if rounding == HALF_UP:
+        return quotient + 1 if numerator >= 0 else quotient
+    return quotient + (quotient & 1)
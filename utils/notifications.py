@@ -0,0 +1,344 @@
+import os
+import random
+import smtplib
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from email.message import EmailMessage
+
+import httpx
+from sqlalchemy import and_, exists, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from models.models import Customer, Loan, Notification, PaymentSchedule
+from utils.virtual_schedule import materialize_due_installments
+
+REMINDER_TYPE = "payment_reminder"
+OVERDUE_TYPE = "payment_overdue"
+
+OPEN_SCHEDULE_STATUSES = ("pending", "partial", "overdue")
+
+# Mensajes que conserva el backend local (los más recientes)
+LOCAL_OUTBOX_MAX = int(os.getenv("NOTIFICATIONS_LOCAL_OUTBOX", 1000))
+
+
+class NotificationsNotConfigured(RuntimeError):
+    pass
+
+
+# -----------------------------------------------------------
+# BACKENDS DE ENVÍO (SMTP / SMS / LOCAL)
+# -----------------------------------------------------------
+class NotificationBackend:
+    """Interfaz de un canal de envío. Recibe un lote y devuelve los ids enviados."""
+
+    def send_batch(self, messages: list) -> set:
+        raise NotImplementedError
+
+
+class SMTPBackend(NotificationBackend):
+    def __init__(self):
+        self.host = os.getenv("SMTP_HOST", "localhost")
+        self.port = int(os.getenv("SMTP_PORT", 587))
+        self.user = os.getenv("SMTP_USER")
+        self.password = os.getenv("SMTP_PASSWORD")
+        self.sender = os.getenv("SMTP_FROM", "no-reply@prestamos.local")
+
+    def send_batch(self, messages: list) -> set:
+        sent = set()
+        # Una sola conexión SMTP por lote
+        with smtplib.SMTP(self.host, self.port, timeout=30) as server:
+            server.starttls()
+            if self.user:
+                server.login(self.user, self.password)
+            for msg in messages:
+                if not msg["email"]:
+                    continue
+                email = EmailMessage()
+                email["From"] = self.sender
+                email["To"] = msg["email"]
+                email["Subject"] = msg["title"]
+                email.set_content(msg["message"])
+                server.send_message(email)
+                sent.add(msg["id"])
+        return sent
+
+
+class SMSBackend(NotificationBackend):
+    def __init__(self):
+        self.url = os.getenv("SMS_API_URL")
+        self.token = os.getenv("SMS_API_TOKEN")
+
+    def send_batch(self, messages: list) -> set:
+        payload = [
+            {"id": str(msg["id"]), "to": msg["phone"], "text": msg["message"]}
+            for msg in messages if msg["phone"]
+        ]
+        if not payload:
+            return set()
+        response = httpx.post(
+            self.url,
+            json={"messages": payload},
+            headers={"Authorization": f"Bearer {self.token}"},
+            timeout=30,
+        )
+        response.raise_for_status()
+        return {msg["id"] for msg in messages if msg["phone"]}
+
+
+class LocalBackend(NotificationBackend):
+    """
+    Reemplazo local para desarrollo y pruebas (NOTIFICATIONS_BACKEND=local):
+    no entrega nada, pero marca los mensajes como enviados. Guarda en
+    memoria solo los últimos LOCAL_OUTBOX_MAX.
+    """
+
+    def __init__(self, channel: str, max_outbox: int = LOCAL_OUTBOX_MAX):
+        self.channel = channel
+        self.outbox = deque(maxlen=max_outbox)
+
+    def send_batch(self, messages: list) -> set:
+        self.outbox.extend(messages)
+        print(f"[{self.channel}] {len(messages)} notificaciones enviadas (local)")
+        return {msg["id"] for msg in messages}
+
+
+def _default_backends() -> dict:
+    """
+    NOTIFICATIONS_BACKEND: 'smtp' (correo por SMTP y SMS por la API) o
+    'local'. Sin configurar no hay backends y el despacho falla.
+    """
+    name = os.getenv("NOTIFICATIONS_BACKEND")
+    if not name:
+        return {}
+    if name == "local":
+        return {"email": LocalBackend("email"), "sms": LocalBackend("sms")}
+    if name == "smtp":
+        return {"email": SMTPBackend(), "sms": SMSBackend()}
+    raise ValueError(f"NOTIFICATIONS_BACKEND no válido: {name} (use 'smtp' o 'local')")
+
+
+BACKENDS = _default_backends()
+
+
+def register_backend(channel: str, backend: NotificationBackend):
+    BACKENDS[channel] = backend
+
+
+# -----------------------------------------------------------
+# GENERACIÓN DE RECORDATORIOS (BASADA EN CONJUNTOS)
+# -----------------------------------------------------------
+def generate_payment_reminders(
+    db: Session,
+    days_ahead: int = 3,
+    batch_size: int = 5000,
+    today: date = None
+) -> int:
+    """
+    Crea recordatorios para cuotas por vencer y vencidas.
+    Recorre el cronograma por lotes (keyset sobre el id) e inserta con un
+    único INSERT multi-fila por lote, omitiendo cuotas ya notificadas.
+    Las cuotas de préstamos virtuales que entran en la ventana se guardan
+    antes: el aviso necesita una fila a la que referirse.
+    """
+    today = today or date.today()
+    limit_date = today + timedelta(days=days_ahead)
+    if materialize_due_installments(db, limit_date, today):
+        db.commit()
+
+    already_notified = exists().where(
+        Notification.schedule_id == PaymentSchedule.id,
+        or_(
+            and_(Notification.type == REMINDER_TYPE, PaymentSchedule.due_date >= today),
+            and_(Notification.type == OVERDUE_TYPE, PaymentSchedule.due_date < today),
+        )
+    )
+
+    query = (
+        select(
+            PaymentSchedule.id,
+            PaymentSchedule.loan_id,
+            PaymentSchedule.installment_number,
+            PaymentSchedule.due_date,
+            PaymentSchedule.total_amount,
+            PaymentSchedule.paid_amount,
+            Loan.customer_id,
+            Loan.loan_number,
+            Customer.email,
+            Customer.phone,
+        )
+        .join(Loan, Loan.id == PaymentSchedule.loan_id)
+        .join(Customer, Customer.id == Loan.customer_id)
+        .where(
+            PaymentSchedule.status.in_(OPEN_SCHEDULE_STATUSES),
+            PaymentSchedule.due_date <= limit_date,
+            Loan.status == "active",
+            Customer.is_active == True,
+            or_(Customer.email.isnot(None), Customer.phone.isnot(None)),
+            ~already_notified,
+        )
+        .order_by(PaymentSchedule.id)
+        .limit(batch_size)
+    )
+
+    created = 0
+    last_id = None
+    while True:
+        batch_query = query if last_id is None else query.where(PaymentSchedule.id > last_id)
+        rows = db.execute(batch_query).all()
+        if not rows:
+            break
+
+        values = [_reminder_values(row, today) for row in rows]
+        db.execute(insert(Notification), values)
+        db.commit()
+
+        created += len(values)
+        last_id = rows[-1].id
+        if len(rows) < batch_size:
+            break
+
+    print(f"Recordatorios generados: {created}")
+    return created
+
+
+def _reminder_values(row, today: date) -> dict:
+    pending = (row.total_amount or 0) - (row.paid_amount or 0)
+    loan_label = row.loan_number or str(row.loan_id)[:8]
+
+    if row.due_date < today:
+        notification_type = OVERDUE_TYPE
+        title = "Cuota vencida"
+        message = (
+            f"Tu cuota N° {row.installment_number} del préstamo {loan_label} "
+            f"venció el {row.due_date:%d/%m/%Y}. Monto pendiente: S/ {pending:.2f}"
+        )
+    else:
+        notification_type = REMINDER_TYPE
+        title = "Recordatorio de pago"
+        message = (
+            f"Tu cuota N° {row.installment_number} del préstamo {loan_label} "
+            f"vence el {row.due_date:%d/%m/%Y}. Monto: S/ {pending:.2f}"
+        )
+
+    return {
+        "customer_id": row.customer_id,
+        "loan_id": row.loan_id,
+        "schedule_id": row.id,
+        "type": notification_type,
+        "title": title,
+        "message": message,
+        "channel": "email" if row.email else "sms",
+        "status": "pending",
+    }
+
+
+# -----------------------------------------------------------
+# DESPACHO POR LOTES CON CONCURRENCIA Y REINTENTOS
+# -----------------------------------------------------------
+def _send_with_retry(backend: NotificationBackend, messages: list, max_retries: int, backoff: float) -> set:
+    for attempt in range(max_retries + 1):
+        try:
+            return backend.send_batch(messages)
+        except Exception as e:
+            if attempt == max_retries:
+                print(f"Error enviando lote de {len(messages)} notificaciones: {str(e)}")
+                return set()
+            # Backoff exponencial con jitter
+            time.sleep(backoff * (2 ** attempt) + random.uniform(0, backoff))
+    return set()
+
+
+def dispatch_pending_notifications(
+    db: Session,
+    batch_size: int = 500,
+    max_concurrency: int = 8,
+    max_retries: int = 3,
+    backoff: float = 0.5
+) -> dict:
+    """
+    Envía las notificaciones pendientes por canal. Cada lote de la base se
+    divide en sub-lotes que se envían en paralelo (limitado por max_concurrency)
+    y luego se actualizan los estados con un UPDATE por resultado.
+    """
+    if not BACKENDS:
+        raise NotificationsNotConfigured(
+            "No hay backend de notificaciones configurado: defina NOTIFICATIONS_BACKEND ('smtp' o 'local')"
+        )
+    totals = {"sent": 0, "failed": 0}
+    last_created = None
+    last_id = None
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        while True:
+            query = (
+                select(
+                    Notification.id,
+                    Notification.channel,
+                    Notification.title,
+                    Notification.message,
+                    Notification.created_at,
+                    Customer.email,
+                    Customer.phone,
+                )
+                .join(Customer, Customer.id == Notification.customer_id)
+                .where(Notification.status == "pending")
+                .order_by(Notification.created_at, Notification.id)
+                .limit(batch_size)
+            )
+            if last_id is not None:
+                query = query.where(or_(
+                    Notification.created_at > last_created,
+                    and_(Notification.created_at == last_created, Notification.id > last_id),
+                ))
+
+            rows = db.execute(query).all()
+            if not rows:
+                break
+            last_created, last_id = rows[-1].created_at, rows[-1].id
+
+            by_channel = {}
+            for row in rows:
+                by_channel.setdefault(row.channel, []).append(row._asdict())
+
+            futures = []
+            unknown_ids = []
+            chunk_size = max(1, batch_size // max_concurrency)
+            for channel, messages in by_channel.items():
+                backend = BACKENDS.get(channel)
+                if backend is None:
+                    unknown_ids.extend(msg["id"] for msg in messages)
+                    continue
+                for i in range(0, len(messages), chunk_size):
+                    chunk = messages[i:i + chunk_size]
+                    futures.append((chunk, executor.submit(_send_with_retry, backend, chunk, max_retries, backoff)))
+
+            sent_ids = []
+            failed_ids = list(unknown_ids)
+            for chunk, future in futures:
+                delivered = future.result()
+                for msg in chunk:
+                    (sent_ids if msg["id"] in delivered else failed_ids).append(msg["id"])
+
+            if sent_ids:
+                db.execute(
+                    update(Notification)
+                    .where(Notification.id.in_(sent_ids))
+                    .values(status="sent", sent_at=datetime.utcnow())
+                )
+            if failed_ids:
+                db.execute(
+                    update(Notification)
+                    .where(Notification.id.in_(failed_ids))
+                    .values(status="failed")
+                )
+            db.commit()
+
+            totals["sent"] += len(sent_ids)
+            totals["failed"] += len(failed_ids)
+            if len(rows) < batch_size:
+                break
+
+    print(f"Notificaciones enviadas: {totals['sent']}, fallidas: {totals['failed']}")
+    return totals
@@ -0,0 +1,62 @@
+import base64
+from datetime import datetime, time
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_, select, text, update
+from sqlalchemy.orm import Session
+
+from models.models import Payment
+
+
+def encode_cursor(created_at: datetime, row_id: UUID) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, row_id = raw.split("|")
+        return datetime.fromisoformat(created_at), UUID(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+
+
+def keyset_filter(created_at_column, id_column, cursor: str, descending: bool = False):
+    """Condición keyset sobre (created_at, id) a partir de un cursor opaco."""
+    created_at, row_id = decode_cursor(cursor)
+    if descending:
+        return or_(
+            created_at_column < created_at,
+            and_(created_at_column == created_at, id_column < row_id),
+        )
+    return or_(
+        created_at_column > created_at,
+        and_(created_at_column == created_at, id_column > row_id),
+    )
+
+
+def fill_missing_created_at(db: Session, batch_size: int = 1000) -> int:
+    """
+    Migración para bases anteriores a created_at NOT NULL en payments: una
+    fila sin created_at daría un cursor que keyset_filter no puede comparar.
+    Se completa con la fecha del pago (a las 00:00) y, en Postgres, se fija
+    la restricción.
+    """
+    filled = 0
+    while True:
+        rows = db.execute(
+            select(Payment.id, Payment.payment_date).where(Payment.created_at.is_(None)).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.execute(update(Payment), [
+            {"id": row.id, "created_at": datetime.combine(row.payment_date, time.min)} for row in rows
+        ])
+        db.commit()
+        filled += len(rows)
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("ALTER TABLE payments ALTER COLUMN created_at SET NOT NULL"))
+        db.commit()
+    return filled
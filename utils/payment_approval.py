@@ -0,0 +1,171 @@
+import os
+from collections import defaultdict
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models.models import Loan, Payment
+from utils.events import payment_event_data, publish_event
+from utils.ledger import allocate_to_installment, post_payment_entries
+from utils.loan_summary import refresh_loan_summary
+from utils.money import from_cents, to_cents
+from utils.virtual_schedule import find_installment, open_installments
+
+APPROVAL_BATCH_SIZE = int(os.getenv("APPROVAL_BATCH_SIZE", 200))
+
+APPROVED = "approved"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+def apply_payment(db: Session, loan: Loan, payment: Payment, schedules: list = None):
+    """
+    Aplica un pago pendiente a las cuotas del préstamo y lo marca aprobado.
+    `schedules` son las cuotas abiertas ya cargadas (se comparten entre los
+    pagos del mismo préstamo); si es None se consultan aquí.
+    """
+    allocations = []  # Asignaciones por cuota para el libro mayor
+    if payment.schedule_id:
+        schedule = next((item for item in schedules or () if item.id == payment.schedule_id), None)
+        if schedule is None:
+            schedule = find_installment(db, loan, payment.schedule_id)
+
+        if schedule:
+            allocations.append(allocate_to_installment(schedule, to_cents(payment.amount)))
+            schedule.paid_amount = schedule.total_amount
+            schedule.paid_principal = schedule.principal_amount
+            schedule.paid_interest = schedule.interest_amount
+            schedule.status = 'paid'
+            db.add(schedule)
+    else:
+        remaining_cents = to_cents(payment.amount)
+        if schedules is None:
+            schedules = open_installments(db, loan)
+
+        for schedule in schedules:
+            if remaining_cents <= 0:
+                break
+            if schedule.status == 'paid':
+                continue  # Cubierta por un pago anterior del mismo lote
+
+            total_cents = to_cents(schedule.total_amount)
+            paid_cents = to_cents(schedule.paid_amount)
+            cents_to_apply = min(remaining_cents, total_cents - paid_cents)
+
+            paid_cents += cents_to_apply
+            schedule.paid_amount = from_cents(paid_cents)
+            allocations.append(allocate_to_installment(schedule, cents_to_apply))
+            db.add(schedule)
+            if paid_cents >= total_cents - 1:
+                schedule.status = 'paid'
+            else:
+                schedule.status = 'partial'
+
+            remaining_cents -= cents_to_apply
+
+    # Solo INSERT en el libro mayor: paid_amount y outstanding_balance del
+    # préstamo se calculan desde él al leerlos
+    payment.status = 'approved'
+    post_payment_entries(db, payment, allocations)
+
+
+def claim_pending_payments(db: Session, limit: int, payment_ids: list = None, exclude_ids=None) -> list:
+    """
+    Toma pagos pendientes con FOR UPDATE SKIP LOCKED: los que ya reclamó otro
+    worker se saltan en lugar de esperar, así varios procesos vacían la cola
+    en paralelo sin tomar el mismo pago.
+    """
+    query = select(Payment).where(Payment.status == 'pending')
+    if payment_ids:
+        query = query.where(Payment.id.in_(payment_ids))
+    if exclude_ids:
+        query = query.where(Payment.id.notin_(exclude_ids))
+    query = query.order_by(Payment.created_at, Payment.id).limit(limit)
+    return db.execute(query.with_for_update(skip_locked=True, of=Payment)).scalars().all()
+
+
+def approve_payments(db: Session, payment_ids: list = None, limit: int = None, exclude_ids=None) -> list:
+    """
+    Aprueba en una transacción un lote de pagos pendientes (los indicados o
+    los más antiguos). Se agrupan por préstamo: cada préstamo se bloquea,
+    su cronograma se carga y su resumen se recalcula una sola vez. Un error
+    en un préstamo revierte solo sus pagos (SAVEPOINT). Devuelve el
+    resultado por pago.
+    """
+    limit = limit or (len(payment_ids) if payment_ids else APPROVAL_BATCH_SIZE)
+    payments = claim_pending_payments(db, limit, payment_ids, exclude_ids)
+
+    results = []
+    if payment_ids:
+        claimed = {payment.id for payment in payments}
+        results = [
+            {"payment_id": payment_id, "loan_id": None, "status": SKIPPED, "detail": "No está pendiente o lo procesa otro worker"}
+            for payment_id in dict.fromkeys(payment_ids) if payment_id not in claimed
+        ]
+    if not payments:
+        db.commit()
+        return results
+
+    by_loan = defaultdict(list)
+    for payment in payments:
+        by_loan[payment.loan_id].append(payment)
+
+    # Bloqueo de los préstamos en orden de id (sin interbloqueos entre workers);
+    # populate_existing: tras esperar un bloqueo se leen los montos ya confirmados
+    loans = {
+        loan.id: loan for loan in db.execute(
+            select(Loan).where(Loan.id.in_(list(by_loan))).order_by(Loan.id)
+            .with_for_update(of=Loan).execution_options(populate_existing=True)
+        ).unique().scalars()
+    }
+
+    approved = []
+    for loan_id, group in by_loan.items():
+        loan = loans.get(loan_id)
+        if loan is None:
+            results += [
+                {"payment_id": payment.id, "loan_id": loan_id, "status": FAILED, "detail": "Préstamo no encontrado"}
+                for payment in group
+            ]
+            continue
+        try:
+            with db.begin_nested():
+                schedules = open_installments(db, loan)
+                for payment in group:
+                    apply_payment(db, loan, payment, schedules)
+                refresh_loan_summary(db, loan)
+        except Exception as e:
+            print(f"Error al aprobar pagos del préstamo {loan_id}: {e}")
+            results += [
+                {"payment_id": payment.id, "loan_id": loan_id, "status": FAILED, "detail": str(e)}
+                for payment in group
+            ]
+            continue
+        approved += group
+        results += [
+            {"payment_id": payment.id, "loan_id": loan_id, "status": APPROVED, "detail": None}
+            for payment in group
+        ]
+
+    events = [payment_event_data(payment, loans[payment.loan_id].customer_id) for payment in approved]
+    db.commit()
+    for data in events:
+        publish_event("payments", "payment.approved", data)
+    return results
+
+
+def drain_pending_payments(db: Session, batch_size: int = None) -> dict:
+    """Modo worker: aprueba lotes de pendientes hasta vaciar la cola (o lo que dejen los demás workers)."""
+    batch_size = batch_size or APPROVAL_BATCH_SIZE
+    totals = {APPROVED: 0, FAILED: 0}
+    failed_ids = set()  # Siguen pendientes: no se vuelven a reclamar en esta corrida
+    while True:
+        results = approve_payments(db, limit=batch_size, exclude_ids=failed_ids)
+        for result in results:
+            totals[result["status"]] += 1
+            if result["status"] == FAILED:
+                failed_ids.add(result["payment_id"])
+        if len(results) < batch_size:
+            break
+    print(f"Pagos aprobados: {totals[APPROVED]}, fallidos: {totals[FAILED]}")
+    return totals
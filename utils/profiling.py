@@ -0,0 +1,254 @@
+import asyncio
+import inspect
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+
+from jose import JWTError, jwt
+from sqlalchemy import event
+
+from utils.security import ALGORITHM, SECRET_KEY
+
+# Desactivado: no se instala middleware, ni listeners SQL, ni envoltorios (costo cero)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# Fracción de peticiones perfiladas al azar (además de las pedidas por cabecera)
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL_MS", 5)) / 1000
+PROFILES_DIR = os.getenv("PROFILES_DIR", "profiles")
+PROFILES_MAX = int(os.getenv("PROFILES_MAX", 200))
+PROFILE_HEADER = "x-profile"
+
+_PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+current_profile: ContextVar = ContextVar("current_profile", default=None)
+
+
+class StackSampler(threading.Thread):
+    """
+    Perfilador por muestreo: cada `interval` segundos toma la pila de los
+    hilos registrados (sys._current_frames) y la cuenta en formato
+    "collapsed" (marco raíz;...;marco hoja). Solo corre mientras dura la
+    petición perfilada.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(daemon=True, name="profiler")
+        self.interval = interval
+        self.thread_ids = set()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def add_thread(self, thread_id: int):
+        self.thread_ids.add(thread_id)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[_collapse(frame)] += 1
+                    self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class ProfileSession:
+    def __init__(self, method: str, path: str, reason: str):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started_at = datetime.utcnow()
+        self.sampler = StackSampler(PROFILING_INTERVAL)
+        self.statements = []
+        self._start = time.perf_counter()
+
+    def start(self):
+        self.sampler.add_thread(threading.get_ident())
+        self.sampler.start()
+
+    def finish(self, status_code: int):
+        self.sampler.stop()
+        duration_ms = (time.perf_counter() - self._start) * 1000
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        meta = {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "reason": self.reason,
+            "status_code": status_code,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(duration_ms, 2),
+            "samples": self.sampler.samples,
+            "interval_ms": PROFILING_INTERVAL * 1000,
+            "sql_count": len(self.statements),
+            "sql_ms": round(sum(item["duration_ms"] for item in self.statements), 2),
+            "sql": self.statements,
+        }
+        with open(os.path.join(PROFILES_DIR, f"{self.id}.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+        with open(os.path.join(PROFILES_DIR, f"{self.id}.collapsed"), "w", encoding="utf-8") as f:
+            for stack, count in self.sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        _prune()
+        print(f"Perfil {self.id} guardado: {self.method} {self.path} {duration_ms:.1f} ms, {len(self.statements)} SQL")
+
+
+def _prune():
+    """Conserva solo los PROFILES_MAX perfiles más recientes."""
+    metas = sorted(
+        (name for name in os.listdir(PROFILES_DIR) if name.endswith(".json")),
+        key=lambda name: os.path.getmtime(os.path.join(PROFILES_DIR, name)),
+    )
+    for name in metas[:-PROFILES_MAX] if len(metas) > PROFILES_MAX else []:
+        for suffix in (".json", ".collapsed"):
+            path = os.path.join(PROFILES_DIR, name[:-5] + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _is_admin_request(request) -> bool:
+    authorization = request.headers.get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return False
+    try:
+        payload = jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    return payload.get("role") == "admin"
+
+
+def _profile_reason(request):
+    if request.headers.get(PROFILE_HEADER) and _is_admin_request(request):
+        return "header"
+    if PROFILING_SAMPLE_RATE and random.random() < PROFILING_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+# -----------------------------------------------------------
+# GANCHOS (solo se instalan con PROFILING_ENABLED)
+# -----------------------------------------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    session = current_profile.get()
+    if session is not None:
+        # Hilo del threadpool que atiende la petición: también se muestrea
+        session.sampler.add_thread(threading.get_ident())
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    session = current_profile.get()
+    if session is not None and conn.info.get("profile_start"):
+        start = conn.info["profile_start"].pop()
+        session.statements.append({
+            "statement": statement,
+            "executemany": executemany,
+            "rows": cursor.rowcount,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+        })
+
+
+def _wrap_endpoint(call):
+    """Registra el hilo del endpoint (los síncronos corren en el threadpool)."""
+    if getattr(call, "__profiled__", False):
+        return call
+
+    if inspect.iscoroutinefunction(call):
+        async def wrapper(*args, **kwargs):
+            session = current_profile.get()
+            if session is not None:
+                session.sampler.add_thread(threading.get_ident())
+            return await call(*args, **kwargs)
+    else:
+        def wrapper(*args, **kwargs):
+            session = current_profile.get()
+            if session is not None:
+                session.sampler.add_thread(threading.get_ident())
+            return call(*args, **kwargs)
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+def install_profiling(app, engine):
+    """Middleware, listeners SQL y envoltorio de endpoints; no hace nada si está desactivado."""
+    if not PROFILING_ENABLED:
+        return
+    from fastapi.routing import APIRoute
+
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            route.dependant.call = _wrap_endpoint(route.dependant.call)
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.middleware("http")
+    async def profiling_middleware(request, call_next):
+        reason = _profile_reason(request)
+        if reason is None:
+            return await call_next(request)
+        session = ProfileSession(request.method, request.url.path, reason)
+        token = current_profile.set(session)
+        session.start()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            response.headers["X-Profile-Id"] = session.id
+            return response
+        finally:
+            current_profile.reset(token)
+            # Detener el muestreador y escribir los archivos bloquea: fuera del loop
+            await asyncio.to_thread(session.finish, status_code)
+
+    print(f"Perfilado activo (muestreo {PROFILING_SAMPLE_RATE:.2%}, directorio {PROFILES_DIR})")
+
+
+# -----------------------------------------------------------
+# LECTURA DE PERFILES GUARDADOS
+# -----------------------------------------------------------
+def list_profiles(limit: int = 50) -> list:
+    if not os.path.isdir(PROFILES_DIR):
+        return []
+    names = sorted(
+        (name for name in os.listdir(PROFILES_DIR) if name.endswith(".json")),
+        key=lambda name: os.path.getmtime(os.path.join(PROFILES_DIR, name)),
+        reverse=True,
+    )[:limit]
+    profiles = []
+    for name in names:
+        with open(os.path.join(PROFILES_DIR, name), encoding="utf-8") as f:
+            meta = json.load(f)
+        meta.pop("sql", None)
+        profiles.append(meta)
+    return profiles
+
+
+def profile_path(profile_id: str, kind: str):
+    """Ruta del archivo del perfil ('json' o 'collapsed'), o None si no existe."""
+    if not _PROFILE_ID.match(profile_id) or kind not in ("json", "collapsed"):
+        return None
+    path = os.path.join(PROFILES_DIR, f"{profile_id}.{kind}")
+    return path if os.path.exists(path) else None
@@ -0,0 +1,56 @@
+import os
+
+from utils.amortization import FIXED_CAPITAL_METHODS, cached_amortization_factors, schedule_cents
+from utils.money import from_cents, to_cents
+
+# calculate_payment_schedule siempre amortiza con capital fijo (el alemán es el mismo método)
+QUOTE_METHODS = FIXED_CAPITAL_METHODS
+# Combinaciones tasa x plazo por llamada
+QUOTE_GRID_MAX = int(os.getenv("QUOTE_GRID_MAX", 400))
+
+
+class QuoteError(ValueError):
+    pass
+
+
+def quote(principal_amount, interest_rate, term_months: int, method: str = "fixed_capital", include_schedule: bool = False) -> dict:
+    """
+    Cotización de un préstamo sin tocar la base: primera y última cuota,
+    interés y total a pagar y, si se pide, el detalle por cuota. Los totales
+    son los mismos que guarda create_loan (principal + suma de intereses
+    redondeados): los factores de (tasa, plazo, método) salen de la caché y
+    solo se escalan por el monto.
+    """
+    if method not in QUOTE_METHODS:
+        raise QuoteError(f"Método de amortización no soportado: {method}")
+    amounts = schedule_cents(principal_amount, cached_amortization_factors(interest_rate, term_months, method))
+    total_interest = from_cents(sum(item[1] for item in amounts))
+    return {
+        "principal_amount": principal_amount,
+        "interest_rate": interest_rate,
+        "term_months": term_months,
+        "method": method,
+        "first_installment": from_cents(amounts[0][2]),
+        "last_installment": from_cents(amounts[-1][2]),
+        "total_interest": total_interest,
+        "total_amount": from_cents(to_cents(principal_amount) + to_cents(total_interest)),
+        "schedule": None if not include_schedule else [
+            {
+                "installment_number": number,
+                "principal_amount": from_cents(principal),
+                "interest_amount": from_cents(interest),
+                "total_amount": from_cents(total),
+                "remaining_balance": from_cents(remaining),
+            }
+            for number, (principal, interest, total, remaining) in enumerate(amounts, start=1)
+        ],
+    }
+
+
+def quote_grid(principal_amount, interest_rates: list, terms: list, method: str = "fixed_capital", include_schedule: bool = False) -> list:
+    """Cotizaciones de toda la grilla tasa x plazo en una llamada."""
+    rates = list(dict.fromkeys(interest_rates))
+    terms = list(dict.fromkeys(terms))
+    if len(rates) * len(terms) > QUOTE_GRID_MAX:
+        raise QuoteError(f"La grilla excede {QUOTE_GRID_MAX} combinaciones")
+    return [quote(principal_amount, rate, term, method, include_schedule) for rate in rates for term in terms]
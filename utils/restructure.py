@@ -0,0 +1,195 @@
+from datetime import date, datetime
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from models.models import Loan, Notification, Payment, PaymentSchedule, PaymentScheduleHistory
+from utils.amortization import calculate_payment_schedule
+from utils.ledger import post_capitalization_entry
+from utils.money import from_cents, to_cents
+from utils.virtual_schedule import STORED, installment_id, is_virtual, materialize_installments, merged_schedule
+
+HISTORY_COLUMNS = (
+    "loan_id", "installment_number", "due_date", "principal_amount", "interest_amount", "total_amount",
+    "remaining_balance", "paid_amount", "paid_principal", "paid_interest", "late_fee", "late_interest",
+    "status", "schedule_version",
+)
+
+
+class RestructureError(ValueError):
+    pass
+
+
+def _materialize(db: Session, loan: Loan):
+    """Guarda las cuotas derivadas de un préstamo virtual: tras reprogramar ya no se derivan de sus condiciones."""
+    materialize_installments(db, [item for item in merged_schedule(db, loan) if item not in db])
+    loan.schedule_mode = STORED
+
+
+def restructure_loan(
+    db: Session,
+    loan: Loan,
+    term_months: int,
+    interest_rate=None,
+    grace_months: int = 0,
+    capitalize_arrears: bool = False,
+    today: date = None,
+) -> dict:
+    """
+    Reprograma el saldo impago del préstamo sin tocar las cuotas pagadas.
+
+    Cuotas afectadas: las impagas que vencen desde hoy y, si se capitalizan
+    los atrasos, también las vencidas. Su capital pendiente (más interés y
+    cargos vencidos al capitalizar) es el nuevo capital, que se amortiza en
+    `term_months` cuotas a partir de la primera fecha afectada más la
+    gracia. Las filas afectadas se copian al historial y se reescriben en
+    un único UPDATE por lotes; si el nuevo plazo es más largo se insertan
+    las que faltan y si es más corto se borran las sobrantes (salvo que
+    tengan pagos asociados). Los atrasos capitalizados pasan a formar
+    parte del capital del préstamo.
+    """
+    today = today or date.today()
+    if is_virtual(loan):
+        _materialize(db, loan)
+        db.flush()
+
+    rows = db.execute(
+        select(PaymentSchedule).where(PaymentSchedule.loan_id == loan.id).order_by(PaymentSchedule.installment_number)
+    ).scalars().all()
+    unpaid = [row for row in rows if row.status != 'paid']
+    affected = [row for row in unpaid if capitalize_arrears or row.due_date >= today]
+    if not affected:
+        raise RestructureError("El préstamo no tiene cuotas pendientes para reprogramar")
+
+    base_cents = 0
+    capitalized_cents = 0
+    for row in affected:
+        base_cents += to_cents(row.principal_amount) - to_cents(row.paid_principal)
+        if row.due_date < today:
+            # Atrasos capitalizados: interés impago y cargos por mora
+            capitalized_cents += to_cents(row.interest_amount) - to_cents(row.paid_interest)
+            capitalized_cents += to_cents(row.late_fee) + to_cents(row.late_interest)
+    base_cents += capitalized_cents
+    if base_cents <= 0:
+        raise RestructureError("El saldo a reprogramar debe ser mayor a cero")
+
+    upcoming = [row.due_date for row in affected if row.due_date >= today]
+    first_due = upcoming[0] if upcoming else today + relativedelta(months=1)
+    first_due = first_due + relativedelta(months=grace_months)
+
+    terms = Loan(
+        principal_amount=from_cents(base_cents),
+        interest_rate=interest_rate if interest_rate is not None else loan.interest_rate,
+        term_months=term_months,
+        first_payment_date=first_due,
+    )
+    new_items = calculate_payment_schedule(terms)
+
+    # Las cuotas sobrantes se borran; no puede haber pagos que las referencien
+    dropped = [row.id for row in affected[len(new_items):]]
+    if dropped:
+        referenced = set(db.execute(
+            select(Payment.schedule_id).where(Payment.schedule_id.in_(dropped)).distinct()
+        ).scalars())
+        if referenced:
+            minimum = max(index for index, row in enumerate(affected, 1) if row.id in referenced)
+            raise RestructureError(
+                f"Hay pagos registrados en cuotas que se eliminarían; el plazo debe ser de al menos {minimum} cuotas"
+            )
+
+    old_version = loan.version or 1
+    new_version = old_version + 1
+    # Interés ya cobrado en cuotas afectadas: la reescritura pone sus pagos en cero
+    paid_interest_cents = sum(to_cents(row.paid_interest) for row in affected)
+
+    # 1. Versión anterior de las cuotas afectadas al historial (un INSERT por lotes)
+    superseded_at = datetime.utcnow()
+    db.execute(insert(PaymentScheduleHistory), [
+        {
+            "schedule_id": row.id,
+            **{column: getattr(row, column) for column in HISTORY_COLUMNS},
+            "schedule_version": row.schedule_version or old_version,
+            "superseded_by_version": new_version,
+            "superseded_at": superseded_at,
+        }
+        for row in affected
+    ])
+
+    # 2. Números de cuota: los de las filas afectadas y, si faltan, a continuación del último
+    numbers = [row.installment_number for row in affected]
+    last_number = rows[-1].installment_number
+    numbers += list(range(last_number + 1, last_number + 1 + len(new_items) - len(affected)))
+
+    values = []
+    for number, item in zip(numbers, new_items):
+        values.append({
+            "installment_number": number,
+            "due_date": item["due_date"],
+            "principal_amount": item["principal_amount"],
+            "interest_amount": item["interest_amount"],
+            "total_amount": item["total_amount"],
+            "remaining_balance": item["remaining_balance"],
+            "outstanding_amount": item["total_amount"],
+            "paid_amount": from_cents(0),
+            "paid_principal": from_cents(0),
+            "paid_interest": from_cents(0),
+            "late_fee": from_cents(0),
+            "late_interest": from_cents(0),
+            "days_overdue": 0,
+            "paid_date": None,
+            "status": 'pending',
+            "schedule_version": new_version,
+            "updated_at": datetime.utcnow(),
+        })
+
+    # 3. Reescritura de las filas afectadas en una sola sentencia (UPDATE por lotes por PK)
+    rewrites = [{"id": row.id, **value} for row, value in zip(affected, values)]
+    db.execute(update(PaymentSchedule), rewrites)
+
+    extra = values[len(affected):]
+    if extra:
+        db.execute(insert(PaymentSchedule), [
+            {"id": installment_id(loan.id, value["installment_number"]), "loan_id": loan.id, **value}
+            for value in extra
+        ])
+    if dropped:
+        # Los avisos de cuotas que dejan de existir ya no aplican
+        db.execute(delete(Notification).where(Notification.schedule_id.in_(dropped)), execution_options={"synchronize_session": False})
+        db.execute(delete(PaymentSchedule).where(PaymentSchedule.id.in_(dropped)), execution_options={"synchronize_session": False})
+    db.expire_all()
+
+    # 4. Totales del préstamo a partir del cronograma vigente
+    current = db.execute(
+        select(PaymentSchedule).where(PaymentSchedule.loan_id == loan.id).order_by(PaymentSchedule.installment_number)
+    ).scalars().all()
+    outstanding = sum(
+        to_cents(row.total_amount) - to_cents(row.paid_amount) for row in current if row.status != 'paid'
+    )
+    # paid_amount sale del libro mayor (db.expire_all lo vuelve a leer)
+    paid_cents = to_cents(loan.paid_amount)
+    total_interest = paid_interest_cents + sum(to_cents(row.interest_amount) for row in current)
+    total_amount = paid_cents + outstanding
+    # Lo que cambia lo adeudado va al libro mayor con la fecha de la reprogramación
+    post_capitalization_entry(
+        db, loan, today,
+        principal=capitalized_cents,
+        interest=total_interest - to_cents(loan.total_interest),
+        amount=total_amount - to_cents(loan.total_amount),
+    )
+    loan.principal_amount = from_cents(to_cents(loan.principal_amount) + capitalized_cents)
+    loan.total_interest = from_cents(total_interest)
+    loan.total_amount = from_cents(total_amount)
+    loan.interest_rate = terms.interest_rate
+    loan.term_months = len(current)
+    loan.maturity_date = max(row.due_date for row in current)
+    loan.version = new_version
+
+    return {
+        "version": new_version,
+        "restructured_principal": from_cents(base_cents),
+        "capitalized": from_cents(capitalized_cents),
+        "rewritten": len(rewrites),
+        "inserted": len(extra),
+        "deleted": len(dropped),
+    }
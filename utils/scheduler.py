@@ -0,0 +1,232 @@
+import asyncio
+import os
+import random
+import socket
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from config.database import SCHEDULER_CONNECTIONS, SessionLocal
+from models.models import JobRun, SchedulerLock
+from utils.archive import archive_closed_loans
+from utils.delinquency import update_overdue_installments
+from utils.ledger import take_balance_snapshots
+from utils.loan_summary import rebuild_loan_summaries
+from utils.notifications import BACKENDS, dispatch_pending_notifications, generate_payment_reminders
+
+
+class Job:
+    def __init__(self, name: str, func, interval: float, jitter: float = 30, max_runtime: float = 3600):
+        self.name = name
+        self.func = func  # func(db) -> resultado (se guarda como texto en el historial)
+        self.interval = interval
+        self.jitter = jitter
+        self.max_runtime = max_runtime
+        self.running = False
+        self.stats = {
+            "runs": 0,
+            "failures": 0,
+            "skipped_overrun": 0,
+            "last_status": None,
+            "last_started_at": None,
+            "last_duration_ms": None,
+            "avg_duration_ms": None,
+            "max_duration_ms": None,
+        }
+
+    def record(self, status: str, started_at: datetime, duration_ms: int):
+        stats = self.stats
+        stats["runs"] += 1
+        if status != "success":
+            stats["failures"] += 1
+        stats["last_status"] = status
+        stats["last_started_at"] = started_at
+        stats["last_duration_ms"] = duration_ms
+        previous = stats["avg_duration_ms"] or 0
+        stats["avg_duration_ms"] = previous + (duration_ms - previous) / stats["runs"]
+        stats["max_duration_ms"] = max(stats["max_duration_ms"] or 0, duration_ms)
+
+
+class Scheduler:
+    """
+    Tareas periódicas dentro de la app (asyncio). Todos los workers tienen
+    el planificador activo, pero cada ejecución se reclama con un UPDATE
+    condicional sobre scheduler_locks: solo el worker que lo logra la corre
+    y deja fijada la siguiente, así cada tarea se ejecuta una vez en todo
+    el clúster. El reclamo es un arriendo (locked_until) que cubre la
+    duración máxima de la tarea para evitar ejecuciones solapadas.
+    """
+
+    def __init__(self, poll_interval: float = 30):
+        self.poll_interval = poll_interval
+        self.jobs = {}
+        self.tasks = []
+        self.owner = None
+        self.slots = None
+
+    def add_job(self, name: str, func, interval: float, jitter: float = 30, max_runtime: float = 3600) -> Job:
+        job = Job(name, func, interval, jitter, max_runtime)
+        self.jobs[name] = job
+        return job
+
+    async def start(self):
+        # Se calcula al arrancar (ya dentro del worker, después del fork)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.slots = asyncio.Semaphore(SCHEDULER_CONNECTIONS)
+        self.tasks = [asyncio.create_task(self._loop(job)) for job in self.jobs.values()]
+        print(f"Planificador iniciado ({self.owner}): {', '.join(self.jobs)}")
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def _loop(self, job: Job):
+        while True:
+            # El jitter reparte los intentos de los workers y evita picos a la misma hora
+            await asyncio.sleep(self.poll_interval + random.uniform(0, job.jitter))
+            if job.running:
+                # La ejecución anterior en este worker sigue en curso
+                job.stats["skipped_overrun"] += 1
+                continue
+            try:
+                # Tope de tareas simultáneas: es lo que config/database.py reserva del pool
+                async with self.slots:
+                    if await asyncio.to_thread(self._claim, job):
+                        job.running = True
+                        try:
+                            await asyncio.to_thread(self._run, job)
+                        finally:
+                            job.running = False
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error en planificador ({job.name}): {e}")
+
+    def _claim(self, job: Job) -> bool:
+        """True si este worker ganó la ejecución que corresponde ahora."""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            claim = (
+                update(SchedulerLock)
+                .where(
+                    SchedulerLock.job_name == job.name,
+                    SchedulerLock.next_run_at <= now,
+                    or_(SchedulerLock.locked_until.is_(None), SchedulerLock.locked_until < now),
+                )
+                .values(
+                    owner=self.owner,
+                    locked_until=now + timedelta(seconds=job.max_runtime),
+                    next_run_at=now + timedelta(seconds=job.interval),
+                    updated_at=now,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            claimed = db.execute(claim).rowcount == 1
+            if not claimed and db.get(SchedulerLock, job.name) is None:
+                # Primera vez que se ve la tarea: se crea su fila y se reintenta
+                try:
+                    db.execute(insert(SchedulerLock).values(job_name=job.name, next_run_at=now, updated_at=now))
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+                claimed = db.execute(claim).rowcount == 1
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def _run(self, job: Job):
+        db = SessionLocal()
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        run_id = uuid.uuid4()
+        status, result, error = "success", None, None
+        try:
+            db.execute(insert(JobRun).values(id=run_id, job_name=job.name, owner=self.owner, status="running", started_at=started_at))
+            db.commit()
+            result = job.func(db)
+        except Exception as e:
+            db.rollback()
+            status, error = "failed", traceback.format_exc()
+            print(f"Tarea {job.name} falló: {e}")
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        job.record(status, started_at, duration_ms)
+        try:
+            db.execute(
+                update(JobRun).where(JobRun.id == run_id).values(
+                    status=status,
+                    finished_at=datetime.utcnow(),
+                    duration_ms=duration_ms,
+                    result=None if result is None else str(result),
+                    error=error,
+                )
+            )
+            # Libera el arriendo; la siguiente ejecución ya quedó fijada al reclamar
+            db.execute(
+                update(SchedulerLock)
+                .where(SchedulerLock.job_name == job.name, SchedulerLock.owner == self.owner)
+                .values(locked_until=None, updated_at=datetime.utcnow())
+            )
+            db.commit()
+        finally:
+            db.close()
+        print(f"Tarea {job.name}: {status} en {duration_ms} ms")
+
+    def metrics(self) -> dict:
+        """Métricas de las ejecuciones hechas por este worker."""
+        return {name: dict(job.stats, running=job.running) for name, job in self.jobs.items()}
+
+
+def job_history(db, since: datetime = None) -> dict:
+    """Métricas de duración de todo el clúster a partir del historial de ejecuciones."""
+    since = since or datetime.utcnow() - timedelta(days=7)
+    rows = db.execute(
+        select(
+            JobRun.job_name,
+            func.count().label("runs"),
+            func.sum(case((JobRun.status == "failed", 1), else_=0)).label("failures"),
+            func.avg(JobRun.duration_ms).label("avg_duration_ms"),
+            func.max(JobRun.duration_ms).label("max_duration_ms"),
+            func.max(JobRun.started_at).label("last_started_at"),
+        )
+        .where(JobRun.started_at >= since)
+        .group_by(JobRun.job_name)
+    ).all()
+    return {
+        row.job_name: {
+            "runs": row.runs,
+            "failures": int(row.failures or 0),
+            "avg_duration_ms": float(row.avg_duration_ms) if row.avg_duration_ms is not None else None,
+            "max_duration_ms": row.max_duration_ms,
+            "last_started_at": row.last_started_at,
+        }
+        for row in rows
+    }
+
+
+# -----------------------------------------------------------
+# TAREAS DE LA APLICACIÓN
+# -----------------------------------------------------------
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Se activa explícitamente en el despliegue que deba correr las tareas
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "false").lower() == "true"
+
+scheduler = Scheduler(poll_interval=float(os.getenv("SCHEDULER_POLL_INTERVAL", 30)))
+scheduler.add_job("overdue_installments", update_overdue_installments, interval=HOUR, jitter=60)
+scheduler.add_job("payment_reminders", lambda db: generate_payment_reminders(db, days_ahead=3), interval=DAY, jitter=300)
+if BACKENDS:
+    # Sin backend configurado los avisos quedan pendientes hasta que haya uno
+    scheduler.add_job("notification_dispatch", dispatch_pending_notifications, interval=300, jitter=30, max_runtime=900)
+scheduler.add_job("ledger_snapshots", take_balance_snapshots, interval=DAY, jitter=300)
+# Refresco completo de los resúmenes guardados en loans (caché de lectura)
+scheduler.add_job("loan_summaries", rebuild_loan_summaries, interval=DAY, jitter=600, max_runtime=2 * HOUR)
+scheduler.add_job("loan_archival", archive_closed_loans, interval=DAY, jitter=600, max_runtime=2 * HOUR)
@@ -15,6 +15,7 @@ from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 from config.database import get_db
 from models.models import User, Customer
+from utils.audit import set_current_user_id
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 load_dotenv()
@@ -22,6 +23,8 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 1440))
+PASSWORD_SETUP_EXPIRE_HOURS = int(os.getenv("PASSWORD_SETUP_EXPIRE_HOURS", 72))
+PASSWORD_SETUP_PURPOSE = "password_setup"
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
@@ -39,6 +42,24 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_password_setup_token(customer_id) -> str:
+    """Token firmado para que un cliente importado defina su contraseña (sin hash en la importación)."""
+    expire = datetime.utcnow() + timedelta(hours=PASSWORD_SETUP_EXPIRE_HOURS)
+    return jwt.encode(
+        {"sub": str(customer_id), "purpose": PASSWORD_SETUP_PURPOSE, "exp": expire},
+        SECRET_KEY, algorithm=ALGORITHM
+    )
+
+def verify_password_setup_token(token: str) -> Optional[str]:
+    """Id del cliente del token de definición de contraseña, o None si no es válido."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("purpose") != PASSWORD_SETUP_PURPOSE:
+        return None
+    return payload.get("sub")
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     from models.models import User
     
@@ -51,7 +72,8 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
-        if email is None:
+        # Los tokens de un solo propósito (definir contraseña) no autentican
+        if email is None or payload.get("purpose"):
             raise credentials_exception
     except JWTError:
         raise credentials_exception
@@ -59,6 +81,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user = db.query(User).filter(User.email == email).first()
     if user is None:
         raise credentials_exception
+    set_current_user_id(user.id)
     return user
 
 def get_current_customer(
@@ -76,7 +99,7 @@ def get_current_customer(
         email: str = payload.get("sub")
         role: str = payload.get("role")
         
-        if email is None or role != "customer":
+        if email is None or role != "customer" or payload.get("purpose"):
             raise credentials_exception
     except JWTError:
         raise credentials_exception
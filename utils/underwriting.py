@@ -0,0 +1,185 @@
+import os
+from decimal import Decimal
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from models.models import Customer, Loan
+from utils.events import publish_event
+
+ACTIVE_STATUSES = ("active", "approved")
+
+
+class UnderwritingRules:
+    """Reglas configurables por variables de entorno."""
+
+    def __init__(self):
+        self.max_dti = float(os.getenv("UW_MAX_DTI", 40))
+        self.review_dti = float(os.getenv("UW_REVIEW_DTI", 35))
+        self.min_credit_score = int(os.getenv("UW_MIN_CREDIT_SCORE", 500))
+        self.review_credit_score = int(os.getenv("UW_REVIEW_CREDIT_SCORE", 600))
+        # Exposición total (saldo vigente + nuevo capital) frente al ingreso mensual
+        self.max_exposure_income_ratio = float(os.getenv("UW_MAX_EXPOSURE_INCOME_RATIO", 24))
+
+
+def first_installment(principal: float, annual_rate: float, term: int, method: str):
+    """
+    Cuota más alta de una solicitud (None si el plazo no es válido).
+    Capital fijo / alemán: P/n + P*i (la primera cuota es la mayor).
+    Francés: P*i / (1 - (1+i)^-n). Americano: P*i (el capital va al final).
+    """
+    monthly_rate = annual_rate / 100 / 12
+    if not term or term <= 0:
+        return None
+    if method == "french":
+        if monthly_rate == 0:
+            return principal / term
+        return principal * monthly_rate / (1 - (1 + monthly_rate) ** -term)
+    if method == "american":
+        return principal * monthly_rate
+    return principal / term + principal * monthly_rate
+
+
+def _load_pending(db: Session, last_id, batch_size: int) -> list:
+    query = (
+        select(
+            Loan.id,
+            Loan.customer_id,
+            Loan.loan_number,
+            Loan.principal_amount,
+            Loan.interest_rate,
+            Loan.term_months,
+            Loan.amortization_method,
+            Loan.notes,
+            Customer.monthly_income,
+            Customer.credit_score,
+        )
+        .join(Customer, Customer.id == Loan.customer_id)
+        .where(Loan.status == "pending")
+        .order_by(Loan.id)
+        .limit(batch_size)
+    )
+    if last_id is not None:
+        query = query.where(Loan.id > last_id)
+    return db.execute(query).all()
+
+
+def _load_exposure(db: Session, customer_ids: set) -> dict:
+    """
+    Saldo vigente y obligación mensual actual por cliente en una sola
+    consulta. Los aprobados aún sin desembolsar no tienen saldo: cuentan por
+    su total (o su capital si tampoco tiene total).
+    """
+    owed = func.coalesce(Loan.outstanding_balance, Loan.total_amount, Loan.principal_amount)
+    rows = db.execute(
+        select(
+            Loan.customer_id,
+            func.coalesce(func.sum(owed), 0).label("outstanding"),
+            func.coalesce(
+                func.sum(func.coalesce(Loan.total_amount, Loan.principal_amount) / func.nullif(Loan.term_months, 0)), 0
+            ).label("monthly"),
+        )
+        .where(Loan.customer_id.in_(customer_ids), Loan.status.in_(ACTIVE_STATUSES))
+        .group_by(Loan.customer_id)
+    ).all()
+    return {row.customer_id: (float(row.outstanding), float(row.monthly)) for row in rows}
+
+
+def _decide(rules: UnderwritingRules, income: float, score, dti: float, exposure_ratio: float):
+    if not income or income <= 0:
+        return "review", "Sin ingreso mensual registrado"
+    if score is not None and score < rules.min_credit_score:
+        return "rejected", f"Score crediticio {score} menor a {rules.min_credit_score}"
+    if dti > rules.max_dti:
+        return "rejected", f"DTI {dti:.2f}% mayor a {rules.max_dti:.2f}%"
+    if exposure_ratio > rules.max_exposure_income_ratio:
+        return "rejected", f"Exposición de {exposure_ratio:.1f} ingresos mensuales"
+    if score is None or score < rules.review_credit_score or dti > rules.review_dti:
+        return "review", f"DTI {dti:.2f}% / score {score}: requiere revisión"
+    return "approved", f"DTI {dti:.2f}%"
+
+
+def _invalid_request(row, reason: str) -> dict:
+    note = f"[Evaluación automática] {reason}"
+    return {
+        "id": row.id,
+        "status": "review",
+        "dti_ratio": None,
+        "notes": f"{row.notes}\n{note}" if row.notes else note,
+    }
+
+
+def underwrite_pending_loans(db: Session, rules: UnderwritingRules = None, batch_size: int = 2000) -> dict:
+    """
+    Evalúa todas las solicitudes pendientes del portal por lotes: dos
+    consultas por lote (solicitudes + exposición) y un UPDATE por lotes con
+    las decisiones. La evaluación es un bucle en Python, una solicitud por
+    vez: las aprobaciones van sumando a la exposición del cliente dentro
+    del mismo lote, así que las filas no son independientes. Una solicitud
+    con datos inválidos queda en revisión sin frenar al resto del lote.
+
+    Cada decisión queda en la auditoría (el UPDATE por lotes se audita fila
+    por fila) y, tras confirmar, se publica loan.status_changed por
+    préstamo.
+    """
+    rules = rules or UnderwritingRules()
+    totals = {"approved": 0, "rejected": 0, "review": 0}
+    last_id = None
+
+    while True:
+        rows = _load_pending(db, last_id, batch_size)
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        exposure = _load_exposure(db, {row.customer_id for row in rows})
+
+        updates = []
+        for row in rows:
+            principal = float(row.principal_amount)
+            installment = first_installment(principal, float(row.interest_rate), row.term_months, row.amortization_method)
+            outstanding, monthly = exposure.get(row.customer_id, (0.0, 0.0))
+            income = float(row.monthly_income or 0)
+            if installment is None:
+                updates.append(_invalid_request(row, f"Plazo inválido: {row.term_months} meses"))
+                totals["review"] += 1
+                continue
+            try:
+                dti = (monthly + installment) / income * 100 if income > 0 else 0.0
+                exposure_ratio = (outstanding + principal) / income if income > 0 else 0.0
+                decision, reason = _decide(rules, income, row.credit_score, dti, exposure_ratio)
+            except (ArithmeticError, ValueError) as e:
+                updates.append(_invalid_request(row, f"Error al evaluar: {str(e)}"))
+                totals["review"] += 1
+                continue
+            if decision == "approved":
+                # Las aprobaciones del mismo lote suman a la exposición del cliente
+                exposure[row.customer_id] = (outstanding + principal, monthly + installment)
+
+            note = f"[Evaluación automática] {reason}"
+            updates.append({
+                "id": row.id,
+                "status": decision,
+                "dti_ratio": Decimal(str(round(min(dti, 999.99), 2))) if income > 0 else None,
+                "notes": f"{row.notes}\n{note}" if row.notes else note,
+            })
+            totals[decision] += 1
+
+        db.execute(update(Loan), updates)
+        db.commit()
+        for row, decision in zip(rows, updates):
+            publish_event("loans", "loan.status_changed", {
+                "id": row.id,
+                "customer_id": row.customer_id,
+                "loan_number": row.loan_number,
+                "previous_status": "pending",
+                "status": decision["status"],
+            })
+
+        if len(rows) < batch_size:
+            break
+
+    print(f"Evaluación de solicitudes: {totals}")
+    if any(totals.values()):
+        publish_event("loans", "loan.underwriting_completed", totals)
+    return totals
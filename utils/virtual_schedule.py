@@ -0,0 +1,194 @@
+import os
+import uuid
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, noload
+
+from models.models import Loan, PaymentSchedule
+from schemas.schemas import LoanWithSchedule, PaymentScheduleResponse
+from utils.amortization import calculate_payment_schedule
+
+STORED = "stored"
+VIRTUAL = "virtual"
+
+# Modo para los préstamos nuevos: 'stored' guarda todas las cuotas al originar,
+# 'virtual' solo guarda las cuotas con pagos, cargos o ediciones.
+DEFAULT_SCHEDULE_MODE = os.getenv("SCHEDULE_STORAGE_MODE", STORED)
+
+
+def installment_id(loan_id: uuid.UUID, installment_number: int) -> uuid.UUID:
+    """Id determinista de una cuota: es el mismo derivada o ya persistida."""
+    return uuid.uuid5(loan_id, str(installment_number))
+
+
+def is_virtual(loan: Loan) -> bool:
+    return loan.schedule_mode == VIRTUAL
+
+
+def derive_installments(loan: Loan, today: date = None) -> list:
+    """Cuotas calculadas a partir de las condiciones del préstamo (sin persistir)."""
+    today = today or date.today()
+    installments = []
+    for item in calculate_payment_schedule(loan):
+        installments.append(PaymentSchedule(
+            id=installment_id(loan.id, item['installment_number']),
+            loan_id=loan.id,
+            installment_number=item['installment_number'],
+            due_date=item['due_date'],
+            principal_amount=item['principal_amount'],
+            interest_amount=item['interest_amount'],
+            total_amount=item['total_amount'],
+            remaining_balance=item['remaining_balance'],
+            outstanding_amount=item['total_amount'],
+            paid_amount=Decimal('0.00'),
+            paid_principal=Decimal('0.00'),
+            paid_interest=Decimal('0.00'),
+            late_fee=Decimal('0.00'),
+            late_interest=Decimal('0.00'),
+            days_overdue=max((today - item['due_date']).days, 0),
+            schedule_version=1,
+            status='pending'
+        ))
+    return installments
+
+
+def merged_schedule(db: Session, loan: Loan) -> list:
+    """
+    Cronograma completo: cuotas persistidas más las derivadas que no tienen
+    fila propia. Las derivadas son objetos transitorios; si se modifican hay
+    que agregarlas a la sesión (db.add) para que se guarden.
+    """
+    persisted = db.query(PaymentSchedule).filter(
+        PaymentSchedule.loan_id == loan.id
+    ).order_by(PaymentSchedule.installment_number).all()
+    if not is_virtual(loan):
+        return persisted
+
+    overrides = {item.installment_number: item for item in persisted}
+    return [
+        overrides.get(item.installment_number, item)
+        for item in derive_installments(loan)
+    ]
+
+
+def open_installments(db: Session, loan: Loan) -> list:
+    """Cuotas pendientes o parciales en orden, como las usa la aplicación de pagos."""
+    if not is_virtual(loan):
+        return db.query(PaymentSchedule).filter(
+            PaymentSchedule.loan_id == loan.id,
+            PaymentSchedule.status.in_(['pending', 'partial'])
+        ).order_by(PaymentSchedule.installment_number).all()
+    return [item for item in merged_schedule(db, loan) if item.status in ('pending', 'partial')]
+
+
+def find_installment(db: Session, loan: Loan, schedule_id: uuid.UUID):
+    schedule = db.query(PaymentSchedule).filter(
+        PaymentSchedule.id == schedule_id,
+        PaymentSchedule.loan_id == loan.id
+    ).first()
+    if schedule or not is_virtual(loan):
+        return schedule
+    for item in derive_installments(loan):
+        if item.id == schedule_id:
+            return item
+    return None
+
+
+INSTALLMENT_COLUMNS = (
+    "id", "loan_id", "installment_number", "due_date", "principal_amount", "interest_amount",
+    "total_amount", "remaining_balance", "outstanding_amount", "paid_amount", "paid_principal",
+    "paid_interest", "late_fee", "late_interest", "days_overdue", "schedule_version", "status",
+)
+
+
+def materialize_installments(db: Session, items: list):
+    """Guarda cuotas derivadas con un único INSERT por lotes."""
+    if items:
+        db.execute(insert(PaymentSchedule), [
+            {column: getattr(item, column) for column in INSTALLMENT_COLUMNS} for item in items
+        ])
+
+
+def materialize_due_installments(db: Session, until: date, today: date = None, batch_size: int = 500) -> int:
+    """
+    Guarda las cuotas derivadas de los préstamos virtuales activos que
+    vencen hasta `until` y aún no tienen fila. Desde que vencen tienen mora
+    y avisos propios, y los procesos por lotes (mora, recordatorios)
+    trabajan sobre el cronograma guardado. No confirma la transacción.
+    """
+    created = 0
+    last_id = None
+    while True:
+        query = (
+            select(Loan).options(noload(Loan.payment_schedule))
+            .where(Loan.schedule_mode == VIRTUAL, Loan.status == 'active', Loan.first_payment_date <= until)
+            .order_by(Loan.id)
+            .limit(batch_size)
+        )
+        if last_id is not None:
+            query = query.where(Loan.id > last_id)
+        loans = db.execute(query).scalars().all()
+        if not loans:
+            break
+        last_id = loans[-1].id
+
+        persisted = set(db.execute(
+            select(PaymentSchedule.loan_id, PaymentSchedule.installment_number)
+            .where(PaymentSchedule.loan_id.in_([loan.id for loan in loans]))
+        ).all())
+        missing = [
+            item
+            for loan in loans
+            for item in derive_installments(loan, today)
+            if item.due_date <= until and (loan.id, item.installment_number) not in persisted
+        ]
+        materialize_installments(db, missing)
+        created += len(missing)
+        if len(loans) < batch_size:
+            break
+    return created
+
+
+def loan_with_schedule(db: Session, loan: Loan):
+    """Respuesta LoanWithSchedule; en modo virtual incluye las cuotas derivadas."""
+    if not is_virtual(loan):
+        return loan
+    response = LoanWithSchedule.model_validate(loan)
+    response.payment_schedule = [
+        PaymentScheduleResponse.model_validate(item) for item in merged_schedule(db, loan)
+    ]
+    return response
+
+
+def merge_schedule_rows(db: Session, loans: list, schedules: dict, pending_only: bool = False) -> dict:
+    """
+    Completa con cuotas derivadas los cronogramas (dicts planos de la ruta
+    rápida) de los préstamos virtuales. Una consulta para sus condiciones.
+    """
+    loan_ids = [loan["id"] for loan in loans]
+    if not loan_ids:
+        return schedules
+
+    virtual_loans = db.execute(
+        select(Loan).options(noload(Loan.payment_schedule)).where(Loan.id.in_(loan_ids), Loan.schedule_mode == VIRTUAL)
+    ).scalars().all()
+    for loan in virtual_loans:
+        overrides = {item["installment_number"]: item for item in schedules.get(loan.id, [])}
+        schedules[loan.id] = [
+            overrides.get(item.installment_number) or {
+                "id": item.id,
+                "installment_number": item.installment_number,
+                "due_date": item.due_date,
+                "principal_amount": item.principal_amount,
+                "interest_amount": item.interest_amount,
+                "total_amount": item.total_amount,
+                "remaining_balance": item.remaining_balance,
+                "status": item.status,
+            }
+            for item in derive_installments(loan)
+        ]
+        if pending_only:
+            schedules[loan.id] = [item for item in schedules[loan.id] if item["status"] in ('pending', 'partial')]
+    return schedules